@@ -1,22 +1,52 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, session, send_from_directory, send_file, make_response
+from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, session, send_from_directory, send_file, make_response, Response, g, after_this_request, has_request_context
 from flask_sqlalchemy import SQLAlchemy
 from flask_bcrypt import Bcrypt
 from werkzeug.utils import secure_filename
 import os
 import qrcode
+import qrcode.image.svg
+from PIL import Image, ImageDraw, ImageFont, ImageOps
+from markupsafe import Markup, escape
 import io
-import base64
-from datetime import datetime
+from datetime import datetime, timedelta
+from collections import Counter, OrderedDict, deque
+from sqlalchemy.dialects import sqlite as sqlite_dialect, postgresql as postgresql_dialect
+from sqlalchemy import event
+from sqlalchemy.orm import Session as OrmSession
 import secrets
+import random
+import re
+import functools
 import json
 import logging
 from logging.handlers import RotatingFileHandler
 import traceback
 import PyPDF2
+from PyPDF2.generic import ArrayObject, DictionaryObject, IndirectObject, NameObject, NumberObject, StreamObject
 from werkzeug.datastructures import FileStorage
 import time
 import hmac
 import hashlib
+import math
+import zlib
+import csv
+import gzip
+import shutil
+import tempfile
+import threading
+import queue
+from concurrent.futures import ProcessPoolExecutor
+import atexit
+import mimetypes
+import subprocess
+try:
+    import brotli  # Optional: enables precompressed .br static assets
+except ImportError:
+    brotli = None
+try:
+    import pymupdf  # Optional: renders PDF catalog pages without poppler
+except ImportError:
+    pymupdf = None
 
 # Load configuration from config.json
 def load_config():
@@ -33,7 +63,10 @@ def load_config():
         },
         "UPLOAD": {
             "FOLDER": "static/uploads",
-            "MAX_SIZE": 16777216  # 16MB in bytes
+            "MAX_SIZE": 16777216,  # 16MB in bytes
+            "RECLAIM_AFTER": 3600,  # Seconds an unreferenced upload (or idle chunked upload) is kept
+            "CHUNK_SIZE": 8388608,  # Largest chunk accepted by the chunked upload API
+            "MAX_CHUNKED_SIZE": 524288000
         },
         "GOOGLE_MAPS": {
             "API_KEY": "YOUR_GOOGLE_MAPS_API_KEY"
@@ -42,6 +75,67 @@ def load_config():
             "DEFAULT_USERNAME": "admin",
             "DEFAULT_PASSWORD": "admin123",
             "DEFAULT_EMAIL": "admin@ddandsons.com"
+        },
+        "ANALYTICS": {
+            "ASYNC": True,
+            "QUEUE_SIZE": 10000,
+            "BATCH_SIZE": 500,
+            "FLUSH_INTERVAL": 2.0,
+            "DROP_POLICY": "drop_newest",  # drop_newest or drop_oldest
+            "WRITE_ATTEMPTS": 3,  # Tries for a batch write before its events are dropped
+            "SESSION_IDLE_TIMEOUT": 1800,  # Seconds before an idle visitor session leaves memory
+            "SAMPLE_RATE": 1,  # Record 1 in N page/product views (1 records everything)
+            "ADAPTIVE_SAMPLING": True,  # Raise the rate while the queue backs up or writes are slow
+            "MAX_SAMPLE_RATE": 64,
+            "TARGET_WRITE_SECONDS": 0.5
+        },
+        "RETENTION": {
+            "DAYS": 180,  # Raw page/product views older than this are archived
+            "BATCH_SIZE": 1000,
+            "ARCHIVE_FOLDER": "instance/archive"
+        },
+        "CACHE": {
+            "ANALYTICS_TTL": 30,  # Seconds an analytics result is reused
+            "MAX_ENTRIES": 256
+        },
+        "LIVE_ANALYTICS": {
+            "TICK_INTERVAL": 5,  # Seconds between deltas pushed to /api/analytics/stream
+            "HISTORY": 120  # Deltas kept for reconnecting clients
+        },
+        "QR_SHEETS": {
+            "FOLDER": "instance/qr_sheets",
+            "COLUMNS": 4,
+            "ROWS": 6,
+            "DPI": 150,
+            "WORKERS": 0  # Render processes (0 = one per CPU)
+        },
+        "ASSETS": {
+            "FOLDER": "instance/assets",  # Fingerprinted and precompressed copies of static/
+            "COMPRESS_MIN_SIZE": 512
+        },
+        "PDF_PAGES": {
+            "FOLDER": "instance/pdf_pages",  # Rendered catalog pages, one folder per PDF content hash
+            "WIDTHS": [800, 1600],
+            "QUALITY": 75,
+            "PRERENDER": True,  # Render every page when a catalog is uploaded (otherwise on first view)
+            "WORKERS": 0  # Render processes (0 = one per CPU)
+        },
+        "PDF_OPTIMIZE": {
+            "ENABLED": True,  # Optimise uploaded catalogs; the original is kept for audit
+            "MAX_IMAGE_SIZE": 2000,  # Longest side, in pixels, of embedded images after downsampling
+            "IMAGE_QUALITY": 80,
+            "MIN_SAVINGS": 0.05  # Keep serving the original unless the copy is at least this much smaller
+        },
+        "IMAGES": {
+            "WIDTHS": [320, 640, 1280],  # Variant widths generated for uploaded images
+            "QUALITY": 80
+        },
+        "JOBS": {
+            "ASYNC": True,  # Run upload post-processing on background workers
+            "WORKERS": 2,  # Worker threads per app process (0 = only 'manage.py run-jobs')
+            "POLL_INTERVAL": 2,
+            "MAX_ATTEMPTS": 3,
+            "TIMEOUT": 600  # Seconds before a job left running by a dead worker is retried
         }
     }
     
@@ -142,6 +236,9 @@ app.config['GOOGLE_MAPS_API_KEY'] = config['GOOGLE_MAPS']['API_KEY']
 
 # Ensure upload directory exists
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+QR_FOLDER = os.path.join(app.config['UPLOAD_FOLDER'], 'qr')
+IMAGE_VARIANT_FOLDER = os.path.join(app.config['UPLOAD_FOLDER'], 'variants')
+CHUNK_FOLDER = os.path.join(app.config['UPLOAD_FOLDER'], 'chunks')
 
 db = SQLAlchemy(app)
 bcrypt = Bcrypt(app)
@@ -160,7 +257,7 @@ class Category(db.Model):
     name = db.Column(db.String(100), nullable=False)
     description = db.Column(db.Text)
     image = db.Column(db.String(200))
-    qr_code = db.Column(db.Text)  # Base64 encoded QR code
+    qr_code = db.Column(db.String(100))  # QR code PNG filename under UPLOAD_FOLDER/qr
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     products = db.relationship('Product', backref='category', lazy=True, cascade='all, delete-orphan')
 
@@ -173,9 +270,13 @@ class Product(db.Model):
     image = db.Column(db.String(200))
     pdf_catalog = db.Column(db.String(200))  # PDF file path
     pdf_pages = db.Column(db.Integer, default=0)  # Number of pages in PDF
+    pdf_original = db.Column(db.String(200))  # Catalog as uploaded, when pdf_catalog is an optimised copy of it
+    pdf_original_size = db.Column(db.Integer)  # Bytes, recorded by the optimisation stage
+    pdf_optimized_size = db.Column(db.Integer)
     view_count = db.Column(db.Integer, default=0)  # Total view count
-    qr_code = db.Column(db.Text)  # Base64 encoded QR code
-    category_id = db.Column(db.Integer, db.ForeignKey('category.id'), nullable=False)
+    qr_code = db.Column(db.String(100))  # QR code PNG filename under UPLOAD_FOLDER/qr
+    processing_status = db.Column(db.String(20), nullable=False, default='ready')  # 'pending', 'processing', 'ready', 'failed'
+    category_id = db.Column(db.Integer, db.ForeignKey('category.id'), nullable=False, index=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
 class ContactInfo(db.Model):
@@ -196,55 +297,647 @@ class ContactMessage(db.Model):
     message = db.Column(db.Text, nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+# Dictionary tables for long strings repeated across the event tables
+class UserAgent(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    value = db.Column(db.Text, unique=True, nullable=False)
+
+class Referrer(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    value = db.Column(db.String(500), unique=True, nullable=False)
+
 class ProductView(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     product_id = db.Column(db.Integer, db.ForeignKey('product.id'), nullable=False)
     ip_address = db.Column(db.String(45), nullable=False)
-    user_agent = db.Column(db.Text)
+    user_agent_id = db.Column(db.Integer, db.ForeignKey('user_agent.id'))
     page_number = db.Column(db.Integer, default=1)  # For PDF page tracking
     view_type = db.Column(db.String(20), default='product')  # 'product', 'pdf_page'
+    sample_weight = db.Column(db.Integer, nullable=False, default=1)  # Views this row stands for when sampling
+    dwell_ms = db.Column(db.Integer)  # Time the PDF page was shown, reported by the viewer's beacon
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     product = db.relationship('Product', backref='views')
+    
+    __table_args__ = (
+        db.Index('ix_product_view_product_created', 'product_id', 'created_at', 'ip_address', 'sample_weight'),
+        db.Index('ix_product_view_product_type_created', 'product_id', 'view_type', 'created_at', 'page_number',
+                 'sample_weight', 'dwell_ms'),
+    )
 
 class PageView(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     page_url = db.Column(db.String(500), nullable=False)
     page_title = db.Column(db.String(200))
-    user_agent = db.Column(db.Text)
+    user_agent_id = db.Column(db.Integer, db.ForeignKey('user_agent.id'))
     ip_address = db.Column(db.String(45))
-    referrer = db.Column(db.String(500))
+    referrer_id = db.Column(db.Integer, db.ForeignKey('referrer.id'))
     session_id = db.Column(db.String(100))
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    sample_weight = db.Column(db.Integer, nullable=False, default=1)  # Views this row stands for when sampling
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
 
 class VisitorSession(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     session_id = db.Column(db.String(100), unique=True, nullable=False)
     ip_address = db.Column(db.String(45))
-    user_agent = db.Column(db.Text)
+    user_agent_id = db.Column(db.Integer, db.ForeignKey('user_agent.id'))
     first_visit = db.Column(db.DateTime, default=datetime.utcnow)
     last_visit = db.Column(db.DateTime, default=datetime.utcnow)
     page_views = db.Column(db.Integer, default=1)
     is_bot = db.Column(db.Boolean, default=False)
     country = db.Column(db.String(100))
     city = db.Column(db.String(100))
+    
+    __table_args__ = (
+        db.Index('ix_visitor_session_bot_first_visit', 'is_bot', 'first_visit'),
+        db.Index('ix_visitor_session_bot_last_visit', 'is_bot', 'last_visit'),
+    )
+
+# Analytics rollups, kept up to date by the analytics writer
+class TrafficRollup(db.Model):
+    hour = db.Column(db.DateTime, primary_key=True)  # Start of the hour (UTC)
+    views = db.Column(db.Integer, nullable=False, default=0)
+    sessions = db.Column(db.Integer, nullable=False, default=0)  # New visitor sessions
+    bot_views = db.Column(db.Integer, nullable=False, default=0)  # Requests classified as bots
+
+class PageRollup(db.Model):
+    day = db.Column(db.Date, primary_key=True)
+    page_url = db.Column(db.String(500), primary_key=True)
+    page_title = db.Column(db.String(200))  # Most recent title seen for the URL
+    views = db.Column(db.Integer, nullable=False, default=0)
+
+class ReferrerRollup(db.Model):
+    day = db.Column(db.Date, primary_key=True)
+    referrer_id = db.Column(db.Integer, db.ForeignKey('referrer.id'), primary_key=True)
+    views = db.Column(db.Integer, nullable=False, default=0)
+
+class ProductVisitorSketch(db.Model):
+    product_id = db.Column(db.Integer, db.ForeignKey('product.id'), primary_key=True)
+    day = db.Column(db.Date, primary_key=True)
+    registers = db.Column(db.LargeBinary, nullable=False)  # zlib-compressed HyperLogLog registers
+
+class Job(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(50), nullable=False)
+    payload = db.Column(db.Text, nullable=False, default='{}')  # JSON keyword arguments for the handler
+    status = db.Column(db.String(20), nullable=False, default='queued')  # 'queued', 'running', 'done', 'failed'
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    error = db.Column(db.Text)
+    run_after = db.Column(db.DateTime)  # Retry backoff
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+    
+    __table_args__ = (
+        db.Index('ix_job_status_id', 'status', 'id'),
+    )
+
+class UploadedFile(db.Model):
+    filename = db.Column(db.String(200), primary_key=True)  # <sha256>.<ext> under UPLOAD_FOLDER
+    size = db.Column(db.BigInteger)
+    ref_count = db.Column(db.Integer, nullable=False, default=0)  # Product.image, Product.pdf_catalog and Category.image values naming it
+    unreferenced_at = db.Column(db.DateTime)  # When ref_count last dropped to 0
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class ChunkedUpload(db.Model):
+    id = db.Column(db.String(32), primary_key=True)  # Random token, also the name of the file under CHUNK_FOLDER
+    filename = db.Column(db.String(200), nullable=False)  # Client filename
+    size = db.Column(db.BigInteger, nullable=False)
+    received = db.Column(db.BigInteger, nullable=False, default=0)  # Bytes written so far; the next chunk's offset
+    sha256 = db.Column(db.String(64))  # Checksum of the whole file, when the client sent one
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
 
 # Helper Functions
-def generate_qr_code(data):
-    """Generate QR code and return as base64 string"""
+def make_qr(data):
+    """Build the QR matrix for data; the expensive step, shared by all output formats"""
     qr = qrcode.QRCode(version=1, box_size=10, border=5)
     qr.add_data(data)
     qr.make(fit=True)
+    return qr
+
+def render_qr_code(data, image_format='png', qr=None):
+    """Render a QR code for data and return the encoded PNG or SVG bytes"""
+    qr = qr or make_qr(data)
+    buffer = io.BytesIO()
+    if image_format == 'svg':
+        qr.make_image(image_factory=qrcode.image.svg.SvgPathImage).save(buffer)
+    else:
+        qr.make_image(fill_color="black", back_color="white").save(buffer, format='PNG')
+    return buffer.getvalue()
+
+def compose_qr_sheet(path, labels, layout):
+    """Lay out (label, QR filename) pairs on one A4 page; save it as PNG and single-page PDF"""
+    columns, rows, dpi = layout
+    page = Image.new('L', (int(8.27 * dpi), int(11.69 * dpi)), 255)
+    draw = ImageDraw.Draw(page)
+    font = ImageFont.load_default(size=max(dpi // 10, 10))
+    margin = dpi // 2
+    cell_width = (page.width - 2 * margin) // columns
+    cell_height = (page.height - 2 * margin) // rows
+    text_height = dpi // 6
+    qr_size = min(cell_width, cell_height - text_height) - dpi // 10
     
-    img = qr.make_image(fill_color="black", back_color="white")
+    for index, (label, qr_filename) in enumerate(labels):
+        x = margin + (index % columns) * cell_width
+        y = margin + (index // columns) * cell_height
+        with Image.open(os.path.join(QR_FOLDER, qr_filename)) as qr:
+            page.paste(qr.convert('L').resize((qr_size, qr_size), Image.NEAREST), (x + (cell_width - qr_size) // 2, y))
+        while len(label) > 1 and draw.textlength(label, font=font) > cell_width - 4:
+            label = label[:-2] + '…'
+        draw.text((x + cell_width // 2, y + qr_size + 2), label, fill=0, font=font, anchor='ma')
     
-    # Convert to base64
-    buffer = io.BytesIO()
-    img.save(buffer, format='PNG')
-    buffer.seek(0)
-    img_str = base64.b64encode(buffer.getvalue()).decode()
+    page.save(f"{path}.png")
+    page.save(f"{path}.pdf", resolution=dpi)
+
+def generate_qr_sheets(base_url, settings=None):
+    """Render QR codes for every category and product onto printable, labelled A4 sheets.
+
+    Incremental: an item's QR code is re-rendered only when its URL changed
+    or its file is missing, and a sheet is recomposed only when its labels
+    or QR files changed. Both steps run on a process pool. The QR files used
+    are tracked in the sheet manifest only; the live qr_code columns are left
+    alone. Returns the path of the combined PDF (None for an empty catalog)
+    and counters.
+    """
+    settings = settings or config['QR_SHEETS']
+    folder = settings['FOLDER']
+    layout = (settings['COLUMNS'], settings['ROWS'], settings['DPI'])
+    manifest_path = os.path.join(folder, 'manifest.json')
+    pdf_path = os.path.join(folder, 'qr-sheets.pdf')
+    os.makedirs(folder, exist_ok=True)
+    manifest = {'items': {}, 'sheets': {}}
+    if os.path.exists(manifest_path):
+        with open(manifest_path, 'r') as f:
+            manifest = json.load(f)
+    
+    entries = []
+    for kind, model in (('category', Category), ('product', Product)):
+        for item in model.query.order_by(model.id):
+            url = f"{base_url}{kind}/{item.id}"
+            previous = manifest['items'].get(f"{kind}:{item.id}")
+            unchanged = previous and previous['url'] == url and os.path.exists(os.path.join(QR_FOLDER, previous['qr']))
+            entries.append({'key': f"{kind}:{item.id}", 'item': item, 'url': url, 'qr': previous['qr'] if unchanged else None})
+    stats = {'items': len(entries), 'rendered': 0, 'sheets': 0, 'sheets_written': 0}
+    if not entries:
+        return None, stats
+    
+    per_sheet = layout[0] * layout[1]
+    pool = None
+    try:
+        to_render = [entry for entry in entries if entry['qr'] is None]
+        if to_render:
+            pool = ProcessPoolExecutor(max_workers=settings['WORKERS'] or None)
+            urls = [entry['url'] for entry in to_render]
+            for entry, qr_filename in zip(to_render, pool.map(save_qr_code, urls, chunksize=32)):
+                entry['qr'] = qr_filename
+            stats['rendered'] = len(to_render)
+        
+        sheets = {}
+        jobs = []
+        for start in range(0, len(entries), per_sheet):
+            number = str(start // per_sheet + 1)
+            labels = [(entry['item'].name, entry['qr']) for entry in entries[start:start + per_sheet]]
+            sheets[number] = hashlib.sha256(json.dumps([labels, layout]).encode()).hexdigest()
+            path = os.path.join(folder, f"sheet-{int(number):04d}")
+            if manifest['sheets'].get(number) != sheets[number] or not os.path.exists(f"{path}.pdf"):
+                jobs.append((path, labels))
+        if jobs:
+            pool = pool or ProcessPoolExecutor(max_workers=settings['WORKERS'] or None)
+            list(pool.map(compose_qr_sheet, [path for path, _ in jobs], [labels for _, labels in jobs],
+                          [layout] * len(jobs)))
+    finally:
+        if pool:
+            pool.shutdown()
+    
+    for number in set(manifest['sheets']) - set(sheets):
+        for extension in ('png', 'pdf'):
+            stale_path = os.path.join(folder, f"sheet-{int(number):04d}.{extension}")
+            if os.path.exists(stale_path):
+                os.remove(stale_path)
+    if jobs or len(sheets) != len(manifest['sheets']) or not os.path.exists(pdf_path):
+        writer = PyPDF2.PdfWriter()
+        for number in range(1, len(sheets) + 1):
+            writer.add_page(PyPDF2.PdfReader(os.path.join(folder, f"sheet-{number:04d}.pdf")).pages[0])
+        buffer = io.BytesIO()
+        writer.write(buffer)
+        write_file_atomic(pdf_path, buffer.getvalue())
+    
+    manifest = {
+        'items': {entry['key']: {'url': entry['url'], 'qr': entry['qr']} for entry in entries},
+        'sheets': sheets
+    }
+    write_file_atomic(manifest_path, json.dumps(manifest).encode())
+    stats.update(sheets=len(sheets), sheets_written=len(jobs))
+    return pdf_path, stats
+
+QR_MIMETYPES = {'png': 'image/png', 'svg': 'image/svg+xml'}
+
+@functools.lru_cache(maxsize=256)
+def cached_qr_code(data, image_format='png'):
+    """Rendered QR code bytes and their strong ETag, memoised by payload and format"""
+    content = render_qr_code(data, image_format)
+    return content, hashlib.sha256(content).hexdigest()[:32]
+
+def qr_code_response(data):
+    """Raw PNG (default) or SVG (?format=svg) QR code response with If-None-Match support"""
+    image_format = request.args.get('format', 'png')
+    if image_format not in QR_MIMETYPES:
+        return jsonify({'error': 'Unsupported format'}), 400
+    content, etag = cached_qr_code(data, image_format)
+    response = Response(content, mimetype=QR_MIMETYPES[image_format])
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'public, max-age=86400'
+    return response.make_conditional(request)
+
+def write_file_atomic(path, content):
+    """Write bytes to path via a temporary file, so readers never see a partial file"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(content)
+    os.replace(tmp_path, path)
+
+def save_qr_code(data):
+    """Render the QR code for data once to content-addressed PNG and SVG files.
+
+    Files are named after the hash of the PNG, so a name never changes
+    content and can be cached forever. Returns the PNG filename, which is
+    what Category.qr_code and Product.qr_code store.
+    """
+    qr = make_qr(data)
+    png = render_qr_code(data, qr=qr)
+    name = hashlib.sha256(png).hexdigest()[:20]
+    png_path = os.path.join(QR_FOLDER, f"{name}.png")
+    svg_path = os.path.join(QR_FOLDER, f"{name}.svg")
+    if not os.path.exists(png_path):
+        write_file_atomic(png_path, png)
+    if not os.path.exists(svg_path):
+        write_file_atomic(svg_path, render_qr_code(data, 'svg', qr=qr))
+    return f"{name}.png"
+
+# Responsive image variants of uploaded product and category images
+IMAGE_VARIANT_FORMATS = (('webp', 'WEBP'), ('jpg', 'JPEG'))
+
+def image_variant_name(filename, width, extension):
+    return f"{os.path.splitext(filename)[0]}-{width}w.{extension}"
+
+def create_image_variants(filename):
+    """Write resized WebP and progressive JPEG variants of an uploaded image.
+
+    One variant per configured width, never upscaled: the first width at or
+    above the original's width gets the original size and larger ones are
+    skipped. EXIF orientation is applied and no metadata is copied. Returns
+    the widths written; errors are logged, leaving templates on the original.
+    """
+    settings = config['IMAGES']
+    try:
+        with Image.open(os.path.join(app.config['UPLOAD_FOLDER'], filename)) as original:
+            image = ImageOps.exif_transpose(original)
+            has_alpha = image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info)
+            image = image.convert('RGBA' if has_alpha else 'RGB')
+        
+        widths = []
+        for width in sorted(settings['WIDTHS']):
+            resized = image
+            if image.width > width:
+                resized = image.resize((width, max(round(image.height * width / image.width), 1)), Image.LANCZOS)
+            for extension, image_format in IMAGE_VARIANT_FORMATS:
+                variant = resized
+                buffer = io.BytesIO()
+                if image_format == 'JPEG':
+                    if has_alpha:
+                        variant = Image.new('RGB', resized.size, 'white')
+                        variant.paste(resized, mask=resized.getchannel('A'))
+                    variant.save(buffer, 'JPEG', quality=settings['QUALITY'], progressive=True, optimize=True)
+                else:
+                    variant.save(buffer, 'WEBP', quality=settings['QUALITY'], method=4)
+                write_file_atomic(os.path.join(IMAGE_VARIANT_FOLDER, image_variant_name(filename, width, extension)), buffer.getvalue())
+            widths.append(width)
+            if image.width <= width:
+                break
+        return widths
+    except Exception as e:
+        logger.error(f"Error creating image variants for {filename}: {e}")
+        return []
+
+def remove_image_variants(filename):
+    for width in config['IMAGES']['WIDTHS']:
+        for extension, _ in IMAGE_VARIANT_FORMATS:
+            path = os.path.join(IMAGE_VARIANT_FOLDER, image_variant_name(filename, width, extension))
+            if os.path.exists(path):
+                os.remove(path)
+
+def image_variant_widths(filename):
+    """Configured widths that have variants on disk for an uploaded image"""
+    return [
+        width for width in sorted(config['IMAGES']['WIDTHS'])
+        if os.path.exists(os.path.join(IMAGE_VARIANT_FOLDER, image_variant_name(filename, width, 'jpg')))
+    ]
+
+@app.template_global()
+def responsive_image(filename, alt='', sizes='100vw', css_class='', style='', loading='lazy'):
+    """<picture> with WebP and JPEG srcsets for an uploaded image, or a plain <img> until variants exist"""
+    attributes = f'class="{escape(css_class)}" alt="{escape(alt)}" style="{escape(style)}" loading="{escape(loading)}"'
+    widths = image_variant_widths(filename)
+    if not widths:
+        return Markup(f'<img src="{url_for("static", filename="uploads/" + filename)}" {attributes}>')
     
-    return f"data:image/png;base64,{img_str}"
+    def variant_url(width, extension):
+        return url_for('static', filename=f"uploads/variants/{image_variant_name(filename, width, extension)}")
+    
+    def srcset(extension):
+        return ', '.join(f"{variant_url(width, extension)} {width}w" for width in widths)
+    
+    return Markup(
+        f'<picture><source type="image/webp" srcset="{srcset("webp")}" sizes="{escape(sizes)}">'
+        f'<img src="{variant_url(widths[min(1, len(widths) - 1)], "jpg")}" srcset="{srcset("jpg")}" '
+        f'sizes="{escape(sizes)}" {attributes}></picture>'
+    )
+
+# Content-addressed upload store. Uploads are named after the SHA-256 of
+# their content, so identical files share one copy on disk; UploadedFile
+# counts the rows naming each file and reclaim_uploads deletes files nobody
+# has referenced for UPLOAD.RECLAIM_AFTER seconds.
+CONTENT_ADDRESS_PATTERN = re.compile(r'^[0-9a-f]{64}(\.[a-z0-9]+)?$')
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+def upload_extension(filename):
+    return os.path.splitext(secure_filename(filename))[1].lower()
+
+def store_upload(file):
+    """Stream an uploaded FileStorage to disk, hashing it on the way, and retain it.
+
+    The content goes to a staging file in UPLOAD_FOLDER and is moved to
+    <sha256><ext> when the session commits (or dropped on rollback), so a
+    file only appears once the rows referencing it exist. Returns the
+    content-addressed filename to store on the model.
+    """
+    digest = hashlib.sha256()
+    size = 0
+    fd, staging_path = tempfile.mkstemp(dir=app.config['UPLOAD_FOLDER'], suffix='.part')
+    with os.fdopen(fd, 'wb') as staging:
+        for chunk in iter(lambda: file.stream.read(UPLOAD_CHUNK_SIZE), b''):
+            digest.update(chunk)
+            staging.write(chunk)
+            size += len(chunk)
+    return stage_upload(staging_path, f"{digest.hexdigest()}{upload_extension(file.filename)}", size)
+
+def stage_upload(staging_path, filename, size):
+    """Retain filename and move staging_path into place when the session commits"""
+    retain_upload(filename, size)
+    db.session.info.setdefault('staged_uploads', []).append((staging_path, filename))
+    return filename
+
+def retain_upload(filename, size=None):
+    """Count one more reference to an uploaded file (within the caller's transaction)"""
+    statement = upsert(UploadedFile)
+    db.session.execute(statement.on_conflict_do_update(
+        index_elements=['filename'],
+        set_={'ref_count': UploadedFile.ref_count + 1, 'unreferenced_at': None}
+    ), [{'filename': filename, 'size': size, 'ref_count': 1, 'created_at': datetime.utcnow()}])
+
+def release_upload(filename):
+    """Count one reference less; the file is reclaimed once the count stays at 0"""
+    if not filename:
+        return
+    db.session.execute(db.update(UploadedFile).where(UploadedFile.filename == filename).values(
+        ref_count=UploadedFile.ref_count - 1,
+        unreferenced_at=db.case((UploadedFile.ref_count <= 1, datetime.utcnow()), else_=UploadedFile.unreferenced_at)
+    ))
+
+@event.listens_for(OrmSession, 'after_commit')
+def finalize_staged_uploads(session):
+    for staging_path, filename in session.info.pop('staged_uploads', []):
+        path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+        if os.path.exists(path):
+            os.remove(staging_path)  # Identical content is already stored
+        else:
+            os.replace(staging_path, path)
+
+@event.listens_for(OrmSession, 'after_rollback')
+def discard_staged_uploads(session):
+    for staging_path, _ in session.info.pop('staged_uploads', []):
+        if os.path.exists(staging_path):
+            os.remove(staging_path)
+
+def remove_upload_file(filename):
+    path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+    if os.path.exists(path):
+        if filename.lower().endswith('.pdf'):
+            shutil.rmtree(pdf_page_folder(filename), ignore_errors=True)
+        os.remove(path)
+    remove_image_variants(filename)
+
+def upload_references():
+    """Counter of filenames referenced by products and categories"""
+    references = Counter()
+    for column in (Product.image, Product.pdf_catalog, Product.pdf_original, Category.image):
+        references.update(name for (name,) in db.session.query(column).filter(column.isnot(None), column != ''))
+    return references
+
+def reclaim_uploads(grace_seconds=None):
+    """Delete uploaded files (and image variants) unreferenced for longer than grace_seconds.
+
+    Each file is removed while the DELETE of its UploadedFile row holds the
+    write lock, so a concurrent upload of the same content either revives the
+    row first (and the file is kept) or commits afterwards and puts the file
+    back from its own staging copy. Chunked uploads idle for longer than the
+    grace period are discarded too. Returns the number of files reclaimed.
+    """
+    grace = config['UPLOAD']['RECLAIM_AFTER'] if grace_seconds is None else grace_seconds
+    cutoff = datetime.utcnow() - timedelta(seconds=grace)
+    references = upload_references()
+    candidates = [
+        filename for (filename,) in db.session.query(UploadedFile.filename)
+        .filter(UploadedFile.ref_count <= 0, UploadedFile.unreferenced_at < cutoff)
+    ]
+    reclaimed = 0
+    for filename in candidates:
+        if references[filename]:
+            continue  # Count drifted; reconcile_uploads repairs it
+        deleted = UploadedFile.query.filter(
+            UploadedFile.filename == filename, UploadedFile.ref_count <= 0
+        ).delete(synchronize_session=False)
+        if deleted:
+            remove_upload_file(filename)
+            reclaimed += 1
+        db.session.commit()
+
+    # Staging files left behind by requests that died before commit or rollback
+    folder = app.config['UPLOAD_FOLDER']
+    for name in os.listdir(folder):
+        path = os.path.join(folder, name)
+        if name.endswith('.part') and os.path.getmtime(path) < time.time() - grace:
+            os.remove(path)
+    
+    # Chunked uploads that stopped receiving chunks
+    for upload in ChunkedUpload.query.filter(ChunkedUpload.updated_at < cutoff).all():
+        remove_chunked_upload(upload)
+    db.session.commit()
+    return reclaimed
+
+def chunked_upload_path(upload_id):
+    return os.path.join(CHUNK_FOLDER, f"{upload_id}.part")
+
+def remove_chunked_upload(upload):
+    path = chunked_upload_path(upload.id)
+    if os.path.exists(path):
+        os.remove(path)
+    db.session.delete(upload)
+
+def reconcile_uploads():
+    """Recompute UploadedFile.ref_count from the rows that reference uploads.
+
+    Also registers files saved before the upload store existed. Returns the
+    number of rows corrected.
+    """
+    references = upload_references()
+    now = datetime.utcnow()
+    corrected = 0
+    for row in UploadedFile.query.all():
+        count = references.pop(row.filename, 0)
+        if row.ref_count != count:
+            row.ref_count = count
+            row.unreferenced_at = None if count else (row.unreferenced_at or now)
+            corrected += 1
+    folder = app.config['UPLOAD_FOLDER']
+    for filename, count in references.items():
+        path = os.path.join(folder, filename)
+        size = os.path.getsize(path) if os.path.exists(path) else None
+        db.session.add(UploadedFile(filename=filename, size=size, ref_count=count))
+        corrected += 1
+    db.session.commit()
+    return corrected
+
+def hash_file(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(UPLOAD_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def dedupe_uploads():
+    """Move uploads saved under timestamped names to their content address.
+
+    Duplicates collapse into one file. The content-addressed copy is linked
+    (or copied) into place before the rows are repointed and the old names
+    are only removed afterwards, so pages never reference a missing file.
+    Returns (files renamed, bytes freed).
+    """
+    folder = app.config['UPLOAD_FOLDER']
+    renames = {}
+    duplicates = set()
+    for model, column in ((Product, 'image'), (Product, 'pdf_catalog'), (Product, 'pdf_original'), (Category, 'image')):
+        for item in model.query.filter(getattr(model, column).isnot(None)):
+            name = getattr(item, column)
+            path = os.path.join(folder, name)
+            if CONTENT_ADDRESS_PATTERN.match(name) or not os.path.exists(path):
+                continue
+            if name not in renames:
+                renames[name] = f"{hash_file(path)}{upload_extension(name)}"
+                target = os.path.join(folder, renames[name])
+                if os.path.exists(target):
+                    duplicates.add(name)
+                else:
+                    try:
+                        os.link(path, target)
+                    except OSError:
+                        shutil.copy2(path, target)
+            setattr(item, column, renames[name])
+    db.session.commit()
+
+    freed = 0
+    for name, target in renames.items():
+        path = os.path.join(folder, name)
+        if name in duplicates:
+            freed += os.path.getsize(path)
+        os.remove(path)
+        remove_image_variants(name)
+        if allowed_file(target) and not image_variant_widths(target):
+            create_image_variants(target)
+    # Rows for the old names are now unreferenced and will be reclaimed
+    reconcile_uploads()
+    return len(renames), freed
+
+# Fingerprinted static assets. Every file under static/ (except uploads) is
+# copied to ASSETS.FOLDER under a name containing its content hash, with .gz
+# and .br siblings for compressible types, and served from /assets/ with an
+# immutable Cache-Control. Templates keep calling url_for('static', ...).
+ASSET_COMPRESSIBLE_TYPES = ('text/', 'application/javascript', 'application/json', 'image/svg+xml')
+ASSET_ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+class AssetManifest:
+    """Maps static/ paths to fingerprinted names, rebuilt when a source file changes"""
+    
+    def __init__(self, static_folder, settings, excluded=('uploads',)):
+        self.static_folder = static_folder
+        self.folder = settings['FOLDER']
+        self.compress_min_size = settings['COMPRESS_MIN_SIZE']
+        self.excluded = excluded
+        self.lock = threading.Lock()
+        self.urls = {}  # 'css/style.css' -> 'css/style.<hash>.css'
+        self.files = {}  # 'css/style.<hash>.css' -> encodings available besides identity
+        self.mtimes = None
+    
+    def sources(self):
+        for root, dirs, names in os.walk(self.static_folder):
+            if root == self.static_folder:
+                dirs[:] = [name for name in dirs if name not in self.excluded]
+            for name in names:
+                path = os.path.join(root, name)
+                yield os.path.relpath(path, self.static_folder).replace(os.sep, '/'), path
+    
+    def build(self):
+        """Fingerprint and precompress every source file; unchanged files are not rewritten"""
+        urls, files, mtimes = {}, {}, {}
+        for relative, path in self.sources():
+            mtimes[relative] = os.path.getmtime(path)
+            with open(path, 'rb') as f:
+                content = f.read()
+            stem, extension = os.path.splitext(relative)
+            hashed = f"{stem}.{hashlib.sha256(content).hexdigest()[:12]}{extension}"
+            target = os.path.join(self.folder, hashed)
+            if not os.path.exists(target):
+                write_file_atomic(target, content)
+            encodings = []
+            mimetype = mimetypes.guess_type(relative)[0] or ''
+            if len(content) >= self.compress_min_size and mimetype.startswith(ASSET_COMPRESSIBLE_TYPES):
+                for encoding, suffix in ASSET_ENCODINGS:
+                    if encoding == 'br' and brotli is None:
+                        continue
+                    if not os.path.exists(target + suffix):
+                        compressed = brotli.compress(content, quality=11) if encoding == 'br' else gzip.compress(content, 9, mtime=0)
+                        write_file_atomic(target + suffix, compressed)
+                    encodings.append(encoding)
+            urls[relative] = hashed
+            files[hashed] = encodings
+        self.urls, self.files, self.mtimes = urls, files, mtimes
+        logger.info(f"Asset manifest built: {len(urls)} files")
+    
+    def current(self):
+        """Build on first use; in debug mode also rebuild when a source file changed"""
+        with self.lock:
+            if self.mtimes is None or (app.debug and any(
+                os.path.getmtime(path) != self.mtimes.get(relative) for relative, path in self.sources()
+            )):
+                self.build()
+        return self
+    
+    def url(self, filename):
+        return self.current().urls.get(filename)
+
+assets = AssetManifest(app.static_folder, config['ASSETS'])
+
+@app.template_global('url_for')
+def asset_url_for(endpoint, **values):
+    """url_for that points static files with a fingerprinted copy at /assets/"""
+    if endpoint == 'static' and 'filename' in values:
+        hashed = assets.url(values['filename'])
+        if hashed:
+            values['filename'] = hashed
+            return url_for('asset', **values)
+    return url_for(endpoint, **values)
 
 def allowed_file(filename):
     ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'webp'}
@@ -259,19 +952,788 @@ def get_client_ip():
     else:
         return request.remote_addr
 
+# Case-insensitive substrings identifying crawlers, link previewers, monitors,
+# HTTP libraries and scanners. The matched signature is used as the counter key.
+# Only tokens that real browsers, in-app browsers and webviews never send are
+# listed: vendor names shared with browsers and apps (DuckDuckGo, Yandex,
+# Sogou, WhatsApp) appear by their crawler names only, and generic words such
+# as 'fetch' or 'preview' are left out.
+BOT_SIGNATURES = (
+    # Generic markers
+    'bot', 'crawler', 'spider', 'slurp', 'scraper', 'headlesschrome',
+    # Search engines and SEO tools
+    'googlebot', 'bingbot', 'bingpreview', 'yandexbot', 'yandeximages', 'yandexmetrika', 'yandexdirect',
+    'yandexfavicons', 'baiduspider', 'duckduckbot', 'sogou web spider', 'exabot',
+    'applebot', 'petalbot', 'seznambot', 'mediapartners-google', 'adsbot-google', 'google-inspectiontool',
+    'ahrefs', 'semrush', 'mj12bot', 'dotbot', 'rogerbot', 'screaming frog', 'serpstat', 'dataforseo',
+    'blexbot', 'megaindex', 'ia_archiver', 'archive.org_bot',
+    # AI crawlers
+    'gptbot', 'chatgpt-user', 'oai-searchbot', 'claudebot', 'anthropic-ai', 'ccbot', 'bytespider',
+    'perplexitybot', 'amazonbot', 'cohere-ai', 'diffbot', 'omgili', 'youbot',
+    # Social and messaging link previews
+    'facebookexternalhit', 'facebookcatalog', 'twitterbot', 'linkedinbot', 'slackbot', 'discordbot',
+    'telegrambot', 'skypeuripreview', 'pinterestbot', 'redditbot', 'embedly', 'vkshare',
+    # Uptime and performance monitors
+    'pingdom', 'uptimerobot', 'statuscake', 'site24x7', 'newrelicpinger', 'datadogsynthetics',
+    'nagios-plugins', 'chrome-lighthouse', 'gtmetrix',
+    # HTTP clients and automation
+    'curl/', 'wget/', 'python-requests', 'python-urllib', 'python-httpx', 'aiohttp/', 'apache-httpclient',
+    'okhttp/', 'go-http-client', 'libwww-perl', 'lwp::', 'guzzlehttp', 'axios/', 'node-fetch', 'undici',
+    'postmanruntime', 'insomnia/', 'httpie/', 'scrapy', 'phantomjs', 'cypress/',
+    # Security scanners
+    'zgrab', 'masscan', 'nmap', 'nikto', 'sqlmap', 'nuclei', 'censysinspect', 'expanse', 'shodan',
+)
+
+# Signatures that only mark a bot when the User-Agent does not claim to be a
+# browser: the WhatsApp link previewer and language runtimes send them on
+# their own ('WhatsApp/2.23.24.82 A', 'Java/17'), while WhatsApp's in-app
+# browser appends them to a Mozilla/5.0 User-Agent.
+CLIENT_SIGNATURES = ('whatsapp/', 'java/', 'php/', 'ruby')
+
+# Browser User-Agent tokens that contain a generic signature ('bot' in Cubot
+# phone models). Matched like signatures, but never classify a request as a bot.
+BROWSER_TOKENS = ('cubot',)
+
+def build_signature_pattern(signatures):
+    """Compile signatures into one regex shaped like a prefix trie.
+
+    A flat 'a|b|c' alternation makes the regex engine retry every
+    signature at every position; sharing prefixes keeps a search at a few
+    microseconds. Optional groups are greedy, so the longest (most specific)
+    signature wins at a given position.
+    """
+    trie = {}
+    for signature in signatures:
+        node = trie
+        for char in signature.lower():
+            node = node.setdefault(char, {})
+        node[''] = {}
+
+    def build(node):
+        alternatives = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        if not alternatives:
+            return ''
+        ends_here = '' in node
+        if len(alternatives) == 1 and not ends_here:
+            return alternatives[0]
+        group = '(?:' + '|'.join(alternatives) + ')'
+        return group + '?' if ends_here else group
+
+    return re.compile(build(trie))
+
+BOT_PATTERN = build_signature_pattern(set(BOT_SIGNATURES) | set(BROWSER_TOKENS))
+CLIENT_PATTERN = build_signature_pattern(set(CLIENT_SIGNATURES))
+
+@functools.lru_cache(maxsize=4096)
+def classify_user_agent(user_agent):
+    """Return the matching bot signature for a raw User-Agent, or None for browsers.
+
+    Uncached, one regex search over ~150 signatures is about 2-3x slower than
+    the original scan for seven substrings (see benchmark_bot_classifier.py).
+    The speed-up comes from the LRU cache: real traffic repeats a few hundred
+    distinct User-Agents, so nearly every call is a dictionary lookup.
+    """
+    if not user_agent:
+        return 'empty'
+    user_agent = user_agent.lower()
+    for match in BOT_PATTERN.finditer(user_agent):
+        if match.group(0) not in BROWSER_TOKENS:
+            return match.group(0)
+    if not user_agent.startswith('mozilla/'):
+        match = CLIENT_PATTERN.search(user_agent)
+        if match:
+            return match.group(0)
+    return None
+
 def is_bot(user_agent):
     """Check if the request is from a bot"""
-    bot_indicators = ['bot', 'crawler', 'spider', 'scraper', 'googlebot', 'bingbot', 'slurp']
-    if not user_agent:
-        return True
-    return any(indicator in user_agent.lower() for indicator in bot_indicators)
+    return classify_user_agent(user_agent) is not None
+
+class HyperLogLog:
+    """HyperLogLog cardinality sketch.
+
+    2**precision one-byte registers; precision 11 gives about 2.3% standard
+    error in 2KB (much less once compressed for sparse sketches). Sketches
+    merge by taking the register-wise maximum, so per-day sketches can be
+    combined for any day range.
+    """
+
+    PRECISION = 11
+
+    def __init__(self, registers=None, precision=PRECISION):
+        self.precision = precision
+        self.size = 1 << precision
+        self.registers = bytearray(registers) if registers else bytearray(self.size)
+
+    @classmethod
+    def from_bytes(cls, data):
+        return cls(zlib.decompress(data))
+
+    def to_bytes(self):
+        return zlib.compress(bytes(self.registers))
+
+    def add(self, value):
+        hashed = int.from_bytes(hashlib.sha1(str(value).encode()).digest()[:8], 'big')
+        index = hashed >> (64 - self.precision)
+        remaining_bits = 64 - self.precision
+        rank = remaining_bits - (hashed & ((1 << remaining_bits) - 1)).bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def merge(self, other):
+        self.registers = bytearray(map(max, self.registers, other.registers))
+        return self
+
+    def estimate(self):
+        alpha = 0.7213 / (1 + 1.079 / self.size)
+        estimate = alpha * self.size * self.size / sum(2.0 ** -register for register in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * self.size and zeros:
+            # Linear counting is more accurate for small cardinalities
+            estimate = self.size * math.log(self.size / zeros)
+        return int(round(estimate))
+
+class ViewCountAccumulator:
+    """Coalesce Product.view_count increments in memory until the next flush.
+
+    Requests only bump a per-product delta; the analytics writer applies all
+    pending deltas with one batched UPDATE ... SET view_count = view_count + ?
+    so hot products no longer serialise every request on their row.
+    """
+
+    def __init__(self):
+        self._deltas = Counter()
+        self._lock = threading.Lock()
+
+    def add(self, product_id, count=1):
+        with self._lock:
+            self._deltas[product_id] += count
+
+    def pending(self):
+        with self._lock:
+            return bool(self._deltas)
+
+    def drain(self):
+        with self._lock:
+            deltas, self._deltas = self._deltas, Counter()
+        return deltas
+
+    def restore(self, deltas):
+        """Put deltas back after a failed write so they are retried"""
+        with self._lock:
+            self._deltas.update(deltas)
+
+    def apply(self, deltas):
+        if not deltas:
+            return
+        product_table = Product.__table__
+        db.session.execute(
+            product_table.update()
+            .where(product_table.c.id == db.bindparam('b_product_id'))
+            .values(view_count=db.func.coalesce(product_table.c.view_count, 0) + db.bindparam('b_delta')),
+            [{'b_product_id': product_id, 'b_delta': delta} for product_id, delta in deltas.items()]
+        )
+
+class BotHitCounter:
+    """Count bot requests instead of dropping them silently.
+
+    Totals per signature are kept in memory for /api/analytics/health, and
+    hourly totals are written to TrafficRollup.bot_views by the analytics
+    writer.
+    """
+
+    def __init__(self):
+        self.totals = Counter()
+        self._hourly = Counter()
+        self._lock = threading.Lock()
+
+    def add(self, signature):
+        with self._lock:
+            self.totals[signature] += 1
+            self._hourly[hour_bucket(datetime.utcnow())] += 1
+
+    def pending(self):
+        with self._lock:
+            return bool(self._hourly)
+
+    def drain(self):
+        with self._lock:
+            hourly, self._hourly = self._hourly, Counter()
+        return hourly
+
+    def restore(self, hourly):
+        with self._lock:
+            self._hourly.update(hourly)
+
+    def apply(self, hourly):
+        increment_rollup(TrafficRollup, ('hour',), [
+            {'hour': hour, 'views': 0, 'sessions': 0, 'bot_views': count} for hour, count in hourly.items()
+        ])
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.totals.most_common(20))
+
+class SessionTracker:
+    """Process-local VisitorSession state.
+
+    Each tracked page view only updates an entry in a dict (first/last
+    visit, page count, IP, User-Agent). The analytics writer flushes the
+    entries with pending page views as one batched
+    INSERT ... ON CONFLICT (session_id) DO UPDATE, and entries idle for
+    longer than idle_timeout seconds are evicted once flushed.
+    """
+
+    def __init__(self, idle_timeout=1800):
+        self.idle_timeout = idle_timeout
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    def touch(self, session_id, ip_address, user_agent, timestamp):
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is None:
+                entry = self._sessions[session_id] = {
+                    'ip_address': ip_address,
+                    'user_agent': user_agent,
+                    'first_visit': timestamp,
+                    'last_visit': timestamp,
+                    'pending_views': 0,
+                    'persisted': False
+                }
+            entry['last_visit'] = max(entry['last_visit'], timestamp)
+            entry['pending_views'] += 1
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def pending(self):
+        with self._lock:
+            return any(entry['pending_views'] for entry in self._sessions.values())
+
+    def drain(self):
+        """Snapshot entries with pending views and evict idle, flushed ones"""
+        idle_before = datetime.utcnow() - timedelta(seconds=self.idle_timeout)
+        drained = {}
+        with self._lock:
+            for session_id, entry in list(self._sessions.items()):
+                if entry['pending_views']:
+                    drained[session_id] = dict(entry)
+                    entry['pending_views'] = 0
+                elif entry['last_visit'] < idle_before:
+                    del self._sessions[session_id]
+        return drained
+
+    def restore(self, drained):
+        with self._lock:
+            for session_id, snapshot in drained.items():
+                entry = self._sessions.setdefault(session_id, dict(snapshot, pending_views=0))
+                entry['pending_views'] += snapshot['pending_views']
+
+    def apply(self, drained):
+        # Sessions this process has not written yet may still exist in the
+        # database (another worker, or an evicted entry); one SELECT tells
+        # which ones are genuinely new for the session rollup.
+        unpersisted = [session_id for session_id, entry in drained.items() if not entry['persisted']]
+        existing = set()
+        if unpersisted:
+            existing = {session_id for (session_id,) in db.session.query(VisitorSession.session_id).filter(
+                VisitorSession.session_id.in_(unpersisted)
+            )}
+        update_rollups((), [
+            drained[session_id]['first_visit'] for session_id in unpersisted if session_id not in existing
+        ])
+        user_agent_ids = user_agent_dictionary.ids_for({entry['user_agent'] for entry in drained.values()})
+
+        stmt = upsert(VisitorSession)
+        db.session.execute(
+            stmt.on_conflict_do_update(
+                index_elements=['session_id'],
+                set_={
+                    # Another worker may have written a later visit already
+                    'last_visit': greatest(VisitorSession.last_visit, stmt.excluded.last_visit),
+                    'page_views': VisitorSession.page_views + stmt.excluded.page_views
+                }
+            ),
+            [{
+                'session_id': session_id,
+                'ip_address': entry['ip_address'],
+                'user_agent_id': user_agent_ids.get(entry['user_agent']),
+                'first_visit': entry['first_visit'],
+                'last_visit': entry['last_visit'],
+                'page_views': entry['pending_views'],
+                'is_bot': classify_user_agent(entry['user_agent']) is not None
+            } for session_id, entry in drained.items()]
+        )
+
+    def committed(self, drained):
+        """Mark sessions as written once the batch that upserted them is committed"""
+        with self._lock:
+            for session_id in drained:
+                if session_id in self._sessions:
+                    self._sessions[session_id]['persisted'] = True
+
+class StringDictionary:
+    """In-process intern cache in front of a dictionary table (UserAgent, Referrer).
+
+    Maps strings to the integer ids stored in the event tables. Unknown
+    strings are added with INSERT ... ON CONFLICT DO NOTHING and read back,
+    so concurrent workers agree on ids. Lookups run in the caller's
+    transaction; call clear() if that transaction is rolled back, since ids
+    inserted by it were never committed.
+    """
+
+    def __init__(self, model, max_length=None, max_entries=10000):
+        self.model = model
+        self.max_length = max_length
+        self.max_entries = max_entries
+        self._ids = {}
+        self._lock = threading.Lock()
+
+    def _key(self, value):
+        return value[:self.max_length] if self.max_length else value
+
+    def ids_for(self, values):
+        """Return {value: id} for the non-empty values, adding unknown ones to the table"""
+        values = {value for value in values if value}
+        with self._lock:
+            ids = {value: self._ids[self._key(value)] for value in values if self._key(value) in self._ids}
+        missing = {self._key(value) for value in values if value not in ids}
+        if missing:
+            db.session.execute(
+                upsert(self.model).on_conflict_do_nothing(index_elements=['value']),
+                [{'value': value} for value in missing]
+            )
+            found = dict(db.session.query(self.model.value, self.model.id).filter(self.model.value.in_(missing)))
+            with self._lock:
+                if len(self._ids) + len(found) > self.max_entries:
+                    self._ids.clear()
+                self._ids.update(found)
+            ids.update({value: found[self._key(value)] for value in values if value not in ids})
+        return ids
+
+    def values_for(self, ids):
+        """Return {id: value} for the given ids"""
+        ids = {value_id for value_id in ids if value_id}
+        if not ids:
+            return {}
+        return dict(db.session.query(self.model.id, self.model.value).filter(self.model.id.in_(ids)))
+
+    def __len__(self):
+        return len(self._ids)
+
+    def clear(self):
+        with self._lock:
+            self._ids.clear()
+
+class VisitorSketchAccumulator:
+    """Per-product, per-day HyperLogLog sketches built in memory.
+
+    Every product view is added here, even when the raw ProductView row is
+    skipped by sampling, so unique visitor estimates stay unbiased. The
+    analytics writer merges the sketches into product_visitor_sketch.
+    """
+
+    def __init__(self):
+        self._sketches = {}
+        self._lock = threading.Lock()
+
+    def add(self, product_id, ip_address, timestamp):
+        with self._lock:
+            self._sketches.setdefault((product_id, timestamp.date()), HyperLogLog()).add(ip_address)
+
+    def pending(self):
+        with self._lock:
+            return bool(self._sketches)
+
+    def drain(self):
+        with self._lock:
+            sketches, self._sketches = self._sketches, {}
+        return sketches
+
+    def restore(self, sketches):
+        with self._lock:
+            for key, sketch in sketches.items():
+                self._sketches.setdefault(key, HyperLogLog()).merge(sketch)
+
+    def apply(self, sketches):
+        merge_visitor_sketches(sketches)
+
+class SamplingController:
+    """Decide which tracking events are written, and with what weight.
+
+    A fixed SAMPLE_RATE records 1 in N events with sample_weight N. With
+    ADAPTIVE_SAMPLING the rate doubles for every 10% the writer queue is
+    filled beyond half, and grows with write latency above
+    TARGET_WRITE_SECONDS, up to MAX_SAMPLE_RATE. Each kept event carries the
+    rate it was sampled at, so weighted sums stay unbiased.
+    """
+
+    def __init__(self, writer, settings):
+        self.writer = writer
+        self.base_rate = max(int(settings.get('SAMPLE_RATE', 1)), 1)
+        self.adaptive = bool(settings.get('ADAPTIVE_SAMPLING', True))
+        self.max_rate = max(int(settings.get('MAX_SAMPLE_RATE', 64)), self.base_rate)
+        self.target_write_seconds = float(settings.get('TARGET_WRITE_SECONDS', 0.5))
+
+    def current_rate(self):
+        rate = self.base_rate
+        if self.adaptive:
+            # A QUEUE_SIZE of 0 or less is unbounded, so only write latency applies
+            if self.writer.queue.maxsize > 0:
+                fill = self.writer.depth() / self.writer.queue.maxsize
+                if fill > 0.5:
+                    rate *= 2 ** math.ceil((fill - 0.5) * 10)
+            if self.target_write_seconds > 0 and self.writer.write_seconds > self.target_write_seconds:
+                rate *= math.ceil(self.writer.write_seconds / self.target_write_seconds)
+        return min(rate, self.max_rate)
+
+    def sample(self):
+        """Return the weight to record an event with, or 0 to skip it"""
+        rate = self.current_rate()
+        if rate <= 1:
+            return 1
+        return rate if random.random() < 1.0 / rate else 0
+
+class AnalyticsWriter:
+    """Buffer tracking events in memory and write them to the database in batches.
+
+    Request handlers only put events on a bounded queue; a background thread
+    drains it and issues bulk INSERTs once BATCH_SIZE events are waiting or
+    FLUSH_INTERVAL seconds have passed. When the queue is full the configured
+    drop policy decides which event is lost, so a traffic spike costs
+    analytics accuracy instead of page latency. A batch whose write fails is
+    retried with the next batches, up to WRITE_ATTEMPTS times in all; after
+    that it is dropped together with the in-memory counters drained for it.
+    """
+
+    def __init__(self, flask_app, settings, accumulators=()):
+        self.app = flask_app
+        # In-memory counters (view counts, bot hits) applied with every write;
+        # an optional committed(pending) hook runs once that write is committed
+        self.accumulators = list(accumulators)
+        self.async_mode = bool(settings.get('ASYNC', True))
+        self.batch_size = int(settings.get('BATCH_SIZE', 500))
+        self.flush_interval = float(settings.get('FLUSH_INTERVAL', 2.0))
+        self.drop_policy = settings.get('DROP_POLICY', 'drop_newest')
+        self.queue = queue.Queue(maxsize=int(settings.get('QUEUE_SIZE', 10000)))
+        self.write_attempts = max(int(settings.get('WRITE_ATTEMPTS', 3)), 1)
+        self.stats = {'queued': 0, 'written': 0, 'dropped': 0, 'failed': 0, 'retried': 0}
+        self.write_seconds = 0.0  # Moving average of batch write time
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._retries = deque()  # (batch, attempt) of failed writes
+        # flush() asks the background thread to write what it holds and waits for the ack
+        self._flush_requested = threading.Event()
+        self._flushed = threading.Condition()
+        self._flush_requests = 0
+        self._flushes_done = 0
+        self._stop = threading.Event()
+        self._thread = None
+        self._pid = None
+
+    def submit(self, kind, record):
+        """Queue a tracking event; never blocks the calling request"""
+        if not self.async_mode:
+            self._write([(kind, record)])
+            while self._retries:
+                self._drain()
+            return
+        self._ensure_started()
+        try:
+            self.queue.put_nowait((kind, record))
+        except queue.Full:
+            if self.drop_policy == 'drop_oldest':
+                try:
+                    self.queue.get_nowait()
+                    self.queue.put_nowait((kind, record))
+                except (queue.Empty, queue.Full):
+                    pass
+            with self._lock:
+                self.stats['dropped'] += 1
+            return
+        with self._lock:
+            self.stats['queued'] += 1
+
+    def submit_many(self, kind, records):
+        """Queue the events of one request; without a background thread they share one transaction"""
+        if not self.async_mode:
+            if records:
+                self._write([(kind, record) for record in records])
+            while self._retries:
+                self._drain()
+            return
+        for record in records:
+            self.submit(kind, record)
+
+    def depth(self):
+        return self.queue.qsize()
+
+    def flush(self, timeout=None):
+        """Write every event submitted so far; when it returns they are in the database.
+
+        With a running background thread, that thread writes the batch it is
+        collecting and drains the queue before acknowledging; otherwise the
+        queue is written from the calling thread.
+        """
+        thread = self._thread
+        if thread and thread.is_alive() and self._pid == os.getpid() and thread is not threading.current_thread():
+            deadline = None if timeout is None else time.monotonic() + timeout
+            with self._flushed:
+                self._flush_requests += 1
+                target = self._flush_requests
+                self._flush_requested.set()
+                # Polled, so a writer thread that died does not leave the caller waiting forever
+                while self._flushes_done < target and thread.is_alive():
+                    remaining = 1.0 if deadline is None else min(deadline - time.monotonic(), 1.0)
+                    if remaining <= 0:
+                        break
+                    self._flushed.wait(remaining)
+                if self._flushes_done >= target:
+                    return
+        self._drain()
+
+    def _drain(self):
+        """Write the queued events, and retry failed batches, from the calling thread"""
+        for _ in range(len(self._retries)):
+            batch, attempt = self._retries.popleft()
+            self._write(batch, attempt)
+        batch = []
+        while True:
+            try:
+                batch.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+            if len(batch) >= self.batch_size:
+                self._write(batch)
+                batch = []
+        if batch or self._accumulators_pending():
+            self._write(batch)
+
+    def stop(self):
+        """Stop the background thread and flush whatever is left"""
+        self._stop.set()
+        if self._thread and self._thread.is_alive():
+            self._thread.join(timeout=self.flush_interval + 5)
+        self._drain()
+
+    def _ensure_started(self):
+        # Checked against the pid so a forked worker starts its own thread
+        if self._thread and self._thread.is_alive() and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread and self._thread.is_alive() and self._pid == os.getpid():
+                return
+            if self._pid is None:
+                atexit.register(self.stop)
+            self._pid = os.getpid()
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='analytics-writer', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while not self._stop.is_set():
+            batch = self._collect()
+            if batch or self._accumulators_pending():
+                self._write(batch)
+            for _ in range(len(self._retries)):
+                self._write(*self._retries.popleft())
+            if self._flush_requested.is_set():
+                with self._flushed:
+                    target = self._flush_requests
+                    self._flush_requested.clear()
+                # Everything submitted before the request is now written or queued
+                self._drain()
+                with self._flushed:
+                    self._flushes_done = target
+                    self._flushed.notify_all()
+
+    def _collect(self):
+        batch = []
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size and not self._stop.is_set() and not self._flush_requested.is_set():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.queue.get(timeout=min(remaining, 0.5)))
+            except queue.Empty:
+                continue
+        return batch
+
+    def _accumulators_pending(self):
+        return any(accumulator.pending() for accumulator in self.accumulators)
+
+    def _write(self, batch, attempt=1):
+        page_views = [record for kind, record in batch if kind == 'page_view']
+        product_views = [record for kind, record in batch if kind == 'product_view']
+        with self._write_lock, self.app.app_context():
+            drained = [(accumulator, accumulator.drain()) for accumulator in self.accumulators]
+            started = time.monotonic()
+            try:
+                encode_event_strings(page_views + product_views)
+                if page_views:
+                    db.session.execute(db.insert(PageView), [
+                        {key: record[key] for key in PAGE_VIEW_FIELDS} for record in page_views
+                    ])
+                    update_rollups(page_views)
+                if product_views:
+                    db.session.execute(db.insert(ProductView), product_views)
+                for accumulator, pending in drained:
+                    if pending:
+                        accumulator.apply(pending)
+                db.session.commit()
+                for accumulator, pending in drained:
+                    if pending and hasattr(accumulator, 'committed'):
+                        accumulator.committed(pending)
+                self.write_seconds = 0.8 * self.write_seconds + 0.2 * (time.monotonic() - started)
+                with self._lock:
+                    self.stats['written'] += len(batch)
+            except Exception as e:
+                db.session.rollback()
+                for dictionary in EVENT_DICTIONARIES.values():
+                    dictionary.clear()
+                if attempt < self.write_attempts:
+                    # Counters and events go back together, so rollups and raw rows stay in step
+                    for accumulator, pending in drained:
+                        accumulator.restore(pending)
+                    self._retries.append((batch, attempt + 1))
+                    with self._lock:
+                        self.stats['retried'] += len(batch)
+                    logger.error(f"Error writing analytics batch of {len(batch)} events (attempt {attempt}), will retry: {e}")
+                    return
+                with self._lock:
+                    self.stats['failed'] += len(batch)
+                logger.error(f"Error writing analytics batch of {len(batch)} events, dropping it and its counters: {e}")
+
+class LiveAnalytics:
+    """Shared aggregator behind /api/analytics/stream.
+
+    track_page_view records each hit here in memory. Once per TICK_INTERVAL
+    the pending counts are published as one numbered delta (new views, new
+    sessions, per-path view increments) that every connected dashboard
+    receives, so server cost no longer grows with open tabs. Ticks also run
+    as views are recorded, so pending counts never hold more than one
+    interval of traffic; with no dashboard subscribed they are discarded,
+    since a dashboard that connects later renders those views itself.
+    """
+
+    def __init__(self, tick_interval=5, history=120, max_pages=500):
+        self.tick_interval = tick_interval
+        self.max_pages = max_pages  # Distinct paths per delta; further paths only count in the totals
+        self._condition = threading.Condition()
+        self._deltas = deque(maxlen=history)
+        self._seq = 0
+        self._subscribers = 0
+        self._last_tick = time.monotonic()
+        self._reset_pending()
+
+    def _reset_pending(self):
+        self._new_views = 0
+        self._new_sessions = 0
+        self._pages = Counter()
+        self._titles = {}
+
+    def record_page_view(self, page_path, page_title, new_session):
+        with self._condition:
+            self._tick_if_due()
+            self._new_views += 1
+            self._new_sessions += 1 if new_session else 0
+            if page_path in self._pages or len(self._pages) < self.max_pages:
+                self._pages[page_path] += 1
+                self._titles[page_path] = page_title
+
+    def subscribe(self):
+        with self._condition:
+            if not self._subscribers:
+                # Views recorded so far are in the totals the new dashboard rendered
+                self._reset_pending()
+                self._last_tick = time.monotonic()
+            self._subscribers += 1
+
+    def unsubscribe(self):
+        with self._condition:
+            self._subscribers -= 1
+
+    def current_seq(self):
+        with self._condition:
+            return self._seq
+
+    def _tick_if_due(self):
+        now = time.monotonic()
+        if now - self._last_tick < self.tick_interval:
+            return
+        self._last_tick = now
+        if not self._subscribers:
+            self._reset_pending()
+            return
+        if not self._new_views:
+            return
+        self._seq += 1
+        self._deltas.append({
+            'seq': self._seq,
+            'date': datetime.utcnow().date().isoformat(),
+            'new_views': self._new_views,
+            'new_sessions': self._new_sessions,
+            'pages': [{'path': path, 'title': self._titles[path], 'views': views} for path, views in self._pages.most_common()]
+        })
+        self._reset_pending()
+        self._condition.notify_all()
+
+    def wait_for(self, after_seq, timeout=15):
+        """Block until deltas newer than after_seq exist or timeout; return them"""
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            while True:
+                self._tick_if_due()
+                deltas = [delta for delta in self._deltas if delta['seq'] > after_seq]
+                remaining = deadline - time.monotonic()
+                if deltas or remaining <= 0:
+                    return deltas
+                next_tick = self._last_tick + self.tick_interval - time.monotonic()
+                self._condition.wait(max(min(remaining, next_tick), 0.05))
+
+live_analytics = LiveAnalytics(config['LIVE_ANALYTICS']['TICK_INTERVAL'], config['LIVE_ANALYTICS']['HISTORY'])
+
+PAGE_VIEW_FIELDS = ('page_url', 'page_title', 'user_agent_id', 'ip_address', 'referrer_id', 'session_id', 'sample_weight', 'created_at')
+
+user_agent_dictionary = StringDictionary(UserAgent)
+referrer_dictionary = StringDictionary(Referrer, max_length=500)
+# Event record keys that are stored as <key>_id into a dictionary table
+EVENT_DICTIONARIES = {'user_agent': user_agent_dictionary, 'referrer': referrer_dictionary}
+
+def encode_event_strings(records, keys=EVENT_DICTIONARIES):
+    """Replace the dictionary-encoded strings of event records with their ids, in place"""
+    for key in keys:
+        present = [record for record in records if key in record]
+        if present:
+            ids = EVENT_DICTIONARIES[key].ids_for({record[key] for record in present})
+            for record in present:
+                record[f'{key}_id'] = ids.get(record.pop(key))
+
+def decode_event_strings(records, keys=EVENT_DICTIONARIES):
+    """Replace the dictionary ids of event records with their strings, in place"""
+    for key in keys:
+        present = [record for record in records if f'{key}_id' in record]
+        if present:
+            values = EVENT_DICTIONARIES[key].values_for({record[f'{key}_id'] for record in present})
+            for record in present:
+                record[key] = values.get(record.pop(f'{key}_id'))
+
+view_counts = ViewCountAccumulator()
+bot_hits = BotHitCounter()
+visitor_sessions = SessionTracker(config['ANALYTICS']['SESSION_IDLE_TIMEOUT'])
+visitor_sketches = VisitorSketchAccumulator()
+analytics_writer = AnalyticsWriter(app, config['ANALYTICS'], (view_counts, bot_hits, visitor_sessions, visitor_sketches))
+sampler = SamplingController(analytics_writer, config['ANALYTICS'])
 
 def track_page_view(page_url, page_title=None):
     """Track a page view"""
     try:
         # Get session ID
         session_id = session.get('visitor_session_id')
-        if not session_id:
+        new_session = not session_id
+        if new_session:
             session_id = secrets.token_hex(16)
             session['visitor_session_id'] = session_id
         
@@ -284,98 +1746,360 @@ def track_page_view(page_url, page_title=None):
         if '/admin/' in page_url or '/dashboard' in page_url:
             return
         
-        # Skip if it's a bot
-        if is_bot(user_agent):
+        # Count bots without recording a page view
+        bot_signature = classify_user_agent(user_agent)
+        if bot_signature:
+            bot_hits.add(bot_signature)
             return
         
-        # Create page view record
-        page_view = PageView(
-            page_url=page_url,
-            page_title=page_title,
-            user_agent=user_agent,
-            ip_address=ip_address,
-            referrer=referrer,
-            session_id=session_id
-        )
-        db.session.add(page_view)
-        
-        # Update or create visitor session
-        visitor_session = VisitorSession.query.filter_by(session_id=session_id).first()
-        if visitor_session:
-            visitor_session.last_visit = datetime.utcnow()
-            visitor_session.page_views += 1
-        else:
-            visitor_session = VisitorSession(
-                session_id=session_id,
-                ip_address=ip_address,
-                user_agent=user_agent,
-                is_bot=is_bot(user_agent)
-            )
-            db.session.add(visitor_session)
-        
-        db.session.commit()
+        # Queue the page view; the visitor session is upserted with the next batch
+        now = datetime.utcnow()
+        visitor_sessions.touch(session_id, ip_address, user_agent, now)
+        live_analytics.record_page_view(request.path, page_title, new_session)
+        sample_weight = sampler.sample()
+        if not sample_weight:
+            return
+        analytics_writer.submit('page_view', {
+            'page_url': page_url,
+            'page_title': page_title,
+            'user_agent': user_agent,
+            'ip_address': ip_address,
+            'referrer': referrer,
+            'session_id': session_id,
+            'sample_weight': sample_weight,
+            'created_at': now
+        })
     except Exception as e:
-        db.session.rollback()
         print(f"Error tracking page view: {e}")
 
+def upsert(model):
+    """INSERT ... ON CONFLICT statement for the configured database dialect"""
+    if db.engine.dialect.name == 'postgresql':
+        return postgresql_dialect.insert(model)
+    return sqlite_dialect.insert(model)
+
+def greatest(*values):
+    """SQL expression for the largest of values (SQLite's max() with several arguments)"""
+    if db.engine.dialect.name == 'postgresql':
+        return db.func.greatest(*values)
+    return db.func.max(*values)
+
+def increment_rollup(model, keys, rows, extra_set=()):
+    """Add the counter columns of rows onto existing rollup rows"""
+    if not rows:
+        return
+    stmt = upsert(model)
+    counters = [name for name in rows[0] if name not in keys and name not in extra_set]
+    set_ = {name: getattr(model, name) + getattr(stmt.excluded, name) for name in counters}
+    set_.update({name: getattr(stmt.excluded, name) for name in extra_set})
+    db.session.execute(stmt.on_conflict_do_update(index_elements=list(keys), set_=set_), rows)
+
+def hour_bucket(timestamp):
+    return timestamp.replace(minute=0, second=0, microsecond=0)
+
+def update_rollups(page_views, new_sessions=()):
+    """Fold page view records and new session start times into the rollup tables.
+
+    Records carry referrer_id (see encode_event_strings). Sampled records count for their sample_weight, so rollups stay unbiased.
+    """
+    traffic = {}
+    pages = {}
+    referrers = Counter()
+    for record in page_views:
+        weight = record.get('sample_weight') or 1
+        hour = hour_bucket(record['created_at'])
+        traffic.setdefault(hour, {'hour': hour, 'views': 0, 'sessions': 0, 'bot_views': 0})['views'] += weight
+        page = pages.setdefault((record['created_at'].date(), record['page_url']), {
+            'day': record['created_at'].date(),
+            'page_url': record['page_url'],
+            'page_title': record['page_title'],
+            'views': 0
+        })
+        page['views'] += weight
+        page['page_title'] = record['page_title'] or page['page_title']
+        if record['referrer_id']:
+            referrers[(record['created_at'].date(), record['referrer_id'])] += weight
+    for first_visit in new_sessions:
+        hour = hour_bucket(first_visit)
+        traffic.setdefault(hour, {'hour': hour, 'views': 0, 'sessions': 0, 'bot_views': 0})['sessions'] += 1
+
+    increment_rollup(TrafficRollup, ('hour',), list(traffic.values()))
+    increment_rollup(PageRollup, ('day', 'page_url'), list(pages.values()), extra_set=('page_title',))
+    increment_rollup(ReferrerRollup, ('day', 'referrer_id'), [
+        {'day': day, 'referrer_id': referrer_id, 'views': views} for (day, referrer_id), views in referrers.items()
+    ])
+
+def rebuild_rollups(since=None, batch_size=5000):
+    """Recompute the rollup tables from the raw PageView and VisitorSession rows.
+
+    Used to backfill existing databases and to repair the rollups after raw
+    rows have been edited by hand. Archived page views are included, so
+    rebuilding never loses days that retention already moved out of the
+    database. With since, only days from that date on are rebuilt.
+    """
+    since_day = since.date() if isinstance(since, datetime) else since
+    since_hour = datetime.combine(since_day, datetime.min.time()) if since_day else None
+
+    for model, column in ((TrafficRollup, TrafficRollup.hour), (PageRollup, PageRollup.day), (ReferrerRollup, ReferrerRollup.day)):
+        query = model.query
+        if since_day:
+            query = query.filter(column >= (since_hour if model is TrafficRollup else since_day))
+        if model is TrafficRollup:
+            # Bot hits have no raw rows to rebuild from, so keep them
+            query.update({'views': 0, 'sessions': 0}, synchronize_session=False)
+        else:
+            query.delete(synchronize_session=False)
+
+    page_views = PageView.query.order_by(PageView.id)
+    sessions = VisitorSession.query.filter(VisitorSession.is_bot == False)
+    if since_hour:
+        page_views = page_views.filter(PageView.created_at >= since_hour)
+        sessions = sessions.filter(VisitorSession.first_visit >= since_hour)
+
+    def archived_page_views():
+        # Skip rows whose archive batch was written but not yet deleted
+        batch = []
+        for row in iter_archived_events('page_view', since_hour):
+            batch.append(row)
+            if len(batch) >= batch_size:
+                yield from drop_live_rows(batch)
+                batch = []
+        yield from drop_live_rows(batch)
+
+    def drop_live_rows(rows):
+        live_ids = {row_id for (row_id,) in db.session.query(PageView.id).filter(PageView.id.in_([row['id'] for row in rows]))}
+        rows = [row for row in rows if row['id'] not in live_ids]
+        encode_event_strings(rows, keys=('referrer',))
+        return rows
+
+    batch = []
+    for record in archived_page_views():
+        batch.append(record)
+        if len(batch) >= batch_size:
+            update_rollups(batch)
+            batch = []
+    for page_view in page_views.yield_per(batch_size):
+        batch.append({key: getattr(page_view, key) for key in PAGE_VIEW_FIELDS})
+        if len(batch) >= batch_size:
+            update_rollups(batch)
+            batch = []
+    update_rollups(batch, [first_visit for (first_visit,) in sessions.with_entities(VisitorSession.first_visit)])
+    db.session.commit()
+
+def update_visitor_sketches(product_views):
+    """Add the visitor IPs of product view records to the per-product, per-day sketches"""
+    sketches = {}
+    for record in product_views:
+        key = (record['product_id'], record['created_at'].date())
+        sketches.setdefault(key, HyperLogLog()).add(record['ip_address'])
+    merge_visitor_sketches(sketches)
+
+def merge_visitor_sketches(sketches):
+    """Merge {(product_id, day): HyperLogLog} into the stored sketches"""
+    if not sketches:
+        return
+
+    existing = db.session.query(
+        ProductVisitorSketch.product_id, ProductVisitorSketch.day, ProductVisitorSketch.registers
+    ).filter(
+        db.tuple_(ProductVisitorSketch.product_id, ProductVisitorSketch.day).in_(list(sketches))
+    )
+    for product_id, day, registers in existing:
+        sketches[(product_id, day)].merge(HyperLogLog.from_bytes(registers))
+
+    stmt = upsert(ProductVisitorSketch)
+    db.session.execute(
+        stmt.on_conflict_do_update(
+            index_elements=['product_id', 'day'],
+            set_={'registers': stmt.excluded.registers}
+        ),
+        [{'product_id': product_id, 'day': day, 'registers': sketch.to_bytes()}
+         for (product_id, day), sketch in sketches.items()]
+    )
+
+def rebuild_visitor_sketches(batch_size=5000):
+    """Recompute all visitor sketches from ProductView rows and their archives"""
+    ProductVisitorSketch.query.delete(synchronize_session=False)
+    batch = []
+    live_rows = ({'product_id': row.product_id, 'ip_address': row.ip_address, 'created_at': row.created_at}
+                 for row in ProductView.query.order_by(ProductView.id).yield_per(batch_size))
+    for source in (iter_archived_events('product_view'), live_rows):
+        for record in source:
+            batch.append(record)
+            if len(batch) >= batch_size:
+                update_visitor_sketches(batch)
+                batch = []
+    update_visitor_sketches(batch)
+    db.session.commit()
+
+def estimate_unique_visitors(product_id, start_date):
+    """Merge the product's daily visitor sketches from start_date on"""
+    merged = HyperLogLog()
+    for (registers,) in db.session.query(ProductVisitorSketch.registers).filter(
+        ProductVisitorSketch.product_id == product_id,
+        ProductVisitorSketch.day >= start_date.date()
+    ):
+        merged.merge(HyperLogLog.from_bytes(registers))
+    return merged.estimate()
+
+def reconcile_view_counts():
+    """Recompute Product.view_count from the ProductView rows and their archives.
+
+    Rows count for their sample_weight, so counts rebuilt from sampled
+    periods are estimates. Returns the number of products whose stored count was corrected.
+    """
+    actual_counts = db.session.query(
+        ProductView.product_id,
+        db.func.sum(ProductView.sample_weight)
+    ).group_by(ProductView.product_id).all()
+    actual_counts = Counter({product_id: int(views) for product_id, views in actual_counts})
+    for row in iter_archived_events('product_view'):
+        actual_counts[row['product_id']] += row['sample_weight']
+
+    corrected = 0
+    for product in Product.query.all():
+        actual = actual_counts.get(product.id, 0)
+        if product.view_count != actual:
+            product.view_count = actual
+            corrected += 1
+    db.session.commit()
+    return corrected
+
+class ResultCache:
+    """Keyed TTL cache for expensive query results.
+
+    Recomputation is single-flight: when an entry expires, one caller
+    rebuilds it while concurrent callers for the same key wait and reuse the
+    fresh result, so N open dashboards cost one query set per TTL.
+    """
+
+    def __init__(self, ttl, max_entries=256):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.stats = {'hits': 0, 'misses': 0}
+        self._entries = OrderedDict()  # key -> (expires_at, value)
+        self._key_locks = {}
+        self._lock = threading.Lock()
+
+    def _fresh(self, key):
+        entry = self._entries.get(key)
+        if entry and entry[0] > time.monotonic():
+            self.stats['hits'] += 1
+            return entry
+        return None
+
+    def get_or_compute(self, key, compute):
+        with self._lock:
+            entry = self._fresh(key)
+            if entry:
+                return entry[1]
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+
+        with key_lock:
+            with self._lock:
+                entry = self._fresh(key)
+                if entry:
+                    return entry[1]
+                self.stats['misses'] += 1
+            value = compute()
+            with self._lock:
+                self._entries[key] = (time.monotonic() + self.ttl, value)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    evicted, _ = self._entries.popitem(last=False)
+                    self._key_locks.pop(evicted, None)
+            return value
+
+    def invalidate(self):
+        with self._lock:
+            self._entries.clear()
+            # Waiters still hold their lock; new callers simply get a fresh one
+            self._key_locks.clear()
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.stats, entries=len(self._entries), ttl=self.ttl)
+
+analytics_cache = ResultCache(config['CACHE']['ANALYTICS_TTL'], config['CACHE']['MAX_ENTRIES'])
+
+# Analytics ranges accepted from ?days=, so a request cannot build a cache entry per integer
+MAX_ANALYTICS_DAYS = 730
+
+def analytics_days(days):
+    return min(max(30 if days is None else days, 1), MAX_ANALYTICS_DAYS)
+
+def get_cached_analytics_data(days=30):
+    days = analytics_days(days)
+    return analytics_cache.get_or_compute(('site', days), lambda: get_analytics_data(days))
+
+def get_cached_product_analytics(product_id, days=30, include_archive=False, exact=False):
+    days = analytics_days(days)
+    return analytics_cache.get_or_compute(
+        ('product', product_id, days, include_archive, exact),
+        lambda: get_product_analytics(product_id, days, include_archive=include_archive, exact=exact)
+    )
+
 def get_analytics_data(days=30):
-    """Get analytics data for the specified number of days"""
-    from datetime import timedelta
+    """Get analytics data for the specified number of days from the rollup tables"""
     end_date = datetime.utcnow()
     start_date = end_date - timedelta(days=days)
+    start_hour = hour_bucket(start_date)
+    start_day = start_date.date()
     
-    # Page views
-    total_views = PageView.query.filter(PageView.created_at >= start_date).count()
-    
-    # Unique visitors
-    unique_visitors = VisitorSession.query.filter(
-        VisitorSession.first_visit >= start_date,
-        VisitorSession.is_bot == False
-    ).count()
+    # Page views and unique visitors
+    totals = db.session.query(
+        db.func.coalesce(db.func.sum(TrafficRollup.views), 0),
+        db.func.coalesce(db.func.sum(TrafficRollup.sessions), 0),
+        db.func.coalesce(db.func.sum(TrafficRollup.bot_views), 0)
+    ).filter(TrafficRollup.hour >= start_hour).one()
+    total_views, unique_visitors, bot_views = int(totals[0]), int(totals[1]), int(totals[2])
     
     # Most visited pages
     popular_pages = db.session.query(
-        PageView.page_url,
-        PageView.page_title,
-        db.func.count(PageView.id).label('views')
+        PageRollup.page_url,
+        db.func.max(PageRollup.page_title),
+        db.func.sum(PageRollup.views).label('views')
     ).filter(
-        PageView.created_at >= start_date
+        PageRollup.day >= start_day
     ).group_by(
-        PageView.page_url, PageView.page_title
+        PageRollup.page_url
     ).order_by(
-        db.func.count(PageView.id).desc()
+        db.func.sum(PageRollup.views).desc()
     ).limit(10).all()
     
     # Daily views
     daily_views = db.session.query(
-        db.func.date(PageView.created_at).label('date'),
-        db.func.count(PageView.id).label('views')
+        db.func.date(TrafficRollup.hour).label('date'),
+        db.func.sum(TrafficRollup.views).label('views')
     ).filter(
-        PageView.created_at >= start_date
+        TrafficRollup.hour >= start_hour,
+        TrafficRollup.views > 0
     ).group_by(
-        db.func.date(PageView.created_at)
+        db.func.date(TrafficRollup.hour)
     ).order_by('date').all()
     
-    # Referrers
-    referrers = db.session.query(
-        PageView.referrer,
-        db.func.count(PageView.id).label('count')
+    # Referrers, grouped on the integer id and resolved to strings for the top 10
+    top_referrers = db.session.query(
+        ReferrerRollup.referrer_id,
+        db.func.sum(ReferrerRollup.views).label('count')
     ).filter(
-        PageView.created_at >= start_date,
-        PageView.referrer.isnot(None),
-        PageView.referrer != ''
-    ).group_by(PageView.referrer).order_by(
-        db.func.count(PageView.id).desc()
-    ).limit(10).all()
+        ReferrerRollup.day >= start_day
+    ).group_by(ReferrerRollup.referrer_id).order_by(
+        db.func.sum(ReferrerRollup.views).desc()
+    ).limit(10).subquery()
+    referrers = db.session.query(Referrer.value, top_referrers.c.count).join(
+        top_referrers, Referrer.id == top_referrers.c.referrer_id
+    ).order_by(top_referrers.c.count.desc()).all()
     
     # Convert Row objects to dictionaries for JSON serialization
-    popular_pages_list = [{'url': pp[0], 'title': pp[1], 'views': pp[2]} for pp in popular_pages]
-    daily_views_list = [{'date': str(dv[0]), 'views': dv[1]} for dv in daily_views]
-    referrers_list = [{'referrer': ref[0], 'count': ref[1]} for ref in referrers]
+    popular_pages_list = [{'url': pp[0], 'title': pp[1], 'views': int(pp[2])} for pp in popular_pages]
+    daily_views_list = [{'date': str(dv[0]), 'views': int(dv[1])} for dv in daily_views]
+    referrers_list = [{'referrer': ref[0], 'count': int(ref[1])} for ref in referrers]
     
     return {
         'total_views': total_views,
         'unique_visitors': unique_visitors,
+        'bot_views': bot_views,
         'popular_pages': popular_pages_list,
         'daily_views': daily_views_list,
         'referrers': referrers_list
@@ -391,6 +2115,637 @@ def get_pdf_page_count(pdf_path):
         logger.error(f"Error reading PDF {pdf_path}: {e}")
         return 0
 
+# Catalog page images. Pages are rasterised with PyMuPDF when installed, or
+# poppler's pdftoppm, to WebP at each of PDF_PAGES.WIDTHS and cached under
+# <FOLDER>/<sha256 of the PDF>/, so a replaced catalog never serves stale pages.
+PDF_RENDERER = 'pymupdf' if pymupdf else ('pdftoppm' if shutil.which('pdftoppm') else None)
+
+@functools.lru_cache(maxsize=128)
+def cached_file_hash(path, mtime):
+    return hash_file(path)
+
+def pdf_content_hash(pdf_catalog):
+    """SHA-256 of a catalog: its content-addressed name, or the hash of a file uploaded before the store"""
+    stem = os.path.splitext(pdf_catalog)[0]
+    if CONTENT_ADDRESS_PATTERN.match(stem):
+        return stem
+    path = os.path.join(app.config['UPLOAD_FOLDER'], pdf_catalog)
+    return cached_file_hash(path, os.path.getmtime(path))
+
+def pdf_page_folder(pdf_catalog):
+    return os.path.join(config['PDF_PAGES']['FOLDER'], pdf_content_hash(pdf_catalog))
+
+def pdf_page_image_path(folder, page_number, width):
+    return os.path.join(folder, f"{page_number:04d}-{width}.webp")
+
+def render_pdf_page(pdf_path, page_number, folder, widths, quality):
+    """Rasterise one page at the largest width and save WebP images at every width.
+
+    A top-level function so it can run in a process pool. Returns the widths written.
+    """
+    widths = sorted(widths)
+    if PDF_RENDERER == 'pymupdf':
+        with pymupdf.open(pdf_path) as document:
+            page = document[page_number - 1]
+            zoom = widths[-1] / page.rect.width
+            pixmap = page.get_pixmap(matrix=pymupdf.Matrix(zoom, zoom), alpha=False)
+            image = Image.frombytes('RGB', (pixmap.width, pixmap.height), pixmap.samples)
+    elif PDF_RENDERER == 'pdftoppm':
+        output = subprocess.run(
+            ['pdftoppm', '-f', str(page_number), '-l', str(page_number), '-scale-to-x', str(widths[-1]),
+             '-scale-to-y', '-1', '-png', pdf_path],
+            check=True, capture_output=True, timeout=120
+        ).stdout
+        image = Image.open(io.BytesIO(output)).convert('RGB')
+    else:
+        raise RuntimeError('No PDF renderer available (install PyMuPDF or poppler-utils)')
+    
+    for width in widths:
+        resized = image if image.width <= width else image.resize(
+            (width, max(round(image.height * width / image.width), 1)), Image.LANCZOS)
+        buffer = io.BytesIO()
+        resized.save(buffer, 'WEBP', quality=quality, method=4)
+        write_file_atomic(pdf_page_image_path(folder, page_number, width), buffer.getvalue())
+    return widths
+
+def render_pdf_pages(pdf_catalog, page_count, settings=None):
+    """Render every page of a catalog that is not cached yet, on a process pool.
+
+    Returns the number of pages rendered.
+    """
+    settings = settings or config['PDF_PAGES']
+    if not PDF_RENDERER or not page_count:
+        return 0
+    pdf_path = os.path.join(app.config['UPLOAD_FOLDER'], pdf_catalog)
+    folder = pdf_page_folder(pdf_catalog)
+    widths = sorted(settings['WIDTHS'])
+    pages = [
+        page_number for page_number in range(1, page_count + 1)
+        if not os.path.exists(pdf_page_image_path(folder, page_number, widths[-1]))
+    ]
+    if not pages:
+        return 0
+    with ProcessPoolExecutor(max_workers=settings['WORKERS'] or None) as pool:
+        list(pool.map(render_pdf_page, [pdf_path] * len(pages), pages, [folder] * len(pages),
+                      [widths] * len(pages), [settings['QUALITY']] * len(pages)))
+    return len(pages)
+
+# Catalog optimisation, built on PyPDF2: content streams are Flate-compressed,
+# identical fonts and images are shared and oversized images are downsampled
+# to JPEG. qpdf, when installed, then linearises the result.
+class PdfObjectTooDeep(Exception):
+    pass
+
+def pdf_object_key(obj):
+    """Digest of a PDF object's content, following references, for spotting duplicates"""
+    digest = hashlib.sha256()
+    
+    def feed(value, depth):
+        if depth > 10:
+            raise PdfObjectTooDeep()
+        if isinstance(value, IndirectObject):
+            value = value.get_object()
+        if isinstance(value, StreamObject):
+            digest.update(b'stream')
+            digest.update(value._data)
+        if isinstance(value, DictionaryObject):
+            for key in sorted(value):
+                if key not in ('/Length', '/Parent'):
+                    digest.update(key.encode())
+                    feed(value[key], depth + 1)
+        elif isinstance(value, ArrayObject):
+            for item in value:
+                feed(item, depth + 1)
+        else:
+            digest.update(repr(value).encode())
+    
+    feed(obj, 0)
+    return digest.hexdigest()
+
+def downsample_pdf_image(image, max_size, quality):
+    """Re-encode an image XObject larger than max_size pixels as a smaller JPEG, in place.
+
+    Only 8-bit RGB/grey images stored as JPEG or Flate are touched; anything
+    else (masks, indexed or CMYK colour, decode arrays) is left as it is.
+    Returns True when the image was replaced.
+    """
+    width, height = int(image.get('/Width', 0)), int(image.get('/Height', 0))
+    if max(width, height) <= max_size or '/Mask' in image or '/Decode' in image or image.get('/ImageMask'):
+        return False
+    filters = pdf_filters(image)
+    colorspace = image.get('/ColorSpace')
+    if filters == ['/DCTDecode']:
+        picture = Image.open(io.BytesIO(image._data))
+        picture.load()
+    elif filters in ([], ['/FlateDecode']) and image.get('/BitsPerComponent') == 8 and colorspace in ('/DeviceRGB', '/DeviceGray'):
+        picture = Image.frombytes('RGB' if colorspace == '/DeviceRGB' else 'L', (width, height), image.get_data())
+    else:
+        return False
+    if picture.mode not in ('RGB', 'L'):
+        return False
+    
+    scale = max_size / max(width, height)
+    picture = picture.resize((max(round(width * scale), 1), max(round(height * scale), 1)), Image.LANCZOS)
+    buffer = io.BytesIO()
+    picture.save(buffer, 'JPEG', quality=quality, optimize=True)
+    if buffer.tell() >= len(image._data):
+        return False
+    image._data = buffer.getvalue()
+    if hasattr(image, 'decoded_self'):
+        image.decoded_self = None
+    image[NameObject('/Width')] = NumberObject(picture.width)
+    image[NameObject('/Height')] = NumberObject(picture.height)
+    image[NameObject('/Filter')] = NameObject('/DCTDecode')
+    image[NameObject('/ColorSpace')] = NameObject('/DeviceRGB' if picture.mode == 'RGB' else '/DeviceGray')
+    image[NameObject('/BitsPerComponent')] = NumberObject(8)
+    if '/DecodeParms' in image:
+        del image['/DecodeParms']
+    return True
+
+def pdf_filters(stream):
+    filters = stream.get('/Filter', [])
+    return list(filters) if isinstance(filters, ArrayObject) else [filters] if filters else []
+
+def compress_pdf_stream(stream):
+    """Flate-compress a stream stored uncompressed or with a text filter, in place"""
+    if pdf_filters(stream) not in ([], ['/ASCIIHexDecode'], ['/ASCII85Decode'], ['/LZWDecode']):
+        return False
+    stream._data = zlib.compress(stream.get_data(), 9)
+    if hasattr(stream, 'decoded_self'):
+        stream.decoded_self = None
+    stream[NameObject('/Filter')] = NameObject('/FlateDecode')
+    if '/DecodeParms' in stream:
+        del stream['/DecodeParms']
+    return True
+
+def optimize_pdf(source_path, target_path, settings=None):
+    """Write an optimised copy of a PDF to target_path.
+
+    Returns stats: images downsampled, duplicate fonts/images merged and
+    whether the file was linearised (needs the qpdf command).
+    """
+    settings = settings or config['PDF_OPTIMIZE']
+    stats = {'streams_compressed': 0, 'images_downsampled': 0, 'objects_merged': 0, 'linearized': False}
+    reader = PyPDF2.PdfReader(source_path)
+    if reader.is_encrypted:
+        raise ValueError('Encrypted PDFs are not optimised')
+    
+    canonical = {}  # Content digest -> first reference with that content
+    seen = set()
+    for page in reader.pages:
+        # Edited in place rather than with PageObject.compress_content_streams, whose
+        # replacement streams PyPDF2 3.0 drops or mis-references when writing
+        contents = page.get('/Contents')
+        contents = contents.get_object() if contents is not None else ArrayObject()
+        for stream in (contents if isinstance(contents, ArrayObject) else [contents]):
+            if compress_pdf_stream(stream.get_object()):
+                stats['streams_compressed'] += 1
+        
+        resources = page.get('/Resources')
+        resources = resources.get_object() if resources is not None else {}
+        for category in ('/XObject', '/Font'):
+            entries = resources.get(category)
+            if entries is None:
+                continue
+            entries = entries.get_object()
+            for name, reference in list(entries.items()):
+                if not isinstance(reference, IndirectObject):
+                    continue
+                obj = reference.get_object()
+                if reference.idnum not in seen:
+                    seen.add(reference.idnum)
+                    if obj.get('/Subtype') == '/Image' and downsample_pdf_image(
+                            obj, settings['MAX_IMAGE_SIZE'], settings['IMAGE_QUALITY']):
+                        stats['images_downsampled'] += 1
+                try:
+                    key = (category, pdf_object_key(obj))
+                except PdfObjectTooDeep:
+                    continue
+                first = canonical.setdefault(key, reference)
+                if first.idnum != reference.idnum:
+                    entries[NameObject(name)] = first
+                    stats['objects_merged'] += 1
+    
+    # Only objects reachable from the root are copied, so merged duplicates are dropped
+    writer = PyPDF2.PdfWriter()
+    writer.clone_document_from_reader(reader)
+    buffer = io.BytesIO()
+    writer.write(buffer)
+    write_file_atomic(target_path, buffer.getvalue())
+    
+    if shutil.which('qpdf'):
+        linearized_path = f"{target_path}.linearized"
+        result = subprocess.run(['qpdf', '--linearize', '--object-streams=generate', target_path, linearized_path],
+                                capture_output=True, timeout=300)
+        # Exit code 3 means success with warnings
+        if result.returncode in (0, 3) and os.path.exists(linearized_path):
+            os.replace(linearized_path, target_path)
+            stats['linearized'] = True
+        elif os.path.exists(linearized_path):
+            os.remove(linearized_path)
+    return stats
+
+def optimize_product_pdf(product, settings=None):
+    """Replace a product's catalog with an optimised copy, keeping the upload as pdf_original.
+
+    Sizes are recorded either way; the copy is only used when it saves at
+    least MIN_SAVINGS. Failures are logged and leave the original in place.
+    """
+    settings = settings or config['PDF_OPTIMIZE']
+    source_path = os.path.join(app.config['UPLOAD_FOLDER'], product.pdf_catalog)
+    fd, staging_path = tempfile.mkstemp(dir=app.config['UPLOAD_FOLDER'], suffix='.part')
+    os.close(fd)
+    try:
+        stats = optimize_pdf(source_path, staging_path, settings)
+    except Exception as e:
+        logger.warning(f"Could not optimise {product.pdf_catalog}, serving it as uploaded: {e}")
+        os.remove(staging_path)
+        return None
+    
+    original_size, optimized_size = os.path.getsize(source_path), os.path.getsize(staging_path)
+    product.pdf_original_size = original_size
+    if optimized_size > original_size * (1 - settings['MIN_SAVINGS']):
+        os.remove(staging_path)
+        product.pdf_optimized_size = original_size
+        return stats
+    
+    # The upload's reference moves from pdf_catalog to pdf_original; the copy gets its own
+    product.pdf_original = product.pdf_catalog
+    product.pdf_catalog = stage_upload(staging_path, f"{hash_file(staging_path)}.pdf", optimized_size)
+    product.pdf_optimized_size = optimized_size
+    logger.info(f"Optimised catalog of product {product.id}: {original_size} -> {optimized_size} bytes {stats}")
+    return stats
+
+def release_product_pdf(product):
+    """Release a product's catalog (and its original) before it is replaced or deleted"""
+    release_upload(product.pdf_catalog)
+    release_upload(product.pdf_original)
+    product.pdf_original = product.pdf_original_size = product.pdf_optimized_size = None
+
+# Full-text search. One SQLite FTS5 table holds a row per category, product
+# and catalog page. The rowid says which: -category_id for a category,
+# product_id << SEARCH_PAGE_BITS for a product and that plus the page number
+# for a catalog page, so a product's rows are a single rowid range.
+SEARCH_PAGE_BITS = 20
+SEARCH_PAGE_MASK = (1 << SEARCH_PAGE_BITS) - 1
+
+def search_rowid(product_id, page=0):
+    return (product_id << SEARCH_PAGE_BITS) + page
+
+def search_available():
+    return db.engine.dialect.name == 'sqlite'
+
+def create_search_index():
+    if search_available():
+        db.session.execute(db.text(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS search_index USING fts5("
+            "title, body, tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')"
+        ))
+        db.session.commit()
+
+def replace_search_row(rowid, title, body):
+    db.session.execute(db.text("DELETE FROM search_index WHERE rowid = :rowid"), {'rowid': rowid})
+    db.session.execute(db.text("INSERT INTO search_index (rowid, title, body) VALUES (:rowid, :title, :body)"),
+                       {'rowid': rowid, 'title': title, 'body': body or ''})
+
+def index_product(product):
+    """Index a product's name, description and category name (its catalog pages are indexed separately)"""
+    if not search_available():
+        return
+    category = db.session.get(Category, product.category_id)
+    body = ' '.join(filter(None, [product.description, category.name if category else None]))
+    replace_search_row(search_rowid(product.id), product.name, body)
+
+def index_category(category):
+    """Index a category, and its products, whose rows include the category name"""
+    if not search_available():
+        return
+    replace_search_row(-category.id, category.name, category.description)
+    for product in category.products:
+        index_product(product)
+
+def index_catalog_pages(product):
+    """Replace the indexed text of a product's catalog pages; returns the pages with text"""
+    if not search_available():
+        return 0
+    db.session.execute(db.text("DELETE FROM search_index WHERE rowid BETWEEN :first AND :last"),
+                       {'first': search_rowid(product.id, 1), 'last': search_rowid(product.id, SEARCH_PAGE_MASK)})
+    pdf_path = os.path.join(app.config['UPLOAD_FOLDER'], product.pdf_catalog or '')
+    if not product.pdf_catalog or not os.path.exists(pdf_path):
+        return 0
+    rows = []
+    for number, page in enumerate(PyPDF2.PdfReader(pdf_path).pages[:SEARCH_PAGE_MASK], 1):
+        try:
+            text = ' '.join((page.extract_text() or '').split())
+        except Exception as e:
+            logger.warning(f"Could not extract text from page {number} of {product.pdf_catalog}: {e}")
+            continue
+        if text:
+            rows.append({'rowid': search_rowid(product.id, number), 'title': '', 'body': text})
+    if rows:
+        db.session.execute(db.text("INSERT INTO search_index (rowid, title, body) VALUES (:rowid, :title, :body)"), rows)
+    return len(rows)
+
+def remove_from_search(product_id=None, category_id=None):
+    if not search_available():
+        return
+    if product_id is not None:
+        db.session.execute(db.text("DELETE FROM search_index WHERE rowid BETWEEN :first AND :last"),
+                           {'first': search_rowid(product_id), 'last': search_rowid(product_id, SEARCH_PAGE_MASK)})
+    if category_id is not None:
+        db.session.execute(db.text("DELETE FROM search_index WHERE rowid = :rowid"), {'rowid': -category_id})
+
+def rebuild_search_index(include_pages=True):
+    """Rebuild the search index from scratch; returns (categories, products, catalog pages) indexed"""
+    create_search_index()
+    if not search_available():
+        return 0, 0, 0
+    db.session.execute(db.text("DELETE FROM search_index"))
+    categories = Category.query.all()
+    for category in categories:
+        index_category(category)
+    db.session.commit()
+    pages = 0
+    if include_pages:
+        for product in Product.query.filter(Product.pdf_catalog.isnot(None)):
+            try:
+                pages += index_catalog_pages(product)
+            except Exception as e:
+                logger.warning(f"Could not index the catalog of product {product.id}: {e}")
+            db.session.commit()
+    db.session.execute(db.text("INSERT INTO search_index (search_index) VALUES ('optimize')"))
+    db.session.commit()
+    return len(categories), Product.query.count(), pages
+
+def search_match_expression(text, max_words=8):
+    """FTS5 query for free text: every word must occur, each matched as a prefix"""
+    words = re.findall(r'\w+', text.lower())[:max_words]
+    return ' '.join(f'"{word}"*' for word in words) or None
+
+def highlight_snippet(snippet):
+    return Markup(str(escape(snippet or '')).replace('\x01', '<mark>').replace('\x02', '</mark>'))
+
+def search_catalog(text, limit=20, pages_per_product=3):
+    """Categories and products matching text, best first, with the catalog pages that matched.
+
+    Returns {'categories': [{'category', 'snippet'}], 'products': [{'product', 'snippet', 'pages'}]}
+    where snippets are Markup with the matched words in <mark>.
+    """
+    results = {'categories': [], 'products': []}
+    expression = search_match_expression(text)
+    if not expression:
+        return results
+    if not search_available():
+        pattern = f"%{text.strip()}%"
+        results['categories'] = [{'category': category, 'snippet': highlight_snippet(category.description)}
+                                 for category in Category.query.filter(Category.name.ilike(pattern)).limit(limit)]
+        results['products'] = [{'product': product, 'snippet': highlight_snippet(product.description), 'pages': []}
+                               for product in Product.query.filter(db.or_(Product.name.ilike(pattern),
+                                                                          Product.description.ilike(pattern))).limit(limit)]
+        return results
+    
+    # Title matches weigh more than description or page text
+    rows = db.session.execute(db.text(
+        "SELECT rowid, snippet(search_index, -1, char(1), char(2), '…', 16) FROM search_index "
+        "WHERE search_index MATCH :expression ORDER BY bm25(search_index, 8.0, 1.0) LIMIT :rows"
+    ), {'expression': expression, 'rows': limit * 10}).all()
+    
+    category_hits, product_hits = OrderedDict(), OrderedDict()
+    for rowid, snippet in rows:
+        if rowid < 0:
+            category_hits.setdefault(-rowid, highlight_snippet(snippet))
+            continue
+        hit = product_hits.setdefault(rowid >> SEARCH_PAGE_BITS, {'snippet': None, 'pages': []})
+        page = rowid & SEARCH_PAGE_MASK
+        if not page:
+            hit['snippet'] = highlight_snippet(snippet)
+        elif len(hit['pages']) < pages_per_product:
+            hit['pages'].append({'page': page, 'snippet': highlight_snippet(snippet)})
+    
+    category_ids = list(category_hits)[:limit]
+    categories = {category.id: category for category in Category.query.filter(Category.id.in_(category_ids))}
+    results['categories'] = [
+        {'category': categories[category_id], 'snippet': category_hits[category_id]}
+        for category_id in category_ids if category_id in categories
+    ]
+    product_ids = list(product_hits)[:limit]
+    products = {product.id: product for product in Product.query.filter(Product.id.in_(product_ids))}
+    results['products'] = [
+        dict(product_hits[product_id], product=products[product_id],
+             snippet=product_hits[product_id]['snippet'] or highlight_snippet(products[product_id].description))
+        for product_id in product_ids if product_id in products
+    ]
+    return results
+
+# Background jobs
+class JobQueue:
+    """Persistent job queue in the job table; no external broker.
+
+    enqueue() adds a job to the caller's session, so it is stored with the
+    rest of the request when the view commits. WORKERS threads per process claim
+    queued jobs with a conditional UPDATE, so several app processes (and
+    'manage.py run-jobs') can share the table. Failed jobs are retried with
+    backoff up to MAX_ATTEMPTS times; jobs left 'running' for longer than
+    TIMEOUT seconds by a crashed worker are claimed again. Workers are woken
+    once the request has returned; with ASYNC off, jobs run inline at that
+    point instead (useful for scripts and tests).
+    """
+
+    def __init__(self, flask_app, settings):
+        self.app = flask_app
+        self.async_mode = bool(settings.get('ASYNC', True))
+        self.workers = int(settings.get('WORKERS', 2))
+        self.poll_interval = float(settings.get('POLL_INTERVAL', 2.0))
+        self.max_attempts = int(settings.get('MAX_ATTEMPTS', 3))
+        self.timeout = float(settings.get('TIMEOUT', 600))
+        self.handlers = {}
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._threads = []
+        self._pid = None
+
+    def handler(self, kind, on_failure=None):
+        """Register a function that runs jobs of this kind, and optionally one for final failure"""
+        def register(function):
+            self.handlers[kind] = (function, on_failure)
+            return function
+        return register
+
+    def enqueue(self, kind, **payload):
+        """Add a job to the current session; it is stored when the caller commits.
+
+        Within a request the job is dispatched after the view returns; other
+        callers call dispatch() after committing.
+        """
+        job = Job(kind=kind, payload=json.dumps(payload))
+        db.session.add(job)
+        if has_request_context() and not g.get('jobs_dispatch'):
+            g.jobs_dispatch = True
+            after_this_request(self._dispatch_response)
+        return job
+
+    def _dispatch_response(self, response):
+        self.dispatch()
+        return response
+
+    def dispatch(self):
+        """Wake the workers for newly committed jobs, or run them inline with ASYNC off"""
+        if self.async_mode and self.workers:
+            self.start()
+            self._wake.set()
+        elif not self.async_mode:
+            self.run_pending()
+
+    def counts(self):
+        return dict(db.session.query(Job.status, db.func.count(Job.id)).group_by(Job.status).all())
+
+    def start(self):
+        # Checked against the pid so a forked worker starts its own threads
+        with self._lock:
+            if self._pid == os.getpid() and all(thread.is_alive() for thread in self._threads):
+                return
+            if self._pid is None:
+                atexit.register(self.stop)
+            self._pid = os.getpid()
+            self._stop.clear()
+            self._threads = [
+                threading.Thread(target=self.work, name=f'job-worker-{number}', daemon=True)
+                for number in range(self.workers)
+            ]
+            for thread in self._threads:
+                thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+        for thread in self._threads:
+            thread.join(timeout=5)
+
+    def work(self):
+        """Claim and run jobs until stopped; the body of each worker thread"""
+        with self.app.app_context():
+            while not self._stop.is_set():
+                if not self.run_next():
+                    self._wake.wait(self.poll_interval)
+                    self._wake.clear()
+            db.session.remove()
+
+    def run_pending(self):
+        """Run jobs from the calling thread until none are ready; returns how many ran"""
+        ran = 0
+        while self.run_next():
+            ran += 1
+        return ran
+
+    def run_next(self):
+        try:
+            job = self._claim()
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Error claiming job: {e}")
+            return False
+        if job is None:
+            return False
+        self._execute(job)
+        return True
+
+    def _claimable(self):
+        now = datetime.utcnow()
+        return db.or_(
+            db.and_(Job.status == 'queued', db.or_(Job.run_after.is_(None), Job.run_after <= now)),
+            db.and_(Job.status == 'running', Job.started_at < now - timedelta(seconds=self.timeout))
+        )
+
+    def _claim(self):
+        for (job_id,) in db.session.query(Job.id).filter(self._claimable()).order_by(Job.id).limit(5).all():
+            claimed = Job.query.filter(Job.id == job_id, self._claimable()).update({
+                'status': 'running',
+                'started_at': datetime.utcnow(),
+                'attempts': Job.attempts + 1
+            }, synchronize_session=False)
+            db.session.commit()
+            if claimed:
+                return db.session.get(Job, job_id)
+        return None
+
+    def _execute(self, job):
+        function, on_failure = self.handlers.get(job.kind, (None, None))
+        payload = json.loads(job.payload)
+        started = time.monotonic()
+        try:
+            if function is None:
+                raise ValueError(f"No handler registered for job kind '{job.kind}'")
+            function(**payload)
+            job = db.session.get(Job, job.id)
+            job.status = 'done'
+            job.error = None
+            logger.info(f"Job {job.id} ({job.kind}) done in {time.monotonic() - started:.2f}s")
+        except Exception as e:
+            db.session.rollback()
+            job = db.session.get(Job, job.id)
+            job.error = f"{type(e).__name__}: {e}"
+            if job.attempts < self.max_attempts:
+                job.status = 'queued'
+                job.run_after = datetime.utcnow() + timedelta(seconds=self.poll_interval * 2 ** job.attempts)
+            else:
+                job.status = 'failed'
+                if on_failure:
+                    on_failure(**payload)
+            logger.error(f"Job {job.id} ({job.kind}) attempt {job.attempts} failed: {e}")
+        job.finished_at = datetime.utcnow()
+        db.session.commit()
+
+jobs = JobQueue(app, config['JOBS'])
+
+@jobs.handler('process_product', on_failure=lambda product_id, **_: mark_product_status(product_id, 'failed'))
+def process_product_job(product_id, base_url, image=None, pdf_catalog=None):
+    """Image variants, PDF page count and QR code for a created or edited product"""
+    product = db.session.get(Product, product_id)
+    if product is None:
+        return
+    product.processing_status = 'processing'
+    db.session.commit()
+    if image and not image_variant_widths(image):
+        create_image_variants(image)
+    if pdf_catalog and product.pdf_catalog == pdf_catalog and product.pdf_original_size is None:
+        if config['PDF_OPTIMIZE']['ENABLED']:
+            optimize_product_pdf(product)
+            db.session.commit()
+        pdf_catalog = product.pdf_catalog
+    if pdf_catalog:
+        product.pdf_pages = get_pdf_page_count(os.path.join(app.config['UPLOAD_FOLDER'], pdf_catalog))
+        if config['PDF_PAGES']['PRERENDER']:
+            try:
+                render_pdf_pages(pdf_catalog, product.pdf_pages)
+            except Exception as e:
+                logger.warning(f"Pre-rendering pages of {pdf_catalog} failed, pages will render on first view: {e}")
+        try:
+            index_catalog_pages(product)
+        except Exception as e:
+            logger.warning(f"Indexing the text of {pdf_catalog} failed, its pages will not show in search: {e}")
+    if not product.qr_code:
+        product.qr_code = save_qr_code(f"{base_url}product/{product.id}")
+    product.processing_status = 'ready'
+    db.session.commit()
+
+def mark_product_status(product_id, status):
+    product = db.session.get(Product, product_id)
+    if product:
+        product.processing_status = status
+
+@jobs.handler('process_category')
+def process_category_job(category_id, base_url, image=None):
+    """Image variants and QR code for a created or edited category"""
+    category = db.session.get(Category, category_id)
+    if category is None:
+        return
+    if image and not image_variant_widths(image):
+        create_image_variants(image)
+    if not category.qr_code:
+        category.qr_code = save_qr_code(f"{base_url}category/{category.id}")
+    db.session.commit()
+
 def generate_pdf_token(product_id, filename, ttl_seconds=600):
     """Generate a short-lived HMAC token for secure PDF access."""
     expires_at = int(time.time()) + ttl_seconds
@@ -416,56 +2771,309 @@ def verify_pdf_token(product_id, filename, token):
     except Exception:
         return False
 
+MAX_BYTE_RANGES = 32
+
+def parse_byte_ranges(header, length):
+    """Resolve a Range header to sorted, coalesced (start, stop) byte spans, stop exclusive.
+
+    Returns None when the header is absent, malformed or asks for too many
+    ranges (the whole file is sent), and [] when no range overlaps the file.
+    """
+    units, _, specs = (header or '').partition('=')
+    if units.strip().lower() != 'bytes' or not specs or specs.count(',') >= MAX_BYTE_RANGES:
+        return None
+    spans = []
+    for spec in specs.split(','):
+        first, dash, last = spec.strip().partition('-')
+        if not dash or (first and not first.isdigit()) or (last and not last.isdigit()) or not (first or last):
+            return None
+        if not first:
+            start, stop = max(length - int(last), 0), length  # Suffix range: the last N bytes
+        elif last and int(last) < int(first):
+            return None
+        else:
+            start, stop = int(first), min(int(last) + 1, length) if last else length
+        if start < stop:
+            spans.append((start, stop))
+    merged = []
+    for start, stop in sorted(spans):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(stop, merged[-1][1]))
+        else:
+            merged.append((start, stop))
+    return merged
+
+def read_file_span(path, start, stop, chunk_size=65536):
+    with open(path, 'rb') as f:
+        f.seek(start)
+        remaining = stop - start
+        while remaining > 0:
+            chunk = f.read(min(chunk_size, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+def byte_range_response(path, mimetype, etag):
+    """Stream a file honouring Range (single and multipart/byteranges), If-Range and If-None-Match.
+
+    etag must be a strong validator derived from the file's content.
+    """
+    length = os.path.getsize(path)
+    headers = {'Accept-Ranges': 'bytes'}
+    if request.if_none_match.contains(etag):
+        response = Response(status=304, headers=headers)
+        response.set_etag(etag)
+        return response
+    
+    spans = parse_byte_ranges(request.headers.get('Range'), length)
+    if_range = request.if_range
+    if spans is not None and (if_range.date or (if_range.etag and if_range.etag != etag)):
+        spans = None  # The client's partial copy is of another version: send it all
+    
+    if spans == []:
+        headers['Content-Range'] = f"bytes */{length}"
+        response = Response(status=416, headers=headers)
+    elif spans is None:
+        response = Response(read_file_span(path, 0, length), mimetype=mimetype, headers=headers,
+                            direct_passthrough=True)
+        response.content_length = length
+    elif len(spans) == 1:
+        start, stop = spans[0]
+        headers['Content-Range'] = f"bytes {start}-{stop - 1}/{length}"
+        response = Response(read_file_span(path, start, stop), status=206, mimetype=mimetype, headers=headers,
+                            direct_passthrough=True)
+        response.content_length = stop - start
+    else:
+        boundary = secrets.token_hex(16)
+        part_headers = [
+            f"--{boundary}\r\nContent-Type: {mimetype}\r\nContent-Range: bytes {start}-{stop - 1}/{length}\r\n\r\n".encode()
+            for start, stop in spans
+        ]
+        closing = f"--{boundary}--\r\n".encode()
+        
+        def generate():
+            for part_header, (start, stop) in zip(part_headers, spans):
+                yield part_header
+                yield from read_file_span(path, start, stop)
+                yield b"\r\n"
+            yield closing
+        
+        response = Response(generate(), status=206, headers=headers, direct_passthrough=True,
+                            content_type=f"multipart/byteranges; boundary={boundary}")
+        response.content_length = (sum(len(part) + stop - start + 2 for part, (start, stop) in zip(part_headers, spans))
+                                   + len(closing))
+    response.set_etag(etag)
+    return response
+
 def track_product_view(product_id, page_number=1, view_type='product'):
     """Track a product view"""
     try:
         client_ip = get_client_ip()
         user_agent = request.headers.get('User-Agent', '')
         
-        # Create view record
-        view = ProductView(
-            product_id=product_id,
-            ip_address=client_ip,
-            user_agent=user_agent,
-            page_number=page_number,
-            view_type=view_type
-        )
-        db.session.add(view)
+        now = datetime.utcnow()
         
-        # Update product view count
-        product = Product.query.get(product_id)
-        if product:
-            product.view_count += 1
-            db.session.commit()
+        # Product.view_count and the visitor sketch see every view; both are
+        # written with the next batch
+        view_counts.add(product_id)
+        visitor_sketches.add(product_id, client_ip, now)
+        
+        # Queue the raw view record for the background writer unless sampled out
+        sample_weight = sampler.sample()
+        if not sample_weight:
+            return
+        analytics_writer.submit('product_view', {
+            'product_id': product_id,
+            'ip_address': client_ip,
+            'user_agent': user_agent,
+            'page_number': page_number,
+            'view_type': view_type,
+            'sample_weight': sample_weight,
+            'dwell_ms': None,
+            'created_at': now
+        })
             
         logger.info(f"Product view tracked: Product {product_id}, Page {page_number}, Type {view_type}, IP {client_ip}")
         
     except Exception as e:
         logger.error(f"Error tracking product view: {e}")
-        db.session.rollback()
 
-def get_product_analytics(product_id, days=30):
-    """Get analytics for a specific product"""
-    from datetime import timedelta
+# Page views the PDF viewer batches into one beacon
+MAX_BEACON_EVENTS = 100
+MAX_DWELL_MS = 30 * 60 * 1000
+
+def track_pdf_page_views(product_id, views):
+    """Track a batch of (page_number, dwell_ms) PDF page views from one viewer beacon"""
+    try:
+        client_ip = get_client_ip()
+        user_agent = request.headers.get('User-Agent', '')
+        
+        now = datetime.utcnow()
+        # Product.view_count was already counted when the viewer was opened,
+        # so page flips only add raw page events
+        records = []
+        for page_number, dwell_ms in views:
+            sample_weight = sampler.sample()
+            if sample_weight:
+                records.append({
+                    'product_id': product_id,
+                    'ip_address': client_ip,
+                    'user_agent': user_agent,
+                    'page_number': page_number,
+                    'view_type': 'pdf_page',
+                    'sample_weight': sample_weight,
+                    'dwell_ms': dwell_ms,
+                    'created_at': now
+                })
+        # One batch for the writer, instead of a tracked request per page flip
+        analytics_writer.submit_many('product_view', records)
+        
+        logger.info(f"PDF page views tracked: Product {product_id}, {len(views)} pages, IP {client_ip}")
+        
+    except Exception as e:
+        logger.error(f"Error tracking PDF page views: {e}")
+
+# Raw event retention
+ARCHIVE_COLUMNS = {
+    'page_view': ('id', 'page_url', 'page_title', 'user_agent', 'ip_address', 'referrer', 'session_id', 'sample_weight', 'created_at'),
+    'product_view': ('id', 'product_id', 'ip_address', 'user_agent', 'page_number', 'view_type', 'sample_weight', 'dwell_ms', 'created_at'),
+}
+ARCHIVE_INT_COLUMNS = {'id', 'product_id', 'page_number', 'sample_weight', 'dwell_ms'}
+
+def archive_partition_path(table, day):
+    """instance/archive/<table>/<YYYY-MM>/<YYYY-MM-DD>.csv.gz"""
+    return os.path.join(config['RETENTION']['ARCHIVE_FOLDER'], table, day.strftime('%Y-%m'), f"{day.isoformat()}.csv.gz")
+
+def find_archive_partition(table, day, columns):
+    """Return the partition file to append to, starting a numbered part when the columns changed"""
+    path = base_path = archive_partition_path(table, day)
+    part = 0
+    while os.path.exists(path):
+        with gzip.open(path, 'rt', newline='', encoding='utf-8') as f:
+            if next(csv.reader(f), None) == list(columns):
+                return path
+        part += 1
+        path = base_path.replace('.csv.gz', f'.{part}.csv.gz')
+    return path
+
+def write_archive_rows(table, rows):
+    """Append row dicts to their daily partitions; each append adds a new gzip member"""
+    columns = ARCHIVE_COLUMNS[table]
+    partitions = {}
+    for row in rows:
+        partitions.setdefault(row['created_at'].date(), []).append(row)
+    for day, day_rows in partitions.items():
+        path = find_archive_partition(table, day, columns)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        is_new = not os.path.exists(path)
+        with gzip.open(path, 'at', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f)
+            if is_new:
+                writer.writerow(columns)
+            for row in day_rows:
+                writer.writerow([row['created_at'].isoformat() if column == 'created_at' else row[column] for column in columns])
+
+def archive_old_events(retention_days=None, batch_size=None):
+    """Move raw PageView/ProductView rows older than the retention window into archive files.
+
+    Rows are archived and deleted in small batches, each in its own
+    transaction, so the analytics writer is never blocked for long. Rollups
+    are kept, so dashboards still cover archived days. Returns the number of
+    rows archived per table.
+    """
+    retention_days = retention_days or config['RETENTION']['DAYS']
+    batch_size = batch_size or config['RETENTION']['BATCH_SIZE']
+    cutoff = datetime.utcnow() - timedelta(days=retention_days)
+    archived = {}
+
+    for model in (PageView, ProductView):
+        table = model.__tablename__
+        archived[table] = 0
+        while True:
+            rows = model.query.filter(model.created_at < cutoff).order_by(model.id).limit(batch_size).all()
+            if not rows:
+                break
+            # Archives keep the strings, not dictionary ids, so they stay self-contained
+            records = [{column.name: getattr(row, column.name) for column in model.__table__.columns} for row in rows]
+            decode_event_strings(records)
+            # Written before the delete commits; readers drop duplicate ids if a batch is retried
+            write_archive_rows(table, records)
+            model.query.filter(model.id.in_([row.id for row in rows])).delete(synchronize_session=False)
+            db.session.commit()
+            archived[table] += len(rows)
+            db.session.expunge_all()
+
+    # Cached product analytics counted the archived rows as live ones
+    analytics_cache.invalidate()
+    logger.info(f"Archived events older than {cutoff.date()}: {archived}")
+    return archived
+
+def iter_archived_events(table, start_date=None, end_date=None):
+    """Yield archived rows of a table as dicts, reading only partitions in the date range"""
+    root = os.path.join(config['RETENTION']['ARCHIVE_FOLDER'], table)
+    if not os.path.isdir(root):
+        return
+    start_day = start_date.date() if isinstance(start_date, datetime) else start_date
+    end_day = end_date.date() if isinstance(end_date, datetime) else end_date
+    seen_ids = set()
+
+    for month in sorted(os.listdir(root)):
+        for filename in sorted(os.listdir(os.path.join(root, month))):
+            day = datetime.strptime(filename.split('.', 1)[0], '%Y-%m-%d').date()
+            if (start_day and day < start_day) or (end_day and day > end_day):
+                continue
+            with gzip.open(os.path.join(root, month, filename), 'rt', newline='', encoding='utf-8') as f:
+                for row in csv.DictReader(f):
+                    if row['id'] in seen_ids:
+                        continue
+                    seen_ids.add(row['id'])
+                    row['created_at'] = datetime.fromisoformat(row['created_at'])
+                    if (start_date and row['created_at'] < start_date) or (end_date and row['created_at'] >= end_date):
+                        continue
+                    for column in ARCHIVE_INT_COLUMNS & row.keys():
+                        row[column] = int(row[column]) if row[column] else None
+                    row.setdefault('sample_weight', 1)  # Archived before sampling existed
+                    yield row
+
+def page_view_summary(page, views, dwell_ms, dwell_views):
+    return {'page': page, 'views': views, 'dwell_ms': dwell_ms, 'dwell_views': dwell_views,
+            'avg_dwell_seconds': round(dwell_ms / dwell_views / 1000, 1) if dwell_views else None}
+
+def get_product_analytics(product_id, days=30, include_archive=False, exact=False):
+    """Get analytics for a specific product.
+
+    View counts are scaled by the stored sample weights. Unique visitors are
+    estimated from the daily HyperLogLog sketches, which see every view even
+    while sampling; pass exact=True to count distinct IPs over the raw rows
+    instead (for audits, and a lower bound while sampling is active).
+    With include_archive, archived views in the requested range are read
+    back from the archive files as well.
+    """
     end_date = datetime.utcnow()
     start_date = end_date - timedelta(days=days)
     
-    # Get total views
-    total_views = ProductView.query.filter(
+    # Get total views, scaled by the sample weight of each recorded view
+    total_views = int(db.session.query(db.func.coalesce(db.func.sum(ProductView.sample_weight), 0)).filter(
         ProductView.product_id == product_id,
         ProductView.created_at >= start_date
-    ).count()
+    ).scalar())
     
     # Get unique visitors
-    unique_visitors = db.session.query(ProductView.ip_address).filter(
-        ProductView.product_id == product_id,
-        ProductView.created_at >= start_date
-    ).distinct().count()
+    if exact:
+        unique_visitors = db.session.query(ProductView.ip_address).filter(
+            ProductView.product_id == product_id,
+            ProductView.created_at >= start_date
+        ).distinct().count()
+    else:
+        unique_visitors = estimate_unique_visitors(product_id, start_date)
     
-    # Get page views (for PDF)
+    # Get page views (for PDF), with the time spent on each page where the viewer reported it
     page_views = db.session.query(
         ProductView.page_number,
-        db.func.count(ProductView.id).label('views')
+        db.func.sum(ProductView.sample_weight).label('views'),
+        db.func.sum(ProductView.dwell_ms).label('dwell_ms'),
+        db.func.count(ProductView.dwell_ms).label('dwell_views')
     ).filter(
         ProductView.product_id == product_id,
         ProductView.view_type == 'pdf_page',
@@ -473,7 +3081,47 @@ def get_product_analytics(product_id, days=30):
     ).group_by(ProductView.page_number).order_by(ProductView.page_number).all()
     
     # Convert Row objects to dictionaries for JSON serialization
-    page_views_list = [{'page': pv[0], 'views': pv[1]} for pv in page_views]
+    page_views_list = [page_view_summary(pv[0], int(pv[1]), pv[2] or 0, pv[3]) for pv in page_views]
+    
+    if include_archive:
+        # Sketches are never archived, so only the exact count needs the archived IPs
+        visitors = {ip for (ip,) in db.session.query(ProductView.ip_address).filter(
+            ProductView.product_id == product_id,
+            ProductView.created_at >= start_date
+        ).distinct()} if exact else None
+        # Events may have been archived with any window (archive-events [days]), so
+        # the whole range is read; rows whose archive batch was written but not yet
+        # deleted are still in the database and already counted
+        archived_rows = [row for row in iter_archived_events('product_view', start_date, end_date)
+                         if row['product_id'] == product_id]
+        live_ids = set()
+        for offset in range(0, len(archived_rows), 5000):
+            batch_ids = [row['id'] for row in archived_rows[offset:offset + 5000]]
+            live_ids.update(row_id for (row_id,) in db.session.query(ProductView.id).filter(ProductView.id.in_(batch_ids)))
+        archived_pages = {}  # page -> [views, dwell_ms, views with a dwell time]
+        for row in archived_rows:
+            if row['id'] in live_ids:
+                continue
+            total_views += row['sample_weight']
+            if exact:
+                visitors.add(row['ip_address'])
+            if row['view_type'] == 'pdf_page':
+                page = archived_pages.setdefault(row['page_number'], [0, 0, 0])
+                page[0] += row['sample_weight']
+                if row.get('dwell_ms') is not None:
+                    page[1] += row['dwell_ms']
+                    page[2] += 1
+        if exact:
+            unique_visitors = len(visitors)
+        for pv in page_views_list:
+            page = archived_pages.setdefault(pv['page'], [0, 0, 0])
+            page[0] += pv['views']
+            page[1] += pv['dwell_ms']
+            page[2] += pv['dwell_views']
+        page_views_list = [page_view_summary(page, *totals) for page, totals in sorted(archived_pages.items())]
+    
+    for pv in page_views_list:
+        del pv['dwell_ms'], pv['dwell_views']
     
     return {
         'total_views': total_views,
@@ -539,10 +3187,45 @@ def product_view(product_id):
     track_product_view(product_id, view_type='product')
     
     # Get product analytics
-    analytics = get_product_analytics(product_id)
+    analytics = get_cached_product_analytics(product_id)
     
     return render_template('product.html', product=product, analytics=analytics)
 
+@app.route('/search')
+def search():
+    query = request.args.get('q', '').strip()
+    track_page_view(request.url, f'Search: {query} - DD and Sons' if query else 'Search - DD and Sons')
+    results = search_catalog(query) if query else None
+    return render_template('search.html', query=query, results=results)
+
+@app.route('/api/search')
+def api_search():
+    """Ranked search results as JSON, with the catalog pages that matched inside each product"""
+    query = request.args.get('q', '').strip()
+    limit = min(max(request.args.get('limit', 20, type=int), 1), 50)
+    results = search_catalog(query, limit=limit)
+    return jsonify({
+        'query': query,
+        'categories': [{
+            'id': hit['category'].id,
+            'name': hit['category'].name,
+            'url': url_for('category_view', category_id=hit['category'].id),
+            'snippet': str(hit['snippet']),
+        } for hit in results['categories']],
+        'products': [{
+            'id': hit['product'].id,
+            'name': hit['product'].name,
+            'category': hit['product'].category.name,
+            'url': url_for('product_view', product_id=hit['product'].id),
+            'snippet': str(hit['snippet']),
+            'pages': [{
+                'page': page['page'],
+                'url': url_for('product_pdf_viewer', product_id=hit['product'].id, page=page['page']),
+                'snippet': str(page['snippet']),
+            } for page in hit['pages']],
+        } for hit in results['products']],
+    })
+
 @app.route('/product/<int:product_id>/pdf')
 def product_pdf_viewer(product_id):
     """PDF viewer for product catalogs"""
@@ -558,32 +3241,90 @@ def product_pdf_viewer(product_id):
     # Generate secure token for inline viewing
     token = generate_pdf_token(product_id, product.pdf_catalog, ttl_seconds=900)
     
-    return render_template('pdf_viewer.html', product=product, pdf_token=token)
+    pdf_exists = os.path.exists(os.path.join(app.config['UPLOAD_FOLDER'], product.pdf_catalog))
+    page_images = PDF_RENDERER is not None and product.pdf_pages > 0 and pdf_exists
+    # The stream URL only changes with the catalog's content, so the browser's cached bytes
+    # survive token renewals; the token travels in a cookie scoped to the stream URL
+    pdf_version = pdf_content_hash(product.pdf_catalog)[:12] if pdf_exists else ''
+    # ?page= opens the catalog at a page, e.g. a search hit
+    start_page = min(max(request.args.get('page', 1, type=int), 1), max(product.pdf_pages, 1))
+    response = make_response(render_template(
+        'pdf_viewer.html', product=product, page_images=page_images,
+        page_widths=sorted(config['PDF_PAGES']['WIDTHS']), pdf_version=pdf_version, start_page=start_page
+    ))
+    response.set_cookie('pdf_token', token, max_age=900, path=url_for('product_pdf_stream', product_id=product_id),
+                        httponly=True, samesite='Lax', secure=request.is_secure)
+    return response
+
+@app.route('/product/<int:product_id>/pdf/views', methods=['POST'])
+def product_pdf_views(product_id):
+    """Page views buffered by the PDF viewer and sent with navigator.sendBeacon.
+
+    The body is {"views": [{"page": n, "dwell_ms": ms}, ...]}; sendBeacon
+    posts it as text/plain, so the content type is not checked.
+    """
+    if (request.content_length or 0) > 64 * 1024:
+        return jsonify({'error': 'Too many views in one beacon'}), 413
+    product = Product.query.get_or_404(product_id)
+    data = request.get_json(force=True, silent=True)
+    events = data.get('views') if isinstance(data, dict) else None
+    if not isinstance(events, list):
+        return jsonify({'error': 'Expected {"views": [...]}'}), 400
+    
+    # One event per page: repeated views of a page in the same beacon add
+    # their dwell time, so a beacon never records more pages than the catalog has
+    max_pages = min(product.pdf_pages or MAX_BEACON_EVENTS, MAX_BEACON_EVENTS)
+    views = {}
+    for event in events[:MAX_BEACON_EVENTS]:
+        page_number = event.get('page') if isinstance(event, dict) else None
+        if type(page_number) is not int or page_number < 1 or (product.pdf_pages and page_number > product.pdf_pages):
+            continue
+        if page_number not in views and len(views) >= max_pages:
+            continue
+        dwell_ms = event.get('dwell_ms')
+        if type(dwell_ms) is int:
+            views[page_number] = min((views.get(page_number) or 0) + max(dwell_ms, 0), MAX_DWELL_MS)
+        else:
+            views.setdefault(page_number, None)
+    track_pdf_page_views(product_id, list(views.items()))
+    return '', 204
 
 @app.route('/product/<int:product_id>/pdf/page/<int:page_number>')
 def product_pdf_page(product_id, page_number):
-    """Serve individual PDF pages"""
+    """Serve one catalog page as a WebP image (?w= picks the smallest cached width at least that wide)"""
     product = Product.query.get_or_404(product_id)
     
     if not product.pdf_catalog:
         return jsonify({'error': 'No PDF catalog available'}), 404
+    if page_number < 1 or (product.pdf_pages and page_number > product.pdf_pages):
+        return jsonify({'error': 'Page not found'}), 404
+    if not PDF_RENDERER:
+        return jsonify({'error': 'Page images are not available'}), 503
     
-    # Track page view
-    track_product_view(product_id, page_number=page_number, view_type='pdf_page')
-    
+    # Page views are reported in batches by the viewer (see product_pdf_views), since
+    # versioned page images are served from the browser cache after the first view
     try:
         pdf_path = os.path.join(app.config['UPLOAD_FOLDER'], product.pdf_catalog)
         
         if not os.path.exists(pdf_path):
             return jsonify({'error': 'PDF file not found'}), 404
         
-        # Convert PDF page to image (you might want to use a different approach)
-        # For now, we'll return the PDF file path and let the frontend handle it
-        return jsonify({
-            'pdf_path': f"/static/uploads/{product.pdf_catalog}",
-            'page_number': page_number,
-            'total_pages': product.pdf_pages
-        })
+        settings = config['PDF_PAGES']
+        widths = sorted(settings['WIDTHS'])
+        requested = request.args.get('w', widths[0], type=int)
+        width = next((width for width in widths if width >= requested), widths[-1])
+        content_hash = pdf_content_hash(product.pdf_catalog)
+        folder = os.path.join(settings['FOLDER'], content_hash)
+        image_path = pdf_page_image_path(folder, page_number, width)
+        if not os.path.exists(image_path):
+            # Not pre-rendered yet (or PRERENDER is off): render this page now
+            render_pdf_page(pdf_path, page_number, folder, widths, settings['QUALITY'])
+        
+        response = send_file(os.path.abspath(image_path), mimetype='image/webp', max_age=86400)
+        # ?v= carries the PDF's hash, so versioned URLs never change content
+        if request.args.get('v') == content_hash[:12]:
+            response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+        return response
         
     except Exception as e:
         logger.error(f"Error serving PDF page: {e}")
@@ -591,12 +3332,18 @@ def product_pdf_page(product_id, page_number):
 
 @app.route('/product/<int:product_id>/pdf/stream')
 def product_pdf_stream(product_id):
-    """Securely stream the PDF inline with a short-lived token; prevent download UI."""
+    """Stream the PDF inline to holders of a short-lived token, with Range and conditional GET support.
+
+    The token comes from the cookie set by the viewer (or ?token=). Access is
+    checked on every request, but the response is cacheable in the browser
+    under a URL versioned by ?v=<content hash>, so renewing the token or
+    jumping between pages reuses the bytes already downloaded.
+    """
     product = Product.query.get_or_404(product_id)
     if not product.pdf_catalog:
         return jsonify({'error': 'No PDF catalog available'}), 404
     
-    token = request.args.get('token', '')
+    token = request.args.get('token') or request.cookies.get('pdf_token', '')
     if not verify_pdf_token(product_id, product.pdf_catalog, token):
         return jsonify({'error': 'Unauthorized'}), 401
     
@@ -604,12 +3351,15 @@ def product_pdf_stream(product_id):
     if not os.path.exists(pdf_path):
         return jsonify({'error': 'PDF file not found'}), 404
     
-    # Stream inline; hide download UI via viewer params in iframe
-    response = make_response(send_file(pdf_path, mimetype='application/pdf', as_attachment=False))
+    content_hash = pdf_content_hash(product.pdf_catalog)
+    response = byte_range_response(pdf_path, 'application/pdf', content_hash[:32])
     # Ensure inline disposition
-    response.headers['Content-Disposition'] = f"inline; filename=\"{product.pdf_catalog}\""
-    # Best-effort anti-download (cannot fully prevent client saves)
-    response.headers['Cache-Control'] = 'no-store'
+    response.headers['Content-Disposition'] = f"inline; filename=\"{secure_filename(product.name) or 'catalog'}.pdf\""
+    # Private: shared caches must not serve it to visitors without a token
+    if request.args.get('v') == content_hash[:12]:
+        response.headers['Cache-Control'] = 'private, max-age=86400'
+    else:
+        response.headers['Cache-Control'] = 'private, no-cache'
     response.headers['X-Content-Type-Options'] = 'nosniff'
     return response
 
@@ -617,7 +3367,10 @@ def product_pdf_stream(product_id):
 def product_analytics_api(product_id):
     """API endpoint for product analytics"""
     product = Product.query.get_or_404(product_id)
-    analytics = get_product_analytics(product_id)
+    days = analytics_days(request.args.get('days', 30, type=int))
+    include_archive = request.args.get('archive', '0') in ('1', 'true')
+    exact = request.args.get('exact', '0') in ('1', 'true')
+    analytics = get_cached_product_analytics(product_id, days, include_archive=include_archive, exact=exact)
     
     return jsonify({
         'product_id': product_id,
@@ -734,7 +3487,7 @@ def dashboard():
         contact_info = ContactInfo.query.first()
         
         # Get analytics data
-        analytics = get_analytics_data(30)  # Last 30 days
+        analytics = get_cached_analytics_data(30)  # Last 30 days
         
         stats = {
             'categories': len(categories),
@@ -780,9 +3533,7 @@ def add_category():
         if 'image' in request.files:
             file = request.files['image']
             if file and file.filename and allowed_file(file.filename):
-                filename = secure_filename(file.filename)
-                image_filename = f"category_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{filename}"
-                file.save(os.path.join(app.config['UPLOAD_FOLDER'], image_filename))
+                image_filename = store_upload(file)
         
         category = Category(
             name=name,
@@ -792,14 +3543,13 @@ def add_category():
         
         try:
             db.session.add(category)
+            db.session.flush()
+            index_category(category)
+            # Image variants and QR code are rendered by a background job
+            jobs.enqueue('process_category', category_id=category.id, base_url=request.url_root, image=image_filename)
             db.session.commit()
             logger.info(f"Category created successfully: {category.name} (ID: {category.id})")
             
-            # Generate QR code
-            qr_data = f"{request.url_root}category/{category.id}"
-            category.qr_code = generate_qr_code(qr_data)
-            db.session.commit()
-            
             flash('Category added successfully!', 'success')
             return redirect(url_for('manage_categories'))
             
@@ -824,17 +3574,13 @@ def edit_category(category_id):
         if 'image' in request.files:
             file = request.files['image']
             if file and file.filename and allowed_file(file.filename):
-                # Delete old image
-                if category.image:
-                    old_path = os.path.join(app.config['UPLOAD_FOLDER'], category.image)
-                    if os.path.exists(old_path):
-                        os.remove(old_path)
-                
-                filename = secure_filename(file.filename)
-                image_filename = f"category_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{filename}"
-                file.save(os.path.join(app.config['UPLOAD_FOLDER'], image_filename))
+                # Old image is reclaimed once nothing else uses it
+                release_upload(category.image)
+                image_filename = store_upload(file)
                 category.image = image_filename
+                jobs.enqueue('process_category', category_id=category.id, base_url=request.url_root, image=image_filename)
         
+        index_category(category)
         db.session.commit()
         flash('Category updated successfully!', 'success')
         return redirect(url_for('manage_categories'))
@@ -846,14 +3592,17 @@ def edit_category(category_id):
 def delete_category(category_id):
     category = Category.query.get_or_404(category_id)
     
-    # Delete associated image
-    if category.image:
-        image_path = os.path.join(app.config['UPLOAD_FOLDER'], category.image)
-        if os.path.exists(image_path):
-            os.remove(image_path)
+    # Release the category's and its products' uploads (deleted with it)
+    release_upload(category.image)
+    for product in category.products:
+        release_upload(product.image)
+        release_product_pdf(product)
+        remove_from_search(product_id=product.id)
+    remove_from_search(category_id=category.id)
     
     db.session.delete(category)
     db.session.commit()
+    analytics_cache.invalidate()
     flash('Category deleted successfully!', 'success')
     return redirect(url_for('manage_categories'))
 
@@ -889,25 +3638,16 @@ def add_product_simple():
             if 'image' in request.files:
                 file = request.files['image']
                 if file and file.filename and allowed_file(file.filename):
-                    filename = secure_filename(file.filename)
-                    image_filename = f"product_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{filename}"
-                    file.save(os.path.join(app.config['UPLOAD_FOLDER'], image_filename))
+                    image_filename = store_upload(file)
                     logger.info(f"Image uploaded: {image_filename}")
             
             # Handle PDF catalog upload
             pdf_filename = None
-            pdf_pages = 0
             if 'pdf_catalog' in request.files:
                 file = request.files['pdf_catalog']
                 if file and file.filename and file.filename.lower().endswith('.pdf'):
-                    filename = secure_filename(file.filename)
-                    pdf_filename = f"catalog_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{filename}"
-                    pdf_path = os.path.join(app.config['UPLOAD_FOLDER'], pdf_filename)
-                    file.save(pdf_path)
-                    
-                    # Get PDF page count
-                    pdf_pages = get_pdf_page_count(pdf_path)
-                    logger.info(f"PDF uploaded: {pdf_filename}, Pages: {pdf_pages}")
+                    pdf_filename = store_upload(file)
+                    logger.info(f"PDF uploaded: {pdf_filename}")
             
             product = Product(
                 name=name,
@@ -916,20 +3656,21 @@ def add_product_simple():
                 availability=availability,
                 image=image_filename,
                 pdf_catalog=pdf_filename,
-                pdf_pages=pdf_pages,
-                category_id=category_id
+                pdf_pages=0,
+                category_id=category_id,
+                processing_status='pending'
             )
             
             db.session.add(product)
-            db.session.commit()
-            
-            # Generate QR code
-            qr_data = f"{request.url_root}product/{product.id}"
-            product.qr_code = generate_qr_code(qr_data)
+            db.session.flush()
+            index_product(product)
+            # PDF page count, image variants and QR code are filled in by a background job
+            jobs.enqueue('process_product', product_id=product.id, base_url=request.url_root,
+                         image=image_filename, pdf_catalog=pdf_filename)
             db.session.commit()
             
             logger.info(f"Product created successfully: {product.name} (ID: {product.id})")
-            flash('Product added successfully!', 'success')
+            flash('Product added successfully! Uploads are being processed.', 'success')
             return redirect(url_for('manage_products'))
             
         except Exception as e:
@@ -963,17 +3704,14 @@ def edit_product(product_id):
         if 'image' in request.files:
             file = request.files['image']
             if file and file.filename and allowed_file(file.filename):
-                # Delete old image
-                if product.image:
-                    old_path = os.path.join(app.config['UPLOAD_FOLDER'], product.image)
-                    if os.path.exists(old_path):
-                        os.remove(old_path)
-                
-                filename = secure_filename(file.filename)
-                image_filename = f"product_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{filename}"
-                file.save(os.path.join(app.config['UPLOAD_FOLDER'], image_filename))
+                # Old image is reclaimed once nothing else uses it
+                release_upload(product.image)
+                image_filename = store_upload(file)
                 product.image = image_filename
+                product.processing_status = 'pending'
+                jobs.enqueue('process_product', product_id=product.id, base_url=request.url_root, image=image_filename)
         
+        index_product(product)
         db.session.commit()
         flash('Product updated successfully!', 'success')
         return redirect(url_for('manage_products'))
@@ -986,17 +3724,158 @@ def edit_product(product_id):
 def delete_product(product_id):
     product = Product.query.get_or_404(product_id)
     
-    # Delete associated image
-    if product.image:
-        image_path = os.path.join(app.config['UPLOAD_FOLDER'], product.image)
-        if os.path.exists(image_path):
-            os.remove(image_path)
+    # Image and PDF files are reclaimed once no other row uses them
+    release_upload(product.image)
+    release_product_pdf(product)
+    remove_from_search(product_id=product.id)
     
     db.session.delete(product)
     db.session.commit()
+    analytics_cache.invalidate()
     flash('Product deleted successfully!', 'success')
     return redirect(url_for('manage_products'))
 
+@app.route('/api/products/status')
+@login_required
+def api_products_status():
+    """Processing status of the products in ?ids=1,2,3, polled by the admin product list"""
+    ids = [int(product_id) for product_id in request.args.get('ids', '').split(',') if product_id.isdigit()][:200]
+    rows = db.session.query(Product.id, Product.processing_status, Product.pdf_pages).filter(Product.id.in_(ids)).all()
+    return jsonify({
+        str(product_id): {'status': status, 'pdf_pages': pdf_pages}
+        for product_id, status, pdf_pages in rows
+    })
+
+# Chunked, resumable PDF catalog uploads: POST /api/uploads starts an upload,
+# PUT /api/uploads/<id>?offset=N appends one chunk (raw body), GET reports how
+# much has arrived so a client can resume, and POST .../complete verifies the
+# file and attaches it to a product.
+@app.route('/api/uploads', methods=['POST'])
+@login_required
+def api_upload_start():
+    data = request.get_json(silent=True) or {}
+    filename = str(data.get('filename', ''))
+    size = data.get('size')
+    checksum = data.get('sha256')
+    if not filename.lower().endswith('.pdf'):
+        return jsonify({'error': 'Only PDF catalogs can be uploaded in chunks'}), 400
+    if type(size) is not int or size <= 0 or size > config['UPLOAD']['MAX_CHUNKED_SIZE']:
+        return jsonify({'error': 'Invalid file size'}), 400
+    if checksum is not None and not re.fullmatch(r'[0-9a-fA-F]{64}', str(checksum)):
+        return jsonify({'error': 'Invalid sha256'}), 400
+
+    upload = ChunkedUpload(id=secrets.token_hex(16), filename=filename[:200], size=size,
+                           sha256=str(checksum).lower() if checksum else None)
+    os.makedirs(CHUNK_FOLDER, exist_ok=True)
+    open(chunked_upload_path(upload.id), 'wb').close()
+    db.session.add(upload)
+    db.session.commit()
+    return jsonify({'upload_id': upload.id, 'chunk_size': config['UPLOAD']['CHUNK_SIZE'], 'received': 0}), 201
+
+@app.route('/api/uploads/<upload_id>', methods=['GET'])
+@login_required
+def api_upload_status(upload_id):
+    upload = db.session.get(ChunkedUpload, upload_id)
+    if upload is None:
+        return jsonify({'error': 'Unknown upload'}), 404
+    return jsonify({'upload_id': upload.id, 'size': upload.size, 'received': upload.received,
+                    'chunk_size': config['UPLOAD']['CHUNK_SIZE']})
+
+@app.route('/api/uploads/<upload_id>', methods=['PUT'])
+@login_required
+def api_upload_chunk(upload_id):
+    """Write one chunk at ?offset=N straight to the upload's file.
+
+    The body is streamed to disk in UPLOAD_CHUNK_SIZE pieces, so memory use
+    does not depend on the chunk size. An optional X-Chunk-SHA256 header is
+    verified; a chunk that fails it (or arrives short) is cut off again.
+    """
+    upload = db.session.get(ChunkedUpload, upload_id)
+    if upload is None:
+        return jsonify({'error': 'Unknown upload'}), 404
+    offset = request.args.get('offset', type=int)
+    if offset != upload.received:
+        return jsonify({'error': 'Offset does not match received bytes', 'received': upload.received}), 409
+    length = request.content_length
+    if not length or length > config['UPLOAD']['CHUNK_SIZE'] or offset + length > upload.size:
+        return jsonify({'error': 'Invalid chunk length', 'received': upload.received}), 400
+
+    digest = hashlib.sha256()
+    written = 0
+    with open(chunked_upload_path(upload.id), 'r+b') as f:
+        f.seek(offset)
+        for chunk in iter(lambda: request.stream.read(UPLOAD_CHUNK_SIZE), b''):
+            digest.update(chunk)
+            f.write(chunk)
+            written += len(chunk)
+        expected = request.headers.get('X-Chunk-SHA256')
+        if written != length or (expected and expected.lower() != digest.hexdigest()):
+            f.truncate(offset)
+            return jsonify({'error': 'Chunk incomplete or checksum mismatch', 'received': upload.received}), 422
+
+    # Conditional on the offset, so two clients racing on the same upload cannot both advance it
+    advanced = ChunkedUpload.query.filter_by(id=upload.id, received=offset).update(
+        {'received': offset + written, 'updated_at': datetime.utcnow()}, synchronize_session=False)
+    db.session.commit()
+    if not advanced:
+        db.session.refresh(upload)
+        return jsonify({'error': 'Offset does not match received bytes', 'received': upload.received}), 409
+    return jsonify({'upload_id': upload.id, 'size': upload.size, 'received': offset + written})
+
+@app.route('/api/uploads/<upload_id>', methods=['DELETE'])
+@login_required
+def api_upload_cancel(upload_id):
+    upload = db.session.get(ChunkedUpload, upload_id)
+    if upload is None:
+        return jsonify({'error': 'Unknown upload'}), 404
+    remove_chunked_upload(upload)
+    db.session.commit()
+    return jsonify({'success': True})
+
+@app.route('/api/uploads/<upload_id>/complete', methods=['POST'])
+@login_required
+def api_upload_complete(upload_id):
+    """Verify a fully received upload and attach it as a product's PDF catalog"""
+    upload = db.session.get(ChunkedUpload, upload_id)
+    if upload is None:
+        return jsonify({'error': 'Unknown upload'}), 404
+    if upload.received != upload.size:
+        return jsonify({'error': 'Upload is incomplete', 'received': upload.received}), 409
+    data = request.get_json(silent=True) or {}
+    product = db.session.get(Product, data.get('product_id') or 0)
+    if product is None:
+        return jsonify({'error': 'Unknown product'}), 404
+
+    path = chunked_upload_path(upload.id)
+    checksum = hash_file(path)
+    if upload.sha256 and checksum != upload.sha256:
+        remove_chunked_upload(upload)
+        db.session.commit()
+        logger.warning(f"Chunked upload {upload_id} failed checksum verification")
+        return jsonify({'error': 'Checksum mismatch'}), 422
+
+    # The assembled file becomes the staging copy of its content address
+    pdf_filename = stage_upload(path, f"{checksum}{upload_extension(upload.filename)}", upload.size)
+    release_product_pdf(product)
+    product.pdf_catalog = pdf_filename
+    product.processing_status = 'pending'
+    db.session.delete(upload)
+    jobs.enqueue('process_product', product_id=product.id, base_url=request.url_root, pdf_catalog=pdf_filename)
+    db.session.commit()
+    logger.info(f"PDF catalog for product {product.id} assembled from chunked upload: {pdf_filename}")
+    return jsonify({'pdf_catalog': pdf_filename, 'sha256': checksum, 'status': 'pending'})
+
+@app.route('/admin/qr-sheets')
+@login_required
+def qr_sheets():
+    """Bring the printable QR sheets up to date and download them as one PDF"""
+    pdf_path, stats = generate_qr_sheets(request.url_root)
+    if not pdf_path:
+        flash('Add categories or products before printing QR sheets.', 'warning')
+        return redirect(url_for('manage_products'))
+    logger.info(f"QR sheets generated: {stats}")
+    return send_file(os.path.abspath(pdf_path), mimetype='application/pdf', as_attachment=True, download_name='qr-sheets.pdf')
+
 # Contact Info Management
 @app.route('/admin/contact-info', methods=['GET', 'POST'])
 @login_required
@@ -1095,8 +3974,8 @@ def delete_user(user_id):
 @app.route('/admin/analytics')
 @login_required
 def analytics():
-    days = request.args.get('days', 30, type=int)
-    analytics_data = get_analytics_data(days)
+    days = analytics_days(request.args.get('days', 30, type=int))
+    analytics_data = get_cached_analytics_data(days)
     
     # Get additional data
     recent_visitors = VisitorSession.query.filter(
@@ -1111,36 +3990,104 @@ def analytics():
 @app.route('/api/analytics')
 @login_required
 def api_analytics():
-    days = request.args.get('days', 30, type=int)
-    analytics_data = get_analytics_data(days)
+    days = analytics_days(request.args.get('days', 30, type=int))
+    analytics_data = get_cached_analytics_data(days)
     return jsonify(analytics_data)
 
+@app.route('/api/analytics/stream')
+@login_required
+def api_analytics_stream():
+    """Server-Sent Events stream of live analytics deltas"""
+    last_seq = request.headers.get('Last-Event-ID', type=int)
+    if last_seq is None:
+        last_seq = live_analytics.current_seq()
+    
+    def generate(seq):
+        live_analytics.subscribe()
+        try:
+            yield 'retry: 5000\n\n'
+            while True:
+                deltas = live_analytics.wait_for(seq)
+                if not deltas:
+                    yield ': keepalive\n\n'
+                    continue
+                for delta in deltas:
+                    seq = delta['seq']
+                    yield f"id: {seq}\ndata: {json.dumps(delta)}\n\n"
+        finally:
+            live_analytics.unsubscribe()
+    
+    return Response(generate(last_seq), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
+@app.route('/api/analytics/health')
+@login_required
+def api_analytics_health():
+    """Cache hit/miss counters, analytics writer statistics and background job counts by status"""
+    return jsonify({
+        'cache': analytics_cache.snapshot(),
+        'writer': dict(analytics_writer.stats, depth=analytics_writer.depth(), sessions_in_memory=len(visitor_sessions),
+                       write_seconds=round(analytics_writer.write_seconds, 4), sample_rate=sampler.current_rate()),
+        'bots': bot_hits.snapshot(),
+        'jobs': jobs.counts()
+    })
+
+@app.route('/assets/<path:filename>')
+def asset(filename):
+    """Serve a fingerprinted static file, precompressed when the client accepts br or gzip"""
+    manifest = assets.current()
+    if filename not in manifest.files:
+        return jsonify({'error': 'Not found'}), 404
+    path = os.path.join(manifest.folder, filename)
+    encoding = next((encoding for encoding in manifest.files[filename] if request.accept_encodings[encoding] > 0), None)
+    suffix = dict(ASSET_ENCODINGS).get(encoding, '')
+    response = send_file(os.path.abspath(path + suffix), mimetype=mimetypes.guess_type(filename)[0], max_age=31536000)
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return response
+
+@app.route('/qr/<filename>')
+def qr_image(filename):
+    """Serve a content-addressed QR code file; its name changes whenever its content does"""
+    response = send_from_directory(QR_FOLDER, filename, max_age=31536000)
+    response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return response
+
 # API Routes for QR codes
 @app.route('/api/qr/main')
 def qr_main():
-    qr_data = request.url_root
-    qr_code = generate_qr_code(qr_data)
-    return jsonify({'qr_code': qr_code})
+    return qr_code_response(request.url_root)
 
 @app.route('/api/qr/category/<int:category_id>')
 def qr_category(category_id):
     category = Category.query.get_or_404(category_id)
-    qr_data = f"{request.url_root}category/{category_id}"
-    qr_code = generate_qr_code(qr_data)
-    return jsonify({'qr_code': qr_code})
+    return qr_code_response(f"{request.url_root}category/{category_id}")
 
 @app.route('/api/qr/product/<int:product_id>')
 def qr_product(product_id):
     product = Product.query.get_or_404(product_id)
-    qr_data = f"{request.url_root}product/{product_id}"
-    qr_code = generate_qr_code(qr_data)
-    return jsonify({'qr_code': qr_code})
+    return qr_code_response(f"{request.url_root}product/{product_id}")
 
 # Initialize database and create default data
 def init_db():
     with app.app_context():
         db.create_all()
         
+        # Backfill analytics rollups for databases created before they existed
+        if not TrafficRollup.query.first() and PageView.query.first():
+            rebuild_rollups()
+            logger.info("Analytics rollups rebuilt from raw page views")
+        if not ProductVisitorSketch.query.first() and ProductView.query.first():
+            rebuild_visitor_sketches()
+            logger.info("Product visitor sketches rebuilt from raw product views")
+        if not UploadedFile.query.first() and upload_references():
+            reconcile_uploads()
+            logger.info("Upload reference counts rebuilt from products and categories")
+        
         # Create default admin user if none exists
         if not User.query.first():
             admin_password = bcrypt.generate_password_hash(config['ADMIN']['DEFAULT_PASSWORD']).decode('utf-8')
@@ -1199,8 +4146,18 @@ def init_db():
                 
                 # Generate QR code for category
                 qr_data = f"http://localhost:{config['FLASK']['PORT']}/category/{category.id}"
-                category.qr_code = generate_qr_code(qr_data)
+                category.qr_code = save_qr_code(qr_data)
                 db.session.commit()
+        
+        # Index the catalog for search on databases created before the index existed
+        create_search_index()
+        if search_available() and not db.session.execute(db.text("SELECT 1 FROM search_index LIMIT 1")).first():
+            rebuild_search_index(include_pages=False)
+            logger.info("Search index built; run 'python manage.py rebuild-search' to index PDF catalog text")
+        
+        # Resume upload jobs left over from a previous run
+        if jobs.async_mode and jobs.workers and Job.query.filter(Job.status.in_(('queued', 'running'))).first():
+            jobs.start()
 
 if __name__ == '__main__':
     logger.info("Starting DD and Sons website application")
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+Bot Classifier Benchmark
+Compares the original list-scanning is_bot check with the compiled,
+memoised classifier in app.py on a realistic User-Agent mix. Without its
+cache the classifier is slower than the original scan, since it checks ~150
+signatures instead of seven; the cache is what makes it faster.
+
+Usage: python benchmark_bot_classifier.py [requests]
+"""
+
+import random
+import sys
+import time
+
+from app import classify_user_agent
+
+# Weighted sample of real-world User-Agents: mostly browsers, some crawlers,
+# link previewers and scripts, as seen in a small business site's logs.
+USER_AGENTS = [
+    (30, "Mozilla/5.0 (Linux; Android 13; SM-A546E) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.6099.144 Mobile Safari/537.36"),
+    (20, "Mozilla/5.0 (iPhone; CPU iPhone OS 17_2 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.2 Mobile/15E148 Safari/604.1"),
+    (15, "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"),
+    (8, "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.1 Safari/605.1.15"),
+    (5, "Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:121.0) Gecko/20100101 Firefox/121.0"),
+    (4, "Mozilla/5.0 (Linux; Android 12; Redmi Note 11) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/119.0.6045.163 Mobile Safari/537.36"),
+    (3, "Mozilla/5.0 (compatible; Googlebot/2.1; +http://www.google.com/bot.html)"),
+    (2, "Mozilla/5.0 (compatible; bingbot/2.0; +http://www.bing.com/bingbot.htm)"),
+    (2, "WhatsApp/2.23.24.82 A"),
+    (2, "facebookexternalhit/1.1 (+http://www.facebook.com/externalhit_uatext.php)"),
+    (1, "Mozilla/5.0 (compatible; AhrefsBot/7.0; +http://ahrefs.com/robot/)"),
+    (1, "Mozilla/5.0 AppleWebKit/537.36 (KHTML, like Gecko; compatible; GPTBot/1.0; +https://openai.com/gptbot)"),
+    (1, "curl/8.4.0"),
+    (1, "python-requests/2.31.0"),
+    (1, "Mozilla/5.0 (iPhone; CPU iPhone OS 17_2 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.2 Mobile/15E148 DuckDuckGo/7 Safari/605.1.15"),
+    (1, "Mozilla/5.0 (Linux; Android 10; CUBOT X30) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/119.0.6045.163 Mobile Safari/537.36"),
+    (1, "DuckDuckBot/1.1; (+http://duckduckgo.com/duckduckbot.html)"),
+    (1, "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) HeadlessChrome/120.0.0.0 Safari/537.36"),
+    (1, ""),
+]
+
+def legacy_is_bot(user_agent):
+    """The original implementation from app.py"""
+    bot_indicators = ['bot', 'crawler', 'spider', 'scraper', 'googlebot', 'bingbot', 'slurp']
+    if not user_agent:
+        return True
+    return any(indicator in user_agent.lower() for indicator in bot_indicators)
+
+# The compiled matcher without the LRU cache
+uncached_classify = classify_user_agent.__wrapped__
+
+def build_corpus(size):
+    rng = random.Random(7)
+    weights = [weight for weight, _ in USER_AGENTS]
+    agents = [agent for _, agent in USER_AGENTS]
+    # Browsers report many minor versions; vary a few so the cache sees misses too
+    corpus = []
+    for agent in rng.choices(agents, weights=weights, k=size):
+        if agent.startswith('Mozilla/5.0 (Linux') and rng.random() < 0.05:
+            agent = agent.replace('.144', f'.{rng.randint(1, 300)}')
+        corpus.append(agent)
+    return corpus
+
+def time_classifier(label, classifier, corpus):
+    started = time.perf_counter()
+    detected = sum(1 for agent in corpus if classifier(agent))
+    elapsed = time.perf_counter() - started
+    print(f"{label:<28} {elapsed * 1000:9.1f} ms  {len(corpus) / elapsed:12,.0f} req/s  {detected:7} bots")
+
+def main():
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    corpus = build_corpus(size)
+    print(f"📊 Classifying {size} User-Agents ({len(set(corpus))} distinct)")
+    print("=" * 50)
+    time_classifier('legacy list scan', legacy_is_bot, corpus)
+    time_classifier('compiled regex (no cache)', uncached_classify, corpus)
+    classify_user_agent.cache_clear()
+    time_classifier('compiled regex + LRU cache', classify_user_agent, corpus)
+    print(f"cache: {classify_user_agent.cache_info()}")
+
+if __name__ == '__main__':
+    main()
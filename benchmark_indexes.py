@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+"""
+Index Benchmark
+Builds a synthetic analytics database and reports EXPLAIN QUERY PLAN output and
+timings for the analytics and catalog queries, before and after the indexes
+from migrate_database.py are created.
+
+Usage: python benchmark_indexes.py [page_views] [product_views]
+"""
+
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from migrate_database import create_indexes
+
+SCHEMA = """
+CREATE TABLE category (id INTEGER PRIMARY KEY, name VARCHAR(100) NOT NULL);
+CREATE TABLE product (
+    id INTEGER PRIMARY KEY, name VARCHAR(200) NOT NULL, category_id INTEGER NOT NULL,
+    view_count INTEGER DEFAULT 0
+);
+CREATE TABLE product_view (
+    id INTEGER PRIMARY KEY, product_id INTEGER NOT NULL, ip_address VARCHAR(45) NOT NULL,
+    user_agent_id INTEGER, page_number INTEGER DEFAULT 1, view_type VARCHAR(20) DEFAULT 'product',
+    sample_weight INTEGER NOT NULL DEFAULT 1, dwell_ms INTEGER, created_at DATETIME
+);
+CREATE TABLE page_view (
+    id INTEGER PRIMARY KEY, page_url VARCHAR(500) NOT NULL, page_title VARCHAR(200),
+    user_agent_id INTEGER, ip_address VARCHAR(45), referrer_id INTEGER, session_id VARCHAR(100),
+    created_at DATETIME
+);
+CREATE TABLE visitor_session (
+    id INTEGER PRIMARY KEY, session_id VARCHAR(100) UNIQUE NOT NULL, ip_address VARCHAR(45),
+    user_agent_id INTEGER, first_visit DATETIME, last_visit DATETIME, page_views INTEGER DEFAULT 1,
+    is_bot BOOLEAN DEFAULT 0
+);
+CREATE TABLE traffic_rollup (hour DATETIME PRIMARY KEY, views INTEGER NOT NULL, sessions INTEGER NOT NULL);
+CREATE TABLE page_rollup (
+    day DATE, page_url VARCHAR(500), page_title VARCHAR(200), views INTEGER NOT NULL,
+    PRIMARY KEY (day, page_url)
+);
+CREATE TABLE referrer (id INTEGER PRIMARY KEY, value VARCHAR(500) NOT NULL UNIQUE);
+CREATE TABLE referrer_rollup (
+    day DATE, referrer_id INTEGER, views INTEGER NOT NULL, PRIMARY KEY (day, referrer_id)
+);
+"""
+
+# The queries issued by get_analytics_data, get_product_analytics and the
+# pages that list recent visitors and category products.
+QUERIES = [
+    ('get_analytics_data: totals',
+     "SELECT coalesce(sum(views), 0), coalesce(sum(sessions), 0) FROM traffic_rollup WHERE hour >= :start"),
+    ('get_analytics_data: popular pages',
+     "SELECT page_url, max(page_title), sum(views) FROM page_rollup WHERE day >= :start_day "
+     "GROUP BY page_url ORDER BY sum(views) DESC LIMIT 10"),
+    ('get_analytics_data: daily views',
+     "SELECT date(hour) AS date, sum(views) FROM traffic_rollup WHERE hour >= :start AND views > 0 "
+     "GROUP BY date(hour) ORDER BY date"),
+    ('get_analytics_data: referrers',
+     "SELECT referrer.value, top.views FROM referrer JOIN (SELECT referrer_id, sum(views) AS views "
+     "FROM referrer_rollup WHERE day >= :start_day GROUP BY referrer_id ORDER BY sum(views) DESC LIMIT 10) top "
+     "ON referrer.id = top.referrer_id ORDER BY top.views DESC"),
+    ('rebuild_rollups: page views since',
+     "SELECT count(*) FROM page_view WHERE created_at >= :start"),
+    ('rebuild_rollups: new sessions since',
+     "SELECT first_visit FROM visitor_session WHERE is_bot = 0 AND first_visit >= :start"),
+    ('get_product_analytics: total views',
+     "SELECT coalesce(sum(sample_weight), 0) FROM product_view WHERE product_id = :product_id AND created_at >= :start"),
+    ('get_product_analytics: unique visitors',
+     "SELECT count(*) FROM (SELECT DISTINCT ip_address FROM product_view "
+     "WHERE product_id = :product_id AND created_at >= :start)"),
+    ('get_product_analytics: pdf page views',
+     "SELECT page_number, sum(sample_weight), sum(dwell_ms), count(dwell_ms) FROM product_view "
+     "WHERE product_id = :product_id AND view_type = 'pdf_page' AND created_at >= :start GROUP BY page_number ORDER BY page_number"),
+    ('analytics: recent visitors',
+     "SELECT * FROM visitor_session WHERE is_bot = 0 ORDER BY last_visit DESC LIMIT 20"),
+    ('category_view: products',
+     "SELECT * FROM product WHERE category_id = :category_id"),
+]
+
+def populate(conn, page_views, product_views):
+    """Fill the database with a year of synthetic traffic"""
+    rng = random.Random(42)
+    now = datetime.utcnow()
+
+    def timestamp():
+        return (now - timedelta(seconds=rng.randint(0, 365 * 86400))).strftime('%Y-%m-%d %H:%M:%S.000000')
+
+    cursor = conn.cursor()
+    cursor.executemany("INSERT INTO category (id, name) VALUES (?, ?)", [(i, f"Category {i}") for i in range(1, 21)])
+    cursor.executemany("INSERT INTO product (id, name, category_id) VALUES (?, ?, ?)",
+                       [(i, f"Product {i}", rng.randint(1, 20)) for i in range(1, 2001)])
+    sessions = max(page_views // 5, 1)
+    cursor.executemany(
+        "INSERT INTO visitor_session (session_id, ip_address, first_visit, last_visit, is_bot) VALUES (?, ?, ?, ?, ?)",
+        [(f"s{i}", f"10.0.{i % 256}.{i % 200}", timestamp(), timestamp(), 0) for i in range(sessions)]
+    )
+    cursor.executemany("INSERT INTO referrer (id, value) VALUES (?, ?)", [(i, f"https://site{i}.example/") for i in range(1, 201)])
+    cursor.executemany(
+        "INSERT INTO page_view (page_url, page_title, ip_address, referrer_id, session_id, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+        [(f"/category/{rng.randint(1, 20)}", "Category", "10.0.0.1", rng.choice([None, rng.randint(1, 200)]),
+          f"s{rng.randrange(sessions)}", timestamp()) for _ in range(page_views)]
+    )
+    views = []
+    for _ in range(product_views):
+        view_type = rng.choice(['product', 'pdf_viewer', 'pdf_page'])
+        dwell_ms = rng.randint(500, 120000) if view_type == 'pdf_page' else None
+        views.append((rng.randint(1, 2000), f"10.1.{rng.randint(0, 255)}.{rng.randint(0, 255)}", rng.randint(1, 40),
+                      view_type, dwell_ms, timestamp()))
+    cursor.executemany(
+        "INSERT INTO product_view (product_id, ip_address, page_number, view_type, dwell_ms, created_at) "
+        "VALUES (?, ?, ?, ?, ?, ?)", views
+    )
+    cursor.execute(
+        "INSERT INTO traffic_rollup SELECT strftime('%Y-%m-%d %H:00:00.000000', created_at), count(*), 0 "
+        "FROM page_view GROUP BY 1"
+    )
+    cursor.execute("INSERT INTO page_rollup SELECT date(created_at), page_url, max(page_title), count(*) FROM page_view GROUP BY 1, 2")
+    cursor.execute(
+        "INSERT INTO referrer_rollup SELECT date(created_at), referrer_id, count(*) FROM page_view "
+        "WHERE referrer_id IS NOT NULL GROUP BY 1, 2"
+    )
+    conn.commit()
+
+def run_queries(conn, params, repeat=5):
+    """Return {label: (plan, best time in ms)} for every benchmark query"""
+    results = {}
+    for label, sql in QUERIES:
+        plan = [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", params)]
+        best = None
+        for _ in range(repeat):
+            started = time.perf_counter()
+            conn.execute(sql, params).fetchall()
+            elapsed = (time.perf_counter() - started) * 1000
+            best = elapsed if best is None else min(best, elapsed)
+        results[label] = (plan, best)
+    return results
+
+def main():
+    page_views = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    product_views = int(sys.argv[2]) if len(sys.argv) > 2 else 200000
+
+    with tempfile.TemporaryDirectory() as tmp:
+        conn = sqlite3.connect(os.path.join(tmp, 'benchmark.db'))
+        conn.executescript(SCHEMA)
+        print(f"🔄 Generating {page_views} page views and {product_views} product views...")
+        populate(conn, page_views, product_views)
+
+        start = datetime.utcnow() - timedelta(days=30)
+        params = {
+            'start': start.strftime('%Y-%m-%d %H:%M:%S.000000'),
+            'start_day': start.strftime('%Y-%m-%d'),
+            'product_id': 7,
+            'category_id': 3,
+        }
+
+        before = run_queries(conn, params)
+        print("🔄 Building indexes...")
+        create_indexes(conn)
+        after = run_queries(conn, params)
+        conn.close()
+
+    print("\n📊 Results (best of 5 runs)")
+    print("=" * 50)
+    for label, _ in QUERIES:
+        plan_before, time_before = before[label]
+        plan_after, time_after = after[label]
+        print(f"\n{label}")
+        print(f"  before: {time_before:9.3f} ms  {' | '.join(plan_before)}")
+        print(f"  after:  {time_after:9.3f} ms  {' | '.join(plan_after)}")
+
+if __name__ == '__main__':
+    main()
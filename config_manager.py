@@ -22,7 +22,10 @@ def create_default_config():
         },
         "UPLOAD": {
             "FOLDER": "static/uploads",
-            "MAX_SIZE": 16777216  # 16MB in bytes
+            "MAX_SIZE": 16777216,  # 16MB in bytes
+            "RECLAIM_AFTER": 3600,  # Seconds an unreferenced upload (or idle chunked upload) is kept
+            "CHUNK_SIZE": 8388608,  # Largest chunk accepted by the chunked upload API
+            "MAX_CHUNKED_SIZE": 524288000
         },
         "GOOGLE_MAPS": {
             "API_KEY": "YOUR_GOOGLE_MAPS_API_KEY"
@@ -39,6 +42,67 @@ def create_default_config():
             "ADDRESS": "123 Industrial Area, City, State - 123456",
             "LATITUDE": 28.6139,
             "LONGITUDE": 77.2090
+        },
+        "ANALYTICS": {
+            "ASYNC": True,
+            "QUEUE_SIZE": 10000,
+            "BATCH_SIZE": 500,
+            "FLUSH_INTERVAL": 2.0,
+            "DROP_POLICY": "drop_newest",
+            "WRITE_ATTEMPTS": 3,
+            "SESSION_IDLE_TIMEOUT": 1800,
+            "SAMPLE_RATE": 1,
+            "ADAPTIVE_SAMPLING": True,
+            "MAX_SAMPLE_RATE": 64,
+            "TARGET_WRITE_SECONDS": 0.5
+        },
+        "RETENTION": {
+            "DAYS": 180,
+            "BATCH_SIZE": 1000,
+            "ARCHIVE_FOLDER": "instance/archive"
+        },
+        "CACHE": {
+            "ANALYTICS_TTL": 30,
+            "MAX_ENTRIES": 256
+        },
+        "LIVE_ANALYTICS": {
+            "TICK_INTERVAL": 5,
+            "HISTORY": 120
+        },
+        "QR_SHEETS": {
+            "FOLDER": "instance/qr_sheets",
+            "COLUMNS": 4,
+            "ROWS": 6,
+            "DPI": 150,
+            "WORKERS": 0
+        },
+        "ASSETS": {
+            "FOLDER": "instance/assets",
+            "COMPRESS_MIN_SIZE": 512
+        },
+        "PDF_PAGES": {
+            "FOLDER": "instance/pdf_pages",
+            "WIDTHS": [800, 1600],
+            "QUALITY": 75,
+            "PRERENDER": True,
+            "WORKERS": 0
+        },
+        "PDF_OPTIMIZE": {
+            "ENABLED": True,
+            "MAX_IMAGE_SIZE": 2000,
+            "IMAGE_QUALITY": 80,
+            "MIN_SAVINGS": 0.05
+        },
+        "IMAGES": {
+            "WIDTHS": [320, 640, 1280],
+            "QUALITY": 80
+        },
+        "JOBS": {
+            "ASYNC": True,
+            "WORKERS": 2,
+            "POLL_INTERVAL": 2,
+            "MAX_ATTEMPTS": 3,
+            "TIMEOUT": 600
         }
     }
     
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+DD and Sons Website - Maintenance Commands
+Periodic and one-off maintenance tasks for the application database.
+"""
+
+import sys
+import time
+from datetime import datetime
+
+from app import (app, rebuild_rollups, rebuild_visitor_sketches, reconcile_view_counts, archive_old_events,
+                 generate_qr_sheets, Category, Product, create_image_variants, image_variant_widths, jobs,
+                 reclaim_uploads, dedupe_uploads, reconcile_uploads, rebuild_search_index)
+
+def rebuild_rollups_command(args):
+    """Recompute the analytics rollup tables from raw page views"""
+    since = datetime.strptime(args[0], '%Y-%m-%d').date() if args else None
+    with app.app_context():
+        rebuild_rollups(since=since)
+    print(f"✅ Analytics rollups rebuilt{' from ' + args[0] if args else ''}")
+
+def rebuild_sketches_command(args):
+    """Recompute the per-product unique visitor sketches"""
+    with app.app_context():
+        rebuild_visitor_sketches()
+    print("✅ Product visitor sketches rebuilt")
+
+def reconcile_view_counts_command(args):
+    """Recompute Product.view_count from recorded product views"""
+    with app.app_context():
+        corrected = reconcile_view_counts()
+    print(f"✅ View counts reconciled ({corrected} products corrected)")
+
+def archive_events_command(args):
+    """Archive raw page and product views older than the retention window"""
+    retention_days = int(args[0]) if args else None
+    with app.app_context():
+        archived = archive_old_events(retention_days=retention_days)
+    for table, count in archived.items():
+        print(f"✅ Archived {count} {table} rows")
+
+def qr_sheets_command(args):
+    """Render printable QR sheets for every category and product"""
+    if not args:
+        print("❌ Pass the public base URL the QR codes should point to, e.g. https://www.example.com/")
+        sys.exit(1)
+    base_url = args[0]
+    if not base_url.endswith('/'):
+        base_url += '/'
+    started = time.perf_counter()
+    with app.app_context():
+        pdf_path, stats = generate_qr_sheets(base_url)
+    if not pdf_path:
+        print("❌ No categories or products to print")
+        return
+    print(f"✅ {stats['items']} labels on {stats['sheets']} sheets written to {pdf_path} "
+          f"({stats['rendered']} QR codes rendered, {stats['sheets_written']} sheets updated, "
+          f"{time.perf_counter() - started:.1f}s)")
+
+def image_variants_command(args):
+    """Create responsive variants for uploaded images that have none yet"""
+    created = 0
+    with app.app_context():
+        images = [item.image for model in (Category, Product) for item in model.query.filter(model.image.isnot(None))]
+    for image in images:
+        if not image_variant_widths(image) and create_image_variants(image):
+            created += 1
+    print(f"✅ Image variants created for {created} of {len(images)} images")
+
+def run_jobs_command(args):
+    """Run background jobs in this process (use with JOBS.WORKERS = 0 in the web app)"""
+    with app.app_context():
+        if args and args[0] == '--once':
+            print(f"✅ Ran {jobs.run_pending()} jobs")
+            return
+        print("🔄 Running background jobs (Ctrl+C to stop)...")
+        try:
+            jobs.work()
+        except KeyboardInterrupt:
+            print("\n👋 Job worker stopped")
+
+def reclaim_uploads_command(args):
+    """Delete uploaded files that no product or category has referenced for a while"""
+    grace_seconds = int(args[0]) if args else None
+    with app.app_context():
+        reclaimed = reclaim_uploads(grace_seconds=grace_seconds)
+    print(f"✅ Reclaimed {reclaimed} unreferenced uploads")
+
+def dedupe_uploads_command(args):
+    """Move uploads with timestamped names to content-addressed names"""
+    with app.app_context():
+        renamed, freed = dedupe_uploads()
+    print(f"✅ {renamed} uploads renamed, {freed / 1024 / 1024:.1f} MB of duplicates freed")
+
+def reconcile_uploads_command(args):
+    """Recompute upload reference counts"""
+    with app.app_context():
+        corrected = reconcile_uploads()
+    print(f"✅ Upload reference counts reconciled ({corrected} files corrected)")
+
+def rebuild_search_command(args):
+    """Rebuild the full-text search index, including PDF catalog text unless --no-pages"""
+    started = time.perf_counter()
+    with app.app_context():
+        categories, products, pages = rebuild_search_index(include_pages='--no-pages' not in args)
+    print(f"✅ Search index rebuilt: {categories} categories, {products} products, {pages} catalog pages "
+          f"({time.perf_counter() - started:.1f}s)")
+
+COMMANDS = {
+    'rebuild-rollups': (rebuild_rollups_command, '[YYYY-MM-DD]', 'Rebuild analytics rollups (optionally from a date)'),
+    'rebuild-sketches': (rebuild_sketches_command, '', 'Rebuild product unique visitor sketches'),
+    'reconcile-view-counts': (reconcile_view_counts_command, '', 'Recompute product view counts from product views'),
+    'archive-events': (archive_events_command, '[days]', 'Archive raw views older than the retention window'),
+    'qr-sheets': (qr_sheets_command, '<base_url>', 'Render printable QR sheets for the whole catalog'),
+    'image-variants': (image_variants_command, '', 'Create responsive variants for existing uploaded images'),
+    'run-jobs': (run_jobs_command, '[--once]', 'Run queued upload processing jobs'),
+    'reclaim-uploads': (reclaim_uploads_command, '[seconds]', 'Delete uploads unreferenced for longer than RECLAIM_AFTER'),
+    'dedupe-uploads': (dedupe_uploads_command, '', 'Rename legacy uploads to content addresses, merging duplicates'),
+    'reconcile-uploads': (reconcile_uploads_command, '', 'Recompute upload reference counts'),
+    'rebuild-search': (rebuild_search_command, '[--no-pages]', 'Rebuild the full-text search index'),
+}
+
+def print_usage():
+    print("Usage:")
+    for name, (_, arguments, help_text) in COMMANDS.items():
+        print(f"  python manage.py {name} {arguments}".ljust(60) + f"- {help_text}")
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2 or sys.argv[1] not in COMMANDS:
+        print_usage()
+        sys.exit(1)
+
+    command, _, _ = COMMANDS[sys.argv[1]]
+    command(sys.argv[2:])
@@ -1,12 +1,209 @@
 #!/usr/bin/env python3
 """
 Database Migration Script
-Adds new fields for PDF catalog support
+Adds new fields for PDF catalog support, moves inline QR codes to files,
+dictionary-encodes analytics strings and builds the query indexes
 """
 
+import base64
+import hashlib
+import json
 import sqlite3
 import os
 
+# Indexes backing the analytics and catalog queries. Names and columns match
+# the index declarations on the models in app.py.
+INDEXES = [
+    ('ix_page_view_created_at', 'page_view', ('created_at',)),
+    ('ix_product_view_product_created', 'product_view', ('product_id', 'created_at', 'ip_address', 'sample_weight')),
+    ('ix_product_view_product_type_created', 'product_view',
+     ('product_id', 'view_type', 'created_at', 'page_number', 'sample_weight', 'dwell_ms')),
+    ('ix_visitor_session_bot_first_visit', 'visitor_session', ('is_bot', 'first_visit')),
+    ('ix_visitor_session_bot_last_visit', 'visitor_session', ('is_bot', 'last_visit')),
+    ('ix_product_category_id', 'product', ('category_id',)),
+]
+
+# Long, repeated strings moved into dictionary tables:
+# (table, string column, id column, dictionary table)
+DICTIONARY_TABLES = {'user_agent': 'TEXT', 'referrer': 'VARCHAR(500)'}
+# Dictionary keys are truncated like app.py's StringDictionary max_length, so
+# migrated and newly tracked values share one row
+DICTIONARY_MAX_LENGTH = {'referrer': 500}
+DICTIONARY_COLUMNS = [
+    ('page_view', 'user_agent', 'user_agent_id', 'user_agent'),
+    ('page_view', 'referrer', 'referrer_id', 'referrer'),
+    ('product_view', 'user_agent', 'user_agent_id', 'user_agent'),
+    ('visitor_session', 'user_agent', 'user_agent_id', 'user_agent'),
+]
+
+def table_columns(cursor, table):
+    cursor.execute(f"PRAGMA table_info({table});")
+    return [column[1] for column in cursor.fetchall()]
+
+def encode_dictionary_columns(conn, batch_size=1000):
+    """Move user agent and referrer strings into dictionary tables.
+
+    Rows are converted in batches, one transaction each, and the string is
+    cleared as its id is set, so an interrupted run resumes where it
+    stopped. The emptied string columns are dropped at the end when SQLite
+    supports it (3.35+).
+    """
+    cursor = conn.cursor()
+    cursor.execute("PRAGMA busy_timeout = 30000;")
+    for dictionary, value_type in DICTIONARY_TABLES.items():
+        cursor.execute(f"""
+            CREATE TABLE IF NOT EXISTS {dictionary} (
+                id INTEGER NOT NULL PRIMARY KEY,
+                value {value_type} NOT NULL UNIQUE
+            );
+        """)
+    conn.commit()
+    
+    converted_columns = []
+    for table, column, id_column, dictionary in DICTIONARY_COLUMNS:
+        columns = table_columns(cursor, table)
+        if column not in columns:
+            continue
+        if id_column not in columns:
+            print(f"➕ Adding column: {table}.{id_column}")
+            cursor.execute(f"ALTER TABLE {table} ADD COLUMN {id_column} INTEGER REFERENCES {dictionary} (id);")
+            conn.commit()
+        
+        max_length = DICTIONARY_MAX_LENGTH.get(dictionary)
+        key = (lambda value: value[:max_length]) if max_length else (lambda value: value)
+        converted = 0
+        while True:
+            cursor.execute(
+                f"SELECT id, {column} FROM {table} WHERE {column} IS NOT NULL ORDER BY id LIMIT ?;", (batch_size,)
+            )
+            rows = cursor.fetchall()
+            if not rows:
+                break
+            values = list({key(value) for _, value in rows if value})
+            cursor.executemany(f"INSERT OR IGNORE INTO {dictionary} (value) VALUES (?);", [(value,) for value in values])
+            ids = {}
+            if values:
+                cursor.execute(
+                    f"SELECT value, id FROM {dictionary} WHERE value IN ({', '.join('?' * len(values))});", values
+                )
+                ids = dict(cursor.fetchall())
+            cursor.executemany(
+                f"UPDATE {table} SET {id_column} = ?, {column} = NULL WHERE id = ?;",
+                [(ids.get(key(value)) if value else None, row_id) for row_id, value in rows]
+            )
+            conn.commit()
+            converted += len(rows)
+        if converted:
+            print(f"🔄 Encoded {converted} values of {table}.{column}")
+        converted_columns.append((table, column))
+    
+    encode_referrer_rollup(conn)
+    
+    if sqlite3.sqlite_version_info >= (3, 35, 0):
+        for table, column in converted_columns:
+            print(f"➖ Dropping column: {table}.{column}")
+            cursor.execute(f"ALTER TABLE {table} DROP COLUMN {column};")
+            conn.commit()
+        if converted_columns:
+            print("💡 Run VACUUM on the database to reclaim the freed space")
+
+def encode_referrer_rollup(conn):
+    """Re-key referrer_rollup from the referrer string to referrer_id"""
+    cursor = conn.cursor()
+    if 'referrer' not in table_columns(cursor, 'referrer_rollup'):
+        return
+    print("🔄 Re-keying referrer_rollup on referrer ids")
+    max_length = DICTIONARY_MAX_LENGTH['referrer']
+    cursor.execute(
+        "INSERT OR IGNORE INTO referrer (value) SELECT DISTINCT substr(referrer, 1, ?) FROM referrer_rollup WHERE referrer != '';",
+        (max_length,)
+    )
+    cursor.execute("""
+        CREATE TABLE referrer_rollup_new (
+            day DATE NOT NULL,
+            referrer_id INTEGER NOT NULL REFERENCES referrer (id),
+            views INTEGER NOT NULL,
+            PRIMARY KEY (day, referrer_id)
+        );
+    """)
+    cursor.execute("""
+        INSERT INTO referrer_rollup_new (day, referrer_id, views)
+        SELECT r.day, d.id, sum(r.views) FROM referrer_rollup r JOIN referrer d ON d.value = substr(r.referrer, 1, ?)
+        GROUP BY r.day, d.id;
+    """, (max_length,))
+    cursor.execute("DROP TABLE referrer_rollup;")
+    cursor.execute("ALTER TABLE referrer_rollup_new RENAME TO referrer_rollup;")
+    conn.commit()
+
+def load_upload_folder():
+    """UPLOAD.FOLDER from config.json, or the default"""
+    try:
+        with open('config.json', 'r') as f:
+            return json.load(f)['UPLOAD']['FOLDER']
+    except (OSError, KeyError, ValueError):
+        return 'static/uploads'
+
+def extract_qr_data_uris(conn, upload_folder):
+    """Move base64 QR code data URIs out of category/product rows into files.
+
+    Files are named after the hash of the PNG, matching save_qr_code in
+    app.py, and the rows keep only the filename.
+    """
+    qr_folder = os.path.join(upload_folder, 'qr')
+    cursor = conn.cursor()
+    for table in ('category', 'product'):
+        cursor.execute(f"SELECT id, qr_code FROM {table} WHERE qr_code LIKE 'data:image/png;base64,%';")
+        rows = cursor.fetchall()
+        for row_id, data_uri in rows:
+            png = base64.b64decode(data_uri.split(',', 1)[1])
+            filename = f"{hashlib.sha256(png).hexdigest()[:20]}.png"
+            path = os.path.join(qr_folder, filename)
+            if not os.path.exists(path):
+                os.makedirs(qr_folder, exist_ok=True)
+                with open(path, 'wb') as f:
+                    f.write(png)
+            cursor.execute(f"UPDATE {table} SET qr_code = ? WHERE id = ?;", (filename, row_id))
+        conn.commit()
+        if rows:
+            print(f"🔄 Extracted {len(rows)} {table} QR codes to {qr_folder}")
+        else:
+            print(f"✅ No inline {table} QR codes left")
+
+def index_columns(cursor, name):
+    cursor.execute(f"PRAGMA index_info({name});")
+    return tuple(column[2] for column in sorted(cursor.fetchall()))
+
+def create_indexes(conn):
+    """Build any missing indexes, one transaction per index.
+
+    Committing after each index keeps the write lock short, so a running
+    application can keep recording views between builds. An index whose
+    columns differ from INDEXES (built by an older version) is rebuilt.
+    """
+    cursor = conn.cursor()
+    cursor.execute("PRAGMA busy_timeout = 30000;")
+    cursor.execute("SELECT name FROM sqlite_master WHERE type='table';")
+    tables = {row[0] for row in cursor.fetchall()}
+    cursor.execute("SELECT name FROM sqlite_master WHERE type='index';")
+    existing = {row[0] for row in cursor.fetchall()}
+    
+    for name, table, columns in INDEXES:
+        if table not in tables:
+            print(f"⏭️  Skipping index {name}: table {table} does not exist yet")
+        elif name in existing and index_columns(cursor, name) == columns:
+            print(f"✅ Index already exists: {name}")
+        else:
+            if name in existing:
+                print(f"🔄 Rebuilding index with new columns: {name}")
+                cursor.execute(f"DROP INDEX {name};")
+            print(f"➕ Building index: {name} on {table}({', '.join(columns)})")
+            cursor.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({', '.join(columns)});")
+            conn.commit()
+    
+    # Refresh planner statistics so the new indexes are picked up
+    cursor.execute("ANALYZE;")
+    conn.commit()
+
 def migrate_database():
     """Add new columns to existing database"""
     db_path = 'instance/dd_sons.db'
@@ -31,7 +228,11 @@ def migrate_database():
         new_columns = [
             ('pdf_catalog', 'VARCHAR(200)'),
             ('pdf_pages', 'INTEGER DEFAULT 0'),
-            ('view_count', 'INTEGER DEFAULT 0')
+            ('view_count', 'INTEGER DEFAULT 0'),
+            ('processing_status', "VARCHAR(20) NOT NULL DEFAULT 'ready'"),
+            ('pdf_original', 'VARCHAR(200)'),
+            ('pdf_original_size', 'INTEGER'),
+            ('pdf_optimized_size', 'INTEGER')
         ]
         
         for column_name, column_type in new_columns:
@@ -60,7 +261,35 @@ def migrate_database():
         else:
             print("✅ ProductView table already exists")
         
+        # Columns added to analytics tables after they were first created
+        analytics_columns = [
+            ('traffic_rollup', 'bot_views', 'INTEGER NOT NULL DEFAULT 0'),
+            ('page_view', 'sample_weight', 'INTEGER NOT NULL DEFAULT 1'),
+            ('product_view', 'sample_weight', 'INTEGER NOT NULL DEFAULT 1'),
+            ('product_view', 'dwell_ms', 'INTEGER'),
+        ]
+        
+        for table, column_name, column_type in analytics_columns:
+            cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name=?;", (table,))
+            if not cursor.fetchone():
+                continue
+            cursor.execute(f"PRAGMA table_info({table});")
+            if column_name not in [column[1] for column in cursor.fetchall()]:
+                print(f"➕ Adding column: {table}.{column_name}")
+                cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column_name} {column_type};")
+            else:
+                print(f"✅ Column already exists: {table}.{column_name}")
+        
         conn.commit()
+        
+        print("🔄 Checking QR codes...")
+        extract_qr_data_uris(conn, load_upload_folder())
+        
+        print("🔄 Checking dictionary-encoded columns...")
+        encode_dictionary_columns(conn)
+        
+        print("🔄 Checking indexes...")
+        create_indexes(conn)
         conn.close()
         
         print("✅ Database migration completed successfully!")
@@ -0,0 +1,67 @@
+import json
+import os
+import sys
+import tempfile
+
+import pytest
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+WORKDIR = tempfile.mkdtemp(prefix='dd_sons_tests_')
+
+# app.py reads config.json and writes logs, uploads and the SQLite database
+# relative to the working directory, so run it from a scratch directory with
+# background writers and job workers switched off.
+with open(os.path.join(REPO_ROOT, 'config.json')) as f:
+    test_config = json.load(f)
+test_config['DATABASE'] = {'URI': f"sqlite:///{os.path.join(WORKDIR, 'test.db')}"}
+test_config['ANALYTICS']['ASYNC'] = False
+test_config['JOBS']['ASYNC'] = False
+with open(os.path.join(WORKDIR, 'config.json'), 'w') as f:
+    json.dump(test_config, f)
+
+os.chdir(WORKDIR)
+sys.path.insert(0, REPO_ROOT)
+
+
+@pytest.fixture(scope='session')
+def app_module():
+    import app as app_module
+    app_module.init_db()
+    return app_module
+
+
+@pytest.fixture
+def client(app_module):
+    return app_module.app.test_client()
+
+
+@pytest.fixture
+def admin_client(app_module, client):
+    with app_module.app.app_context():
+        admin = app_module.User.query.filter_by(role='admin').first()
+    with client.session_transaction() as session:
+        session['user_id'] = admin.id
+        session['username'] = admin.username
+        session['role'] = admin.role
+    return client
+
+
+@pytest.fixture
+def product(app_module):
+    """A product with a three page catalog, removed with its views afterwards"""
+    with app_module.app.app_context():
+        category = app_module.Category(name='Test category')
+        app_module.db.session.add(category)
+        app_module.db.session.flush()
+        product = app_module.Product(name='Test product', price=1.0, category_id=category.id,
+                                     pdf_catalog='catalog.pdf', pdf_pages=3)
+        app_module.db.session.add(product)
+        app_module.db.session.commit()
+        product_id, category_id = product.id, category.id
+    yield product_id
+    app_module.analytics_writer.flush()
+    with app_module.app.app_context():
+        app_module.ProductView.query.filter_by(product_id=product_id).delete()
+        app_module.db.session.delete(app_module.Product.query.get(product_id))
+        app_module.db.session.delete(app_module.Category.query.get(category_id))
+        app_module.db.session.commit()
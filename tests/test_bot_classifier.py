@@ -0,0 +1,65 @@
+import pytest
+
+# Real browser, in-app browser and webview User-Agents that must count as visitors
+HUMAN_USER_AGENTS = [
+    # Desktop browsers
+    'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) '
+    'Chrome/124.0.0.0 Safari/537.36',
+    'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/605.1.15 (KHTML, like Gecko) '
+    'Version/17.4.1 Safari/605.1.15',
+    'Mozilla/5.0 (X11; Linux x86_64; rv:125.0) Gecko/20100101 Firefox/125.0',
+    'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) '
+    'Chrome/124.0.0.0 Safari/537.36 Edg/124.0.2478.80',
+    'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) '
+    'Chrome/122.0.0.0 YaBrowser/24.4.0.0 Safari/537.36',
+    # Mobile browsers
+    'Mozilla/5.0 (iPhone; CPU iPhone OS 17_4 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) '
+    'Version/17.4 Mobile/15E148 Safari/604.1',
+    'Mozilla/5.0 (Linux; Android 14; Pixel 8) AppleWebKit/537.36 (KHTML, like Gecko) '
+    'Chrome/124.0.6367.82 Mobile Safari/537.36',
+    'Mozilla/5.0 (Linux; Android 10; Cubot KingKong 5 Pro) AppleWebKit/537.36 (KHTML, like Gecko) '
+    'Chrome/120.0.6099.144 Mobile Safari/537.36',
+    'Mozilla/5.0 (Linux; Android 13; SM-S911B) AppleWebKit/537.36 (KHTML, like Gecko) '
+    'Chrome/124.0.0.0 Mobile Safari/537.36 DuckDuckGo/5',
+    'Mozilla/5.0 (iPhone; CPU iPhone OS 17_4 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) '
+    'Version/17.4 Mobile/15E148 DuckDuckGo/7 Safari/605.1.15',
+    'Mozilla/5.0 (Linux; Android 12; M2101K6G) AppleWebKit/537.36 (KHTML, like Gecko) '
+    'Chrome/112.0.5615.136 YaApp_Android/23.41.1 YaSearchBrowser/23.41.1 BroPP/1.0 SA/3 Mobile Safari/537.36',
+    'Mozilla/5.0 (Linux; Android 11; V2027) AppleWebKit/537.36 (KHTML, like Gecko) '
+    'Chrome/87.0.4280.141 Mobile Safari/537.36 SogouSearch Android1.0 version3.0 AppVersion/11.6.5',
+    # In-app browsers and webviews
+    'Mozilla/5.0 (Linux; Android 13; SM-A536B Build/TP1A.220624.014; wv) AppleWebKit/537.36 '
+    '(KHTML, like Gecko) Version/4.0 Chrome/124.0.6367.82 Mobile Safari/537.36 WhatsApp/2.24.9.78',
+    'Mozilla/5.0 (iPhone; CPU iPhone OS 17_4 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) '
+    'Mobile/15E148 [FBAN/FBIOS;FBAV/460.0.0.38.111;FBBV/590325440;FBDV/iPhone15,2;FBMD/iPhone;'
+    'FBSN/iOS;FBSV/17.4;FBSS/3;FBID/phone;FBLC/en_US;FBOP/5]',
+    'Mozilla/5.0 (Linux; Android 14; Pixel 7 Build/AP1A.240405.002; wv) AppleWebKit/537.36 '
+    '(KHTML, like Gecko) Version/4.0 Chrome/124.0.6367.82 Mobile Safari/537.36 Instagram 329.0.0.41.93 '
+    'Android (34/14; 420dpi; 1080x2400; Google/google; Pixel 7; panther; panther; en_US; 590325440)',
+    'Mozilla/5.0 (Linux; Android 12; SM-G991B Build/SP1A.210812.016; wv) AppleWebKit/537.36 '
+    '(KHTML, like Gecko) Version/4.0 Chrome/124.0.6367.82 Mobile Safari/537.36 Line/14.6.1',
+]
+
+BOT_USER_AGENTS = [
+    ('Mozilla/5.0 (compatible; Googlebot/2.1; +http://www.google.com/bot.html)', 'googlebot'),
+    ('Mozilla/5.0 (compatible; bingbot/2.0; +http://www.bing.com/bingbot.htm)', 'bingbot'),
+    ('DuckDuckBot/1.1; (+http://duckduckgo.com/duckduckbot.html)', 'duckduckbot'),
+    ('facebookexternalhit/1.1 (+http://www.facebook.com/externalhit_uatext.php)', 'facebookexternalhit'),
+    ('WhatsApp/2.23.24.82 A', 'whatsapp/'),
+    ('Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) '
+     'HeadlessChrome/124.0.0.0 Safari/537.36', 'headlesschrome'),
+    ('curl/8.5.0', 'curl/'),
+    ('python-requests/2.31.0', 'python-requests'),
+    ('Java/17.0.10', 'java/'),
+    ('', 'empty'),
+]
+
+
+@pytest.mark.parametrize('user_agent', HUMAN_USER_AGENTS)
+def test_browsers_are_human(app_module, user_agent):
+    assert app_module.classify_user_agent(user_agent) is None
+
+
+@pytest.mark.parametrize('user_agent, signature', BOT_USER_AGENTS)
+def test_bots_report_their_signature(app_module, user_agent, signature):
+    assert app_module.classify_user_agent(user_agent) == signature
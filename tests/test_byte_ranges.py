@@ -0,0 +1,101 @@
+import pytest
+
+LENGTH = 1000
+CONTENT = bytes(range(256)) * 3 + bytes(range(232))
+ETAG = 'test-etag'
+
+
+@pytest.mark.parametrize('header, spans', [
+    ('bytes=0-99', [(0, 100)]),
+    ('bytes=900-', [(900, 1000)]),
+    ('bytes=990-2000', [(990, 1000)]),
+    ('bytes=-100', [(900, 1000)]),
+    ('bytes=-5000', [(0, 1000)]),
+    ('bytes=0-9,5-19,30-39', [(0, 20), (30, 40)]),
+    ('bytes=30-39,0-9,10-19', [(0, 20), (30, 40)]),
+    ('bytes=1000-', []),
+    ('bytes=-0', []),
+    ('bytes=2000-3000,1500-', []),
+])
+def test_parse_byte_ranges(app_module, header, spans):
+    assert app_module.parse_byte_ranges(header, LENGTH) == spans
+
+
+@pytest.mark.parametrize('header', [None, '', 'items=0-9', 'bytes=', 'bytes=9-0', 'bytes=a-9', 'bytes=-', 'bytes=0-9;'])
+def test_malformed_ranges_send_the_whole_file(app_module, header):
+    assert app_module.parse_byte_ranges(header, LENGTH) is None
+
+
+def test_too_many_ranges_send_the_whole_file(app_module):
+    ranges = [f'{n}-{n}' for n in range(0, 2 * app_module.MAX_BYTE_RANGES, 2)]
+    assert len(app_module.parse_byte_ranges('bytes=' + ','.join(ranges), LENGTH)) == app_module.MAX_BYTE_RANGES
+    assert app_module.parse_byte_ranges('bytes=' + ','.join(ranges + ['999-999']), LENGTH) is None
+
+
+@pytest.fixture
+def served(app_module, tmp_path):
+    path = tmp_path / 'catalog.pdf'
+    path.write_bytes(CONTENT)
+
+    def serve(**headers):
+        with app_module.app.test_request_context(headers=headers):
+            response = app_module.byte_range_response(str(path), 'application/pdf', ETAG)
+            return response, b''.join(response.response)
+    return serve
+
+
+def test_whole_file(served):
+    response, body = served()
+    assert response.status_code == 200
+    assert body == CONTENT
+    assert response.headers['Accept-Ranges'] == 'bytes'
+
+
+def test_suffix_range(served):
+    response, body = served(Range='bytes=-10')
+    assert response.status_code == 206
+    assert response.headers['Content-Range'] == f'bytes 990-999/{LENGTH}'
+    assert body == CONTENT[-10:]
+    assert response.content_length == 10
+
+
+def test_overlapping_ranges_are_coalesced(served):
+    response, body = served(Range='bytes=10-19,15-29')
+    assert response.status_code == 206
+    assert response.headers['Content-Range'] == f'bytes 10-29/{LENGTH}'
+    assert body == CONTENT[10:30]
+
+
+def test_multipart_ranges(served):
+    response, body = served(Range='bytes=0-9,100-109')
+    assert response.status_code == 206
+    assert response.mimetype == 'multipart/byteranges'
+    assert response.content_length == len(body)
+    assert f'Content-Range: bytes 0-9/{LENGTH}'.encode() in body
+    assert f'Content-Range: bytes 100-109/{LENGTH}'.encode() in body
+    assert CONTENT[100:110] in body
+
+
+def test_unsatisfiable_range(served):
+    response, body = served(Range=f'bytes={LENGTH}-')
+    assert response.status_code == 416
+    assert response.headers['Content-Range'] == f'bytes */{LENGTH}'
+    assert body == b''
+
+
+def test_if_range_mismatch_sends_the_whole_file(served):
+    response, body = served(Range='bytes=0-9', **{'If-Range': '"older-etag"'})
+    assert response.status_code == 200
+    assert body == CONTENT
+
+
+def test_if_range_match_sends_the_range(served):
+    response, body = served(Range='bytes=0-9', **{'If-Range': f'"{ETAG}"'})
+    assert response.status_code == 206
+    assert body == CONTENT[:10]
+
+
+def test_if_none_match(served):
+    response, body = served(**{'If-None-Match': f'"{ETAG}"'})
+    assert response.status_code == 304
+    assert body == b''
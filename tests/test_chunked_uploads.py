@@ -0,0 +1,102 @@
+import hashlib
+import io
+
+import pytest
+from PyPDF2 import PdfWriter
+
+
+def pdf_bytes():
+    writer = PdfWriter()
+    writer.add_blank_page(width=200, height=200)
+    buffer = io.BytesIO()
+    writer.write(buffer)
+    return buffer.getvalue()
+
+
+def start(client, content, **fields):
+    data = dict({'filename': 'catalog.pdf', 'size': len(content), 'sha256': hashlib.sha256(content).hexdigest()}, **fields)
+    response = client.post('/api/uploads', json=data)
+    assert response.status_code == 201, response.get_json()
+    return response.get_json()['upload_id']
+
+
+def put(client, upload_id, offset, chunk, **headers):
+    return client.put(f'/api/uploads/{upload_id}?offset={offset}', data=chunk, headers=headers)
+
+
+def test_requires_login(client):
+    assert client.post('/api/uploads', json={'filename': 'catalog.pdf', 'size': 10}).status_code == 302
+
+
+@pytest.mark.parametrize('fields', [{'filename': 'catalog.exe'}, {'size': 0}, {'size': True}, {'sha256': 'abc'}])
+def test_invalid_start(admin_client, fields):
+    data = dict({'filename': 'catalog.pdf', 'size': 10}, **fields)
+    assert admin_client.post('/api/uploads', json=data).status_code == 400
+
+
+def test_upload_and_complete(app_module, admin_client, product):
+    content = pdf_bytes()
+    upload_id = start(admin_client, content)
+    middle = len(content) // 2
+    assert put(admin_client, upload_id, 0, content[:middle]).get_json()['received'] == middle
+    assert admin_client.get(f'/api/uploads/{upload_id}').get_json()['received'] == middle
+    response = put(admin_client, upload_id, middle, content[middle:],
+                   **{'X-Chunk-SHA256': hashlib.sha256(content[middle:]).hexdigest()})
+    assert response.get_json()['received'] == len(content)
+
+    response = admin_client.post(f'/api/uploads/{upload_id}/complete', json={'product_id': product})
+    assert response.status_code == 200
+    assert response.get_json()['sha256'] == hashlib.sha256(content).hexdigest()
+    with app_module.app.app_context():
+        assert app_module.Product.query.get(product).pdf_catalog == response.get_json()['pdf_catalog']
+        assert app_module.db.session.get(app_module.ChunkedUpload, upload_id) is None
+
+
+def test_offset_conflict(admin_client):
+    content = b'%PDF-' + b'x' * 95
+    upload_id = start(admin_client, content)
+    assert put(admin_client, upload_id, 0, content[:50]).status_code == 200
+
+    # A retried chunk and a chunk past the received bytes both conflict
+    for offset in (0, 60):
+        response = put(admin_client, upload_id, offset, content[offset:offset + 10])
+        assert response.status_code == 409
+        assert response.get_json()['received'] == 50
+
+
+def test_chunk_checksum_mismatch(admin_client):
+    content = b'%PDF-' + b'x' * 95
+    upload_id = start(admin_client, content)
+    response = put(admin_client, upload_id, 0, content[:50], **{'X-Chunk-SHA256': '0' * 64})
+    assert response.status_code == 422
+    assert response.get_json()['received'] == 0
+    # The rejected chunk can be sent again
+    assert put(admin_client, upload_id, 0, content[:50]).get_json()['received'] == 50
+
+
+def test_chunk_past_the_declared_size(admin_client):
+    content = b'%PDF-' + b'x' * 95
+    upload_id = start(admin_client, content)
+    response = put(admin_client, upload_id, 0, content + b'extra')
+    assert response.status_code == 400
+    assert response.get_json()['received'] == 0
+
+
+def test_complete_before_all_bytes_arrived(admin_client, product):
+    content = b'%PDF-' + b'x' * 95
+    upload_id = start(admin_client, content)
+    put(admin_client, upload_id, 0, content[:50])
+    response = admin_client.post(f'/api/uploads/{upload_id}/complete', json={'product_id': product})
+    assert response.status_code == 409
+    assert response.get_json()['received'] == 50
+
+
+def test_file_checksum_mismatch(app_module, admin_client, product):
+    content = b'%PDF-' + b'x' * 95
+    upload_id = start(admin_client, content, sha256='0' * 64)
+    put(admin_client, upload_id, 0, content)
+    response = admin_client.post(f'/api/uploads/{upload_id}/complete', json={'product_id': product})
+    assert response.status_code == 422
+    with app_module.app.app_context():
+        assert app_module.db.session.get(app_module.ChunkedUpload, upload_id) is None
+        assert app_module.Product.query.get(product).pdf_catalog == 'catalog.pdf'
@@ -0,0 +1,49 @@
+import pytest
+
+
+def sketch_of(app_module, values):
+    sketch = app_module.HyperLogLog()
+    for value in values:
+        sketch.add(value)
+    return sketch
+
+
+def ips(start, stop):
+    return [f'10.{n >> 16 & 255}.{n >> 8 & 255}.{n & 255}' for n in range(start, stop)]
+
+
+def test_empty_sketch(app_module):
+    assert app_module.HyperLogLog().estimate() == 0
+
+
+@pytest.mark.parametrize('count', [1, 10, 100, 1000, 10000, 100000])
+def test_estimate_within_error_bounds(app_module, count):
+    # Standard error is about 2.3% at precision 11; allow four of them
+    estimate = sketch_of(app_module, ips(0, count)).estimate()
+    assert abs(estimate - count) <= max(0.092 * count, 1)
+
+
+def test_duplicates_are_not_counted(app_module):
+    sketch = sketch_of(app_module, ips(0, 500) * 20)
+    assert sketch.estimate() == sketch_of(app_module, ips(0, 500)).estimate()
+
+
+def test_merge_matches_the_union(app_module):
+    first = sketch_of(app_module, ips(0, 6000))
+    second = sketch_of(app_module, ips(4000, 10000))
+    union = sketch_of(app_module, ips(0, 10000))
+    assert first.merge(second).registers == union.registers
+    assert abs(first.estimate() - 10000) <= 920
+
+
+def test_merge_is_idempotent(app_module):
+    sketch = sketch_of(app_module, ips(0, 3000))
+    estimate = sketch.estimate()
+    assert sketch.merge(sketch_of(app_module, ips(0, 3000))).estimate() == estimate
+
+
+def test_round_trip(app_module):
+    sketch = sketch_of(app_module, ips(0, 2000))
+    restored = app_module.HyperLogLog.from_bytes(sketch.to_bytes())
+    assert restored.registers == sketch.registers
+    assert restored.estimate() == sketch.estimate()
@@ -0,0 +1,45 @@
+import pytest
+from flask import Response
+
+ran = []
+
+
+@pytest.fixture(scope='module')
+def jobs(app_module):
+    app_module.jobs.handlers['test_record'] = (lambda value: ran.append(value), None)
+    yield app_module.jobs
+    del app_module.jobs.handlers['test_record']
+
+
+def stored(app_module, value):
+    return app_module.Job.query.filter_by(kind='test_record', payload=f'{{"value": "{value}"}}').count()
+
+
+def test_enqueue_does_not_commit(app_module, jobs):
+    with app_module.app.test_request_context():
+        jobs.enqueue('test_record', value='rolled back')
+        app_module.db.session.rollback()
+        app_module.app.process_response(Response())
+        assert not stored(app_module, 'rolled back')
+    assert 'rolled back' not in ran
+
+
+def test_job_runs_after_the_view_commits(app_module, jobs):
+    with app_module.app.test_request_context():
+        jobs.enqueue('test_record', value='committed')
+        assert 'committed' not in ran
+        app_module.db.session.commit()
+        app_module.app.process_response(Response())
+        assert ran.count('committed') == 1
+        assert app_module.Job.query.filter_by(kind='test_record', status='done').count() == 1
+
+
+def test_add_category_commits_its_job(app_module, admin_client):
+    response = admin_client.post('/admin/categories/add', data={'name': 'Job category', 'description': ''})
+    assert response.status_code == 302
+    with app_module.app.app_context():
+        category = app_module.Category.query.filter_by(name='Job category').one()
+        job = app_module.Job.query.filter_by(kind='process_category').order_by(app_module.Job.id.desc()).first()
+        assert f'"category_id": {category.id}' in job.payload
+        assert job.status == 'done'
+        assert category.qr_code
@@ -0,0 +1,42 @@
+import json
+
+
+def send(client, product_id, views):
+    return client.post(f'/product/{product_id}/pdf/views', data=json.dumps({'views': views}),
+                       headers={'User-Agent': 'Mozilla/5.0 (X11; Linux x86_64; rv:125.0) Gecko/20100101 Firefox/125.0'})
+
+
+def recorded(app_module, product_id):
+    app_module.analytics_writer.flush()
+    with app_module.app.app_context():
+        product = app_module.Product.query.get(product_id)
+        views = app_module.ProductView.query.filter_by(product_id=product_id, view_type='pdf_page').all()
+        return product.view_count, sorted((view.page_number, view.dwell_ms) for view in views)
+
+
+def test_one_event_per_page(app_module, client, product):
+    response = send(client, product, [{'page': 1, 'dwell_ms': 1000}, {'page': 2, 'dwell_ms': 500},
+                                      {'page': 1, 'dwell_ms': 2000}, {'page': 2}])
+    assert response.status_code == 204
+    view_count, views = recorded(app_module, product)
+    assert views == [(1, 3000), (2, 500)]
+    assert not view_count
+
+
+def test_pages_outside_the_catalog_are_dropped(app_module, client, product):
+    views = [{'page': page, 'dwell_ms': 10} for page in range(0, 50)]
+    assert send(client, product, views).status_code == 204
+    _, views = recorded(app_module, product)
+    assert [page for page, _ in views] == [1, 2, 3]
+
+
+def test_booleans_are_rejected(app_module, client, product):
+    assert send(client, product, [{'page': True, 'dwell_ms': 10}, {'page': 2, 'dwell_ms': True}]).status_code == 204
+    _, views = recorded(app_module, product)
+    assert views == [(2, None)]
+
+
+def test_dwell_is_clamped(app_module, client, product):
+    assert send(client, product, [{'page': 1, 'dwell_ms': -5}, {'page': 2, 'dwell_ms': 10 ** 12}]).status_code == 204
+    _, views = recorded(app_module, product)
+    assert views == [(1, 0), (2, app_module.MAX_DWELL_MS)]
@@ -0,0 +1,77 @@
+import threading
+import time
+
+import pytest
+
+
+def test_single_flight(app_module):
+    cache = app_module.ResultCache(ttl=60)
+    calls = []
+    started = threading.Event()
+    release = threading.Event()
+
+    def compute():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return 'result'
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get_or_compute('key', compute))) for _ in range(8)]
+    threads[0].start()
+    started.wait(5)
+    for thread in threads[1:]:
+        thread.start()
+    time.sleep(0.05)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert len(calls) == 1
+    assert results == ['result'] * 8
+    assert cache.snapshot()['misses'] == 1
+
+
+def test_entries_expire_after_ttl(app_module):
+    cache = app_module.ResultCache(ttl=0.05)
+    values = iter(['first', 'second'])
+    assert cache.get_or_compute('key', lambda: next(values)) == 'first'
+    assert cache.get_or_compute('key', lambda: next(values)) == 'first'
+    time.sleep(0.1)
+    assert cache.get_or_compute('key', lambda: next(values)) == 'second'
+    assert cache.snapshot()['hits'] == 1
+    assert cache.snapshot()['misses'] == 2
+
+
+def test_failed_compute_is_not_cached(app_module):
+    cache = app_module.ResultCache(ttl=60)
+
+    def fail():
+        raise RuntimeError('query failed')
+
+    with pytest.raises(RuntimeError):
+        cache.get_or_compute('key', fail)
+    assert cache.get_or_compute('key', lambda: 'recovered') == 'recovered'
+
+
+def test_least_recently_stored_entries_are_evicted(app_module):
+    cache = app_module.ResultCache(ttl=60, max_entries=2)
+    for key in ('a', 'b', 'c'):
+        cache.get_or_compute(key, lambda: key)
+    assert cache.snapshot()['entries'] == 2
+    assert set(cache._key_locks) == {'b', 'c'}
+    assert cache.get_or_compute('a', lambda: 'recomputed') == 'recomputed'
+
+
+def test_invalidate_clears_entries_and_key_locks(app_module):
+    cache = app_module.ResultCache(ttl=60)
+    cache.get_or_compute('key', lambda: 'stale')
+    cache.invalidate()
+    assert cache.snapshot()['entries'] == 0
+    assert not cache._key_locks
+    assert cache.get_or_compute('key', lambda: 'fresh') == 'fresh'
+
+
+@pytest.mark.parametrize('days, clamped', [(None, 30), (0, 1), (-5, 1), (7, 7), (730, 730), (10 ** 9, 730)])
+def test_analytics_days_are_clamped(app_module, days, clamped):
+    assert app_module.analytics_days(days) == clamped
@@ -0,0 +1,62 @@
+import random
+from types import SimpleNamespace
+
+import pytest
+
+
+class FakeWriter:
+    def __init__(self, maxsize=1000, depth=0, write_seconds=0.0):
+        self.queue = SimpleNamespace(maxsize=maxsize)
+        self.write_seconds = write_seconds
+        self._depth = depth
+
+    def depth(self):
+        return self._depth
+
+
+def controller(app_module, writer=None, **settings):
+    return app_module.SamplingController(writer or FakeWriter(), settings)
+
+
+def test_everything_is_recorded_at_rate_one(app_module):
+    sampler = controller(app_module, SAMPLE_RATE=1)
+    assert {sampler.sample() for _ in range(1000)} == {1}
+
+
+def test_fixed_rate_weights_are_unbiased(app_module):
+    random.seed(11)
+    sampler = controller(app_module, SAMPLE_RATE=8, ADAPTIVE_SAMPLING=False)
+    weights = [sampler.sample() for _ in range(80000)]
+    assert set(weights) == {0, 8}
+    assert sum(weights) == pytest.approx(80000, rel=0.05)
+
+
+@pytest.mark.parametrize('depth, rate', [(0, 1), (500, 1), (510, 2), (600, 2), (750, 8), (880, 16), (1000, 32)])
+def test_rate_follows_queue_fill(app_module, depth, rate):
+    sampler = controller(app_module, FakeWriter(depth=depth), SAMPLE_RATE=1, MAX_SAMPLE_RATE=64)
+    assert sampler.current_rate() == rate
+
+
+@pytest.mark.parametrize('write_seconds, rate', [(0.1, 2), (0.5, 2), (0.6, 4), (1.2, 6), (10, 16)])
+def test_rate_follows_write_latency(app_module, write_seconds, rate):
+    sampler = controller(app_module, FakeWriter(write_seconds=write_seconds), SAMPLE_RATE=2,
+                         MAX_SAMPLE_RATE=16, TARGET_WRITE_SECONDS=0.5)
+    assert sampler.current_rate() == rate
+
+
+def test_unbounded_queue_ignores_fill(app_module):
+    sampler = controller(app_module, FakeWriter(maxsize=0, depth=10 ** 6), SAMPLE_RATE=1)
+    assert sampler.current_rate() == 1
+
+
+def test_adaptive_sampling_off_keeps_the_base_rate(app_module):
+    sampler = controller(app_module, FakeWriter(depth=1000, write_seconds=10), SAMPLE_RATE=4, ADAPTIVE_SAMPLING=False)
+    assert sampler.current_rate() == 4
+
+
+def test_adaptive_weights_match_the_rate(app_module):
+    random.seed(5)
+    sampler = controller(app_module, FakeWriter(depth=750), SAMPLE_RATE=1)
+    weights = [sampler.sample() for _ in range(40000)]
+    assert set(weights) == {0, 8}
+    assert sum(weights) == pytest.approx(40000, rel=0.05)
@@ -0,0 +1,38 @@
+from datetime import datetime
+
+BROWSER = 'Mozilla/5.0 (X11; Linux x86_64; rv:125.0) Gecko/20100101 Firefox/125.0'
+
+
+def test_persisted_only_after_commit(app_module):
+    tracker = app_module.SessionTracker()
+    tracker.touch('rolled-back-session', '10.0.0.1', BROWSER, datetime.utcnow())
+    with app_module.app.app_context():
+        drained = tracker.drain()
+        tracker.apply(drained)
+        app_module.db.session.rollback()
+        tracker.restore(drained)
+        assert not tracker._sessions['rolled-back-session']['persisted']
+
+        drained = tracker.drain()
+        tracker.apply(drained)
+        app_module.db.session.commit()
+        tracker.committed(drained)
+        assert tracker._sessions['rolled-back-session']['persisted']
+        assert app_module.VisitorSession.query.filter_by(session_id='rolled-back-session').one().page_views == 1
+
+
+def test_is_bot_is_classified(app_module):
+    tracker = app_module.SessionTracker()
+    now = datetime.utcnow()
+    tracker.touch('browser-session', '10.0.0.2', BROWSER, now)
+    tracker.touch('client-session', '10.0.0.3', 'python-requests/2.31.0', now)
+    with app_module.app.app_context():
+        drained = tracker.drain()
+        tracker.apply(drained)
+        app_module.db.session.commit()
+        sessions = app_module.VisitorSession.query.filter(
+            app_module.VisitorSession.session_id.in_(['browser-session', 'client-session'])
+        )
+        assert {session.session_id: session.is_bot for session in sessions} == {
+            'browser-session': False, 'client-session': True
+        }